@@ -1,4 +1,5 @@
-from accounts.models import OrganizationProfile, User
+from accounts.metering import reset_usage
+from accounts.models import OrganizationProfile, User, UserTier
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.db.models import Sum
@@ -148,9 +149,11 @@ class UserAdmin(admin.ModelAdmin):
     actions = ["reset_usage_counts"]
 
     def reset_usage_counts(self, request, queryset):
+        user_ids = list(queryset.values_list("id", flat=True))
         updated = queryset.update(
             download_count=0, creation_count=0, customization_count=0
         )
+        reset_usage(user_ids)
         self.message_user(request, f"{updated} users had their usage counts reset.")
 
     reset_usage_counts.short_description = "Reset usage counts for selected users"
@@ -163,5 +166,11 @@ class OrganizationProfileAdmin(admin.ModelAdmin):
     raw_id_fields = ["user"]
 
 
+class UserTierAdmin(admin.ModelAdmin):
+    list_display = ["name", "download_limit", "creation_limit", "customization_limit"]
+    search_fields = ["name"]
+
+
 admin.site.register(User, UserAdmin)
 admin.site.register(OrganizationProfile, OrganizationProfileAdmin)
+admin.site.register(UserTier, UserTierAdmin)
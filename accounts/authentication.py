@@ -0,0 +1,181 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+SNAPSHOT_KEY = "auth:snapshot:{jti}"
+REVOKED_KEY = "auth:revoked:{jti}"
+USER_VERSION_KEY = "auth:user-version:{user_id}"
+
+SNAPSHOT_FIELDS = (
+    "id",
+    "email",
+    "first_name",
+    "last_name",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+    "email_verified",
+    "tier_id",
+)
+
+
+class UserSnapshot:
+    """
+    Stand-in for the authenticated user built from cached fields.
+
+    Reading anything outside the snapshot loads the full User once, and
+    attribute writes go through to it, so views can still save the user.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, data):
+        self.__dict__["_data"] = data
+        self.__dict__["_instance"] = None
+
+    @property
+    def pk(self):
+        return self._data["id"]
+
+    @property
+    def instance(self):
+        if self._instance is None:
+            self.__dict__["_instance"] = get_user_model().objects.get(pk=self.pk)
+        return self._instance
+
+    def __getattr__(self, name):
+        # Only reached for the snapshot's own slots before they are set, e.g.
+        # while it is copied; model internals like _meta come from the User
+        if name in ("_data", "_instance"):
+            raise AttributeError(name)
+        if name in self._data:
+            return self._data[name]
+        return getattr(self.instance, name)
+
+    def __setattr__(self, name, value):
+        if name in self._data:
+            self._data[name] = value
+        setattr(self.instance, name, value)
+
+    def __eq__(self, other):
+        return getattr(other, "pk", None) == self.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return f"{self.email}"
+
+    def get_full_name(self):
+        return f"{self.first_name or ''} {self.last_name or ''}".strip()
+
+
+def invalidate_user(user_id):
+    """
+    Drop every cached snapshot of a user, e.g. after their tier changes.
+    """
+    key = USER_VERSION_KEY.format(user_id=user_id)
+    cache.add(key, 0, timeout=None)
+    cache.incr(key)
+
+
+def revoke_token(token):
+    """
+    Reject an access token for the rest of its lifetime, e.g. on logout.
+    """
+    jti = token[api_settings.JTI_CLAIM]
+    remaining = max(int(token["exp"] - time.time()), 1)
+    cache.set(REVOKED_KEY.format(jti=jti), True, timeout=remaining)
+    cache.delete(SNAPSHOT_KEY.format(jti=jti))
+
+
+def load_snapshot(user_id):
+    return (
+        get_user_model()
+        .objects.filter(id=user_id, is_active=True)
+        .values(*SNAPSHOT_FIELDS)
+        .first()
+    )
+
+
+def authenticate_token(raw_token):
+    """
+    Verify an access token once and return (UserSnapshot, token).
+
+    The snapshot is cached per token jti, so repeat requests and websocket
+    reconnects with the same token never reach the database.
+    """
+    try:
+        token = AccessToken(raw_token)
+    except TokenError as e:
+        raise InvalidToken(str(e))
+
+    jti = token[api_settings.JTI_CLAIM]
+    user_id = token[api_settings.USER_ID_CLAIM]
+    snapshot_key = SNAPSHOT_KEY.format(jti=jti)
+    revoked_key = REVOKED_KEY.format(jti=jti)
+    version_key = USER_VERSION_KEY.format(user_id=user_id)
+
+    cached = cache.get_many([snapshot_key, revoked_key, version_key])
+    if cached.get(revoked_key):
+        raise InvalidToken("Token has been revoked")
+
+    version = cached.get(version_key, 0)
+    snapshot = cached.get(snapshot_key)
+    if snapshot is None or snapshot["version"] != version:
+        data = load_snapshot(user_id)
+        if data is None:
+            raise InvalidToken("User not found")
+        snapshot = {"version": version, "user": data}
+        ttl = min(settings.AUTH_SNAPSHOT_TTL, int(token["exp"] - time.time()))
+        if ttl > 0:
+            cache.set(snapshot_key, snapshot, timeout=ttl)
+
+    return UserSnapshot(dict(snapshot["user"])), token
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    DRF authentication backed by the same cached snapshots as the websocket
+    middleware.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        return authenticate_token(raw_token)
+
+
+async def get_request_user(request, session=True):
+    """
+    Resolve the user of a plain async Django view, from a Bearer token when
+    one is sent and from the session otherwise. Raises InvalidToken.
+
+    Pass session=False for CSRF exempt views, so a forged cross-site request
+    can't act as the logged in user.
+    """
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    if header is not None:
+        raw_token = authentication.get_raw_token(header)
+        if raw_token is not None:
+            user, _ = await sync_to_async(authenticate_token)(raw_token)
+            return user
+    if not session:
+        return AnonymousUser()
+    return await request.auser()
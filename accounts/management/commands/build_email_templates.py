@@ -0,0 +1,30 @@
+from pathlib import Path
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from helpers.email_templates import inline_css
+
+TEMPLATE_DIR = Path(__file__).resolve().parents[2] / "templates" / "emails"
+SOURCE_DIR = TEMPLATE_DIR / "src"
+BUILD_DIR = TEMPLATE_DIR / "built"
+
+
+class Command(BaseCommand):
+    help = "Builds the email templates, inlining the CSS of the HTML parts"
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        count = 0
+        for source in sorted(SOURCE_DIR.rglob("*")):
+            if not source.is_file():
+                continue
+
+            content = source.read_text()
+            if source.suffix == ".html":
+                content = inline_css(content)
+
+            target = BUILD_DIR / source.relative_to(SOURCE_DIR)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(content)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Built {count} email templates"))
@@ -0,0 +1,209 @@
+from accounts.models import User, UserTier
+from django.core.cache import cache
+from django.db.models import F
+from pascraper.config.redis_client import get_redis
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+METERED_ACTIONS = ("download", "creation", "customization")
+COUNT_FIELDS = [f"{action}_count" for action in METERED_ACTIONS]
+LIMIT_FIELDS = [f"{action}_limit" for action in METERED_ACTIONS]
+
+# Usage not flushed to the database yet, per user
+PENDING_KEY = "usage:pending:{user_id}"
+# Copy of the flushed counts, so limit checks don't read the database
+BASE_KEY = "usage:base:{user_id}"
+BASE_TTL = 60 * 60 * 24
+# Users with pending usage
+DIRTY_KEY = "usage:dirty"
+
+TIER_KEY = "usage:tier:{tier_id}"
+TIER_TTL = 60 * 60
+
+# Cached needs_payment answer per user, dropped when their usage reaches a
+# limit or their account changes. Tier edits reach it within the TTL.
+ENTITLEMENT_KEY = "usage:entitlement:{user_id}"
+ENTITLEMENT_TTL = 60
+
+FLUSH_BATCH_SIZE = 500
+
+
+class UsageLimitExceeded(APIException):
+    status_code = status.HTTP_402_PAYMENT_REQUIRED
+    default_detail = "Usage limit reached, please upgrade your plan."
+    default_code = "usage_limit_exceeded"
+
+
+def get_tier_limits(tier_id):
+    """
+    Return {action: limit} for a tier, cached until the tier changes.
+    """
+    if tier_id is None:
+        return None
+
+    key = TIER_KEY.format(tier_id=tier_id)
+    limits = cache.get(key)
+    if limits is None:
+        limits = UserTier.objects.filter(id=tier_id).values(*LIMIT_FIELDS).first()
+        limits = limits or {}
+        cache.set(key, limits, timeout=TIER_TTL)
+    if not limits:
+        return None
+    return {action: limits[f"{action}_limit"] for action in METERED_ACTIONS}
+
+
+def invalidate_tier(tier_id):
+    cache.delete(TIER_KEY.format(tier_id=tier_id))
+
+
+def load_base_usage(user_id):
+    counts = User.objects.filter(id=user_id).values(*COUNT_FIELDS).first() or {}
+    base = {action: counts.get(f"{action}_count", 0) for action in METERED_ACTIONS}
+
+    base_key = BASE_KEY.format(user_id=user_id)
+    pipeline = get_redis().pipeline()
+    pipeline.hset(base_key, mapping=base)
+    pipeline.expire(base_key, BASE_TTL)
+    pipeline.execute()
+    return base
+
+
+def combine_usage(base, pending):
+    if not base:
+        return None
+    return {
+        action: int(base.get(action, 0)) + int(pending.get(action, 0))
+        for action in METERED_ACTIONS
+    }
+
+
+def get_usage(user_id):
+    """
+    Return {action: count} including usage that hasn't been flushed yet.
+    """
+    pipeline = get_redis().pipeline(transaction=False)
+    pipeline.hgetall(BASE_KEY.format(user_id=user_id))
+    pipeline.hgetall(PENDING_KEY.format(user_id=user_id))
+    base, pending = pipeline.execute()
+    return combine_usage(base or load_base_usage(user_id), pending)
+
+
+def needs_payment(user):
+    """
+    Whether a user reached any limit of their tier, without a database read
+    once their tier and usage are cached.
+    """
+    if user.is_staff or user.is_superuser:
+        return False
+    limits = get_tier_limits(user.tier_id)
+    if not limits:
+        return False
+    usage = get_usage(user.pk)
+    return any(usage[action] >= limit for action, limit in limits.items())
+
+
+def invalidate_entitlement(user_id):
+    cache.delete(ENTITLEMENT_KEY.format(user_id=user_id))
+
+
+def get_entitlement(user):
+    """
+    Cached needs_payment(user), so per-request checks cost one cache read.
+    """
+    key = ENTITLEMENT_KEY.format(user_id=user.pk)
+    entitlement = cache.get(key)
+    if entitlement is None:
+        entitlement = {"needs_payment": needs_payment(user)}
+        cache.set(key, entitlement, timeout=ENTITLEMENT_TTL)
+    return entitlement
+
+
+def record_usage(user, action, amount=1):
+    """
+    Count a metered action, raising UsageLimitExceeded if it goes over the
+    user's tier limit. The count lives in Redis until flush_usage runs.
+    """
+    if action not in METERED_ACTIONS:
+        raise ValueError(f"Unknown metered action: {action}")
+
+    pending_key = PENDING_KEY.format(user_id=user.pk)
+    redis = get_redis()
+    pipeline = redis.pipeline()
+    pipeline.hincrby(pending_key, action, amount)
+    pipeline.sadd(DIRTY_KEY, user.pk)
+    pipeline.hget(BASE_KEY.format(user_id=user.pk), action)
+    pending, _, base = pipeline.execute()
+
+    if user.is_staff or user.is_superuser:
+        return
+
+    limits = get_tier_limits(user.tier_id)
+    if not limits:
+        return
+
+    if base is None:
+        base = load_base_usage(user.pk)[action]
+    usage = int(base) + pending
+    if usage >= limits[action]:
+        invalidate_entitlement(user.pk)
+    if usage > limits[action]:
+        redis.hincrby(pending_key, action, -amount)
+        raise UsageLimitExceeded()
+
+
+def reset_usage(user_ids):
+    """
+    Drop the cached and pending usage of users whose counts were reset.
+    """
+    pipeline = get_redis().pipeline()
+    for user_id in user_ids:
+        pipeline.delete(BASE_KEY.format(user_id=user_id))
+        pipeline.delete(PENDING_KEY.format(user_id=user_id))
+    pipeline.execute()
+    cache.delete_many([ENTITLEMENT_KEY.format(user_id=user_id) for user_id in user_ids])
+
+
+def flush_usage(batch_size=FLUSH_BATCH_SIZE):
+    """
+    Add the pending usage of every dirty user to their stored counts, one
+    bulk UPDATE per batch of users. Returns the number of users flushed.
+    """
+    redis = get_redis()
+    flushed = 0
+
+    while True:
+        user_ids = redis.spop(DIRTY_KEY, batch_size)
+        if not user_ids:
+            return flushed
+
+        try:
+            pipeline = redis.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipeline.hgetall(PENDING_KEY.format(user_id=user_id))
+            pending_usage = dict(zip(user_ids, pipeline.execute()))
+
+            users = []
+            for user_id, pending in pending_usage.items():
+                if not any(int(count) for count in pending.values()):
+                    continue
+                user = User(id=int(user_id))
+                for action in METERED_ACTIONS:
+                    field = f"{action}_count"
+                    setattr(user, field, F(field) + int(pending.get(action, 0)))
+                users.append(user)
+            User.objects.bulk_update(users, COUNT_FIELDS)
+        except Exception:
+            # Keep the users dirty so the next flush retries them
+            redis.sadd(DIRTY_KEY, *user_ids)
+            raise
+
+        # Subtract what was flushed rather than deleting it, so usage recorded
+        # during the flush is kept for the next one
+        pipeline = redis.pipeline()
+        for user_id, pending in pending_usage.items():
+            pending_key = PENDING_KEY.format(user_id=user_id)
+            for action, count in pending.items():
+                pipeline.hincrby(pending_key, action, -int(count))
+            pipeline.delete(BASE_KEY.format(user_id=user_id))
+        pipeline.execute()
+        flushed += len(users)
@@ -1,27 +1,110 @@
+from urllib.parse import urlparse
+
+from accounts.authentication import CachedJWTAuthentication
+from accounts.metering import UsageLimitExceeded, get_entitlement
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
 from django.shortcuts import redirect
-from django.urls import reverse
+from django.urls import NoReverseMatch, reverse
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+# URL names that stay reachable when payment is needed
+ALLOWED_URL_NAMES = ["initiate_payment", "user_payment_status"]
+
+EXEMPT_PATHS = ["/ws/scraper/"]
+
+
+def get_path_prefix(url):
+    if not url:
+        return None
+    path = urlparse(url).path
+    return path if path.startswith("/") else f"/{path}"
 
 
 class PaymentMiddleware:
+    """
+    Send users who reached their tier limits to the payment page.
+
+    Both session users and API clients sending a Bearer token are checked;
+    DRF only authenticates the latter inside the view, so the token is
+    resolved here from the same cached snapshot. The allowlist is resolved
+    once when the middleware is loaded, and the per-user check reads a
+    cached entitlement instead of the user's tier and counts.
+    """
+
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.token_authentication = CachedJWTAuthentication()
+        self.allowed_paths = self.get_allowed_paths()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def get_allowed_paths(self):
+        paths = list(EXEMPT_PATHS)
+        for prefix in (settings.STATIC_URL, settings.MEDIA_URL):
+            prefix = get_path_prefix(prefix)
+            if prefix and prefix != "/":
+                paths.append(prefix)
+        for name in ALLOWED_URL_NAMES:
+            try:
+                paths.append(reverse(name))
+            except NoReverseMatch:
+                continue
+        return tuple(paths)
+
+    def is_exempt(self, request):
+        return request.path.startswith(self.allowed_paths)
+
+    def get_user(self, request):
+        """
+        Return (user, whether it came from a Bearer token).
+        """
+        try:
+            authenticated = self.token_authentication.authenticate(request)
+        except InvalidToken:
+            # Left for the view to reject
+            return AnonymousUser(), True
+        if authenticated:
+            return authenticated[0], True
+        return request.user, False
+
+    def needs_payment(self, user):
+        if not user.is_authenticated or user.is_staff or user.is_superuser:
+            return False
+        return get_entitlement(user)["needs_payment"]
+
+    def payment_required_response(self, api=False):
+        if not api:
+            try:
+                return redirect("initiate_payment")
+            except NoReverseMatch:
+                pass
+        return JsonResponse(
+            {"detail": str(UsageLimitExceeded.default_detail)},
+            status=UsageLimitExceeded.status_code,
+        )
+
+    def check(self, request):
+        """
+        Return the payment required response for a request, or None.
+        """
+        if self.is_exempt(request):
+            return None
+        user, api = self.get_user(request)
+        if self.needs_payment(user):
+            return self.payment_required_response(api)
+        return None
 
     def __call__(self, request):
-        if request.user.is_authenticated:
-            # Check if the user is an admin or superuser
-            if request.user.is_staff or request.user.is_superuser:
-                return self.get_response(request)
-
-            # Check if the user has a tier and if they've exceeded any limits
-            if request.user.tier and request.user.needs_payment():
-                # List of URLs that should be accessible even if payment is needed
-                allowed_paths = [
-                    reverse('initiate_payment'),
-                    reverse('user_payment_status'),
-                    # Add any other paths that should be accessible
-                ]
-
-                if not any(request.path.startswith(path) for path in allowed_paths):
-                    return redirect('initiate_payment')
-
-        return self.get_response(request)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.check(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        response = await sync_to_async(self.check)(request)
+        return response or await self.get_response(request)
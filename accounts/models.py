@@ -39,6 +39,18 @@ class UserManager(BaseUserManager):
         return self._create_user(email, password, **extra_fields)
 
 
+class UserTier(models.Model):
+    FREE = "free"
+
+    name = models.CharField(max_length=50, unique=True)
+    download_limit = models.PositiveIntegerField(default=0)
+    creation_limit = models.PositiveIntegerField(default=0)
+    customization_limit = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
 class User(AbstractUser, TrackingModel):
     AUTH_PROVIDERS = (
         ("email", "Email"),
@@ -56,6 +68,9 @@ class User(AbstractUser, TrackingModel):
         max_length=1, choices=GENDER_CHOICES, blank=True, null=True
     )
     date_of_birth = models.DateField(null=True, blank=True)
+    auth_provider = models.CharField(
+        max_length=20, choices=AUTH_PROVIDERS, default="email"
+    )
     profile_picture = models.ImageField(
         upload_to="profile_pics/", null=True, blank=True
     )
@@ -67,6 +82,15 @@ class User(AbstractUser, TrackingModel):
         help_text="Designates whether this users email is verified.",
     )
 
+    tier = models.ForeignKey(
+        UserTier, on_delete=models.SET_NULL, null=True, blank=True, related_name="users"
+    )
+    stripe_customer_id = models.CharField(max_length=255, null=True, blank=True)
+    # Flushed from the Redis counters in accounts.metering
+    download_count = models.PositiveIntegerField(default=0)
+    creation_count = models.PositiveIntegerField(default=0)
+    customization_count = models.PositiveIntegerField(default=0)
+
     objects = UserManager()
 
     USERNAME_FIELD = "email"
@@ -75,6 +99,23 @@ class User(AbstractUser, TrackingModel):
     def __str__(self):
         return "{}".format(self.email)
 
+    @property
+    def total_usage_count(self):
+        return self.download_count + self.creation_count + self.customization_count
+
+    def needs_payment(self):
+        """
+        Whether the stored counts reached a tier limit. Request handling uses
+        accounts.metering instead, which also sees the unflushed usage.
+        """
+        if not self.tier:
+            return False
+        return (
+            self.download_count >= self.tier.download_limit
+            or self.creation_count >= self.tier.creation_limit
+            or self.customization_count >= self.tier.customization_limit
+        )
+
     def save(self, *args, **kwargs):
         if not self.pk:
             self.last_login = timezone.now()
@@ -0,0 +1,26 @@
+from accounts.authentication import invalidate_user
+from accounts.metering import invalidate_entitlement, invalidate_tier
+from accounts.models import UserTier
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_snapshots(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+    invalidate_entitlement(instance.pk)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def invalidate_blacklisted_user_snapshots(sender, instance, created, **kwargs):
+    if created and instance.token.user_id:
+        invalidate_user(instance.token.user_id)
+
+
+@receiver(post_save, sender=UserTier)
+@receiver(post_delete, sender=UserTier)
+def invalidate_tier_limits(sender, instance, **kwargs):
+    invalidate_tier(instance.pk)
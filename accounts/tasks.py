@@ -0,0 +1,78 @@
+import requests
+from accounts.metering import flush_usage
+from celery import shared_task
+from helpers.email_utils import (
+    MAILGUN_BATCH_SIZE,
+    send_batch_email,
+    send_email,
+    send_verification_email,
+)
+from pascraper.config.logging_config import configure_logger
+
+logger = configure_logger(__name__)
+
+EMAIL_RETRY_OPTIONS = {
+    "autoretry_for": (requests.RequestException,),
+    "retry_backoff": True,
+    "retry_backoff_max": 600,
+    "retry_jitter": True,
+    "max_retries": 5,
+}
+
+
+def check_response(response):
+    """
+    Retry on throttling and server errors, give up on other rejections.
+    """
+    if response.status_code == 429 or response.status_code >= 500:
+        response.raise_for_status()
+    if response.status_code >= 400:
+        logger.error(
+            f"Mailgun rejected message: {response.status_code} {response.text}"
+        )
+
+
+@shared_task(**EMAIL_RETRY_OPTIONS)
+def send_verification_email_task(to_email, verification_link):
+    """
+    Send the verification email outside of the registration request.
+    """
+    check_response(send_verification_email(to_email, verification_link))
+
+
+@shared_task(**EMAIL_RETRY_OPTIONS)
+def send_email_task(to_email, subject, message, html_content, from_email):
+    check_response(send_email(to_email, subject, message, html_content, from_email))
+
+
+@shared_task(**EMAIL_RETRY_OPTIONS)
+def send_batch_email_task(recipients, subject, message, html_content, from_email):
+    """
+    Send one message to many recipients, see send_batch_email.
+    """
+    if len(recipients) > MAILGUN_BATCH_SIZE:
+        # One task per batch, so a retry never resends an accepted batch
+        addresses = list(recipients)
+        for start in range(0, len(addresses), MAILGUN_BATCH_SIZE):
+            batch = addresses[start : start + MAILGUN_BATCH_SIZE]
+            send_batch_email_task.delay(
+                {address: recipients[address] for address in batch},
+                subject,
+                message,
+                html_content,
+                from_email,
+            )
+        return
+
+    for response in send_batch_email(
+        recipients, subject, message, html_content, from_email
+    ):
+        check_response(response)
+
+
+@shared_task
+def flush_usage_counts():
+    """
+    Write the usage counted in Redis to the users table, run by Celery beat.
+    """
+    return flush_usage()
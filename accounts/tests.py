@@ -1,3 +1,290 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import requests
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from accounts import metering, tasks
+from accounts.middleware import PaymentMiddleware
+from accounts.authentication import UserSnapshot, authenticate_token, invalidate_user
+from accounts.factories import UserFactory
+from accounts.metering import (
+    UsageLimitExceeded,
+    flush_usage,
+    get_usage,
+    needs_payment,
+    record_usage,
+)
+from accounts.models import UserTier
+from helpers import email_utils, http_client
+from helpers.email_templates import render_email
+
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory(auth_provider="email")
+        self.access_token = str(AccessToken.for_user(self.user))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access_token}")
+
+    def test_cached_snapshot_skips_the_database(self):
+        authenticate_token(self.access_token)
+
+        with self.assertNumQueries(0):
+            user, _ = authenticate_token(self.access_token)
+
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.email, self.user.email)
+
+    def test_saving_the_user_reloads_the_snapshot(self):
+        authenticate_token(self.access_token)
+        self.user.first_name = "Ada"
+        self.user.save()
+
+        with self.assertNumQueries(1):
+            user, _ = authenticate_token(self.access_token)
+
+        self.assertEqual(user.first_name, "Ada")
+
+    def test_version_bump_reloads_the_snapshot(self):
+        authenticate_token(self.access_token)
+        invalidate_user(self.user.pk)
+
+        with self.assertNumQueries(1):
+            authenticate_token(self.access_token)
+        with self.assertNumQueries(0):
+            authenticate_token(self.access_token)
+
+    def test_blacklisting_a_refresh_token_reloads_the_snapshot(self):
+        authenticate_token(self.access_token)
+        RefreshToken.for_user(self.user).blacklist()
+
+        with self.assertNumQueries(1):
+            authenticate_token(self.access_token)
+
+    def test_logout_revokes_the_access_token(self):
+        self.client.post(
+            reverse("auth_logout"),
+            {"refresh_token": str(RefreshToken.for_user(self.user))},
+            format="json",
+        )
+
+        response = self.client.get(reverse("current-user"))
+
+        self.assertEqual(response.status_code, 401)
+        with self.assertRaises(InvalidToken):
+            authenticate_token(self.access_token)
+
+    def test_patch_current_user_saves_through_snapshot(self):
+        response = self.client.patch(
+            reverse("current-user"), {"auth_provider": "google"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["auth_provider"], "google")
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.auth_provider, "google")
+
+    def test_snapshot_reads_model_internals_from_user(self):
+        snapshot = UserSnapshot({"id": self.user.pk, "email": self.user.email})
+
+        self.assertIs(snapshot._meta, type(self.user)._meta)
+        self.assertEqual(snapshot.username, self.user.username)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class UsageMeteringTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch.object(metering, "get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tier = UserTier.objects.create(
+            name="Basic", download_limit=5, creation_limit=2, customization_limit=5
+        )
+        self.user = UserFactory(tier=tier, creation_count=1)
+
+    def test_counts_usage_in_redis_until_flushed(self):
+        record_usage(self.user, "download", 2)
+
+        self.assertEqual(get_usage(self.user.pk)["download"], 2)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.download_count, 0)
+
+    def test_rejects_usage_over_the_limit_without_counting_it(self):
+        record_usage(self.user, "creation")
+
+        with self.assertRaises(UsageLimitExceeded):
+            record_usage(self.user, "creation")
+        self.assertEqual(get_usage(self.user.pk)["creation"], 2)
+        self.assertTrue(needs_payment(self.user))
+
+    def test_flush_adds_pending_usage_to_stored_counts(self):
+        record_usage(self.user, "download", 3)
+        record_usage(self.user, "creation")
+
+        self.assertEqual(flush_usage(), 1)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.download_count, 3)
+        self.assertEqual(self.user.creation_count, 2)
+        self.assertEqual(get_usage(self.user.pk)["download"], 3)
+        # Nothing is left pending, so a second flush has nothing to do
+        self.assertEqual(flush_usage(), 0)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class PaymentMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(
+            metering,
+            "get_redis",
+            return_value=fakeredis.FakeRedis(decode_responses=True),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tier = UserTier.objects.create(
+            name="Basic", download_limit=5, creation_limit=2, customization_limit=5
+        )
+        self.user = UserFactory(tier=tier, creation_count=2)
+        self.client = APIClient()
+
+    def test_gates_users_authenticated_by_token(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+
+        response = self.client.get(reverse("current-user"))
+
+        self.assertEqual(response.status_code, 402)
+
+    def test_lets_token_users_under_their_limits_through(self):
+        self.user.creation_count = 0
+        self.user.save()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+
+        response = self.client.get(reverse("current-user"))
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_leaves_invalid_tokens_to_the_view(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer not-a-token")
+
+        response = self.client.get(reverse("current-user"))
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_allowlist_is_built_when_loaded(self):
+        with mock.patch("accounts.middleware.reverse", wraps=reverse) as reverse_url:
+            middleware = PaymentMiddleware(lambda request: None)
+            calls = reverse_url.call_count
+            middleware.is_exempt(mock.Mock(path="/api/"))
+
+        self.assertEqual(reverse_url.call_count, calls)
+        self.assertIn("/ws/scraper/", middleware.allowed_paths)
+
+
+class EmailTemplateTests(SimpleTestCase):
+    def test_text_part_is_not_html_escaped(self):
+        link = "https://example.com/verify/?key=abc&next=/"
+
+        _, text, html = render_email("verification", {"verification_link": link})
+
+        self.assertIn(link, text)
+        self.assertIn("key=abc&amp;next=/", html)
+
+    def test_listing_text_keeps_quotes_and_ampersands(self):
+        listing = {
+            "address": "O'Neill's Yard & Mews",
+            "url": "https://example.com/listing?id=1&ref=alert",
+            "price": 250000,
+            "bedrooms": 2,
+        }
+
+        subject, text, _ = render_email("saved_search_match", {"property": listing})
+
+        self.assertEqual(subject, "New listing for %recipient.search_names%")
+        self.assertIn("O'Neill's Yard & Mews", text)
+        self.assertIn("https://example.com/listing?id=1&ref=alert", text)
+        self.assertIn("Price: £250000", text)
+
+
+def make_response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+class EmailDeliveryTests(SimpleTestCase):
+    def test_session_is_pooled_per_process(self):
+        with mock.patch.object(http_client, "_sessions", {}):
+            with mock.patch("os.getpid", return_value=1):
+                session = http_client.get_session()
+                self.assertIs(http_client.get_session(), session)
+            # A forked child must not reuse its parent's sockets
+            with mock.patch("os.getpid", return_value=2):
+                self.assertIsNot(http_client.get_session(), session)
+
+    def test_adapter_applies_the_default_timeout_and_retries(self):
+        adapter = http_client.build_session().get_adapter("https://api.mailgun.net")
+
+        with mock.patch.object(http_client.HTTPAdapter, "send") as send:
+            adapter.send(mock.Mock())
+            adapter.send(mock.Mock(), timeout=1)
+
+        self.assertEqual(send.call_args_list[0].kwargs["timeout"], (5, 30))
+        self.assertEqual(send.call_args_list[1].kwargs["timeout"], 1)
+        self.assertEqual(adapter.max_retries.total, 3)
+        # Sends are retried by the task, never inside one attempt
+        self.assertNotIn("POST", adapter.max_retries.allowed_methods)
+
+    def test_retries_throttling_and_server_errors_only(self):
+        for status_code in (429, 503):
+            with self.subTest(status_code=status_code):
+                with self.assertRaises(requests.HTTPError):
+                    tasks.check_response(make_response(status_code))
+        # A rejected message would be rejected again, so it is only logged
+        tasks.check_response(make_response(400))
+        self.assertIn(
+            requests.RequestException, tasks.EMAIL_RETRY_OPTIONS["autoretry_for"]
+        )
+
+    def test_batch_send_posts_recipient_variables(self):
+        session = mock.Mock()
+        recipients = {"a@example.com": {"first_name": "Ada"}, "b@example.com": None}
+
+        with mock.patch.object(email_utils, "get_session", return_value=session):
+            email_utils.send_batch_email(recipients, "Subject", "Text", "<p>", "from")
+
+        data = session.post.call_args.kwargs["data"]
+        self.assertEqual(data["to"], ["a@example.com", "b@example.com"])
+        self.assertEqual(
+            json.loads(data["recipient-variables"]),
+            {"a@example.com": {"first_name": "Ada"}, "b@example.com": {}},
+        )
+
+    def test_large_batches_are_split_into_one_task_each(self):
+        recipients = {f"user{n}@example.com": {} for n in range(5)}
+
+        with mock.patch.object(tasks, "MAILGUN_BATCH_SIZE", 2), mock.patch.object(
+            tasks.send_batch_email_task, "delay"
+        ) as delay:
+            tasks.send_batch_email_task(recipients, "Subject", "Text", "<p>", "from")
+
+        self.assertEqual(
+            [len(call.args[0]) for call in delay.call_args_list], [2, 2, 1]
+        )
@@ -1,6 +1,6 @@
-import jwt
 from accounts import serializers
-from accounts.models import User
+from accounts.authentication import authenticate_token, revoke_token
+from accounts.models import User, UserTier
 from accounts.pagination import CustomPageNumberPagination
 from accounts.serializers import (
     ChangePasswordSerializer,
@@ -8,6 +8,7 @@ from accounts.serializers import (
     RegisterSerializer,
     UserSerializer,
 )
+from accounts.tasks import send_verification_email_task
 from allauth.socialaccount.providers.google.views import GoogleOAuth2Adapter
 from allauth.socialaccount.providers.oauth2.client import OAuth2Client
 from dj_rest_auth.registration.views import SocialLoginView
@@ -21,7 +22,6 @@ from django.utils.crypto import get_random_string
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django_filters.rest_framework import DjangoFilterBackend
-from helpers.email_utils import send_verification_email
 from pascraper.config.logging_config import configure_logger
 from rest_framework import filters, generics, status, viewsets
 from rest_framework.exceptions import AuthenticationFailed, PermissionDenied
@@ -30,7 +30,8 @@ from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken, TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView
 
 logger = configure_logger(__name__)
@@ -75,24 +76,15 @@ class RegisterAPIView(GenericAPIView):
 
             # Send verification email
             verification_link = f"{settings.FRONTEND_BASE_URL}/verify-email/{user.email_verification_token}"
-            email_response = send_verification_email(user.email, verification_link)
+            send_verification_email_task.delay(user.email, verification_link)
 
-            if email_response.status_code == 200:
-                return Response(
-                    {
-                        "message": "User registered successfully. Please check your email to verify your account.",
-                        "user_id": user.id,
-                    },
-                    status=status.HTTP_201_CREATED,
-                )
-            else:
-                return Response(
-                    {
-                        "message": "User registered successfully, but there was an issue sending the verification email. Please try again later.",
-                        "user_id": user.id,
-                    },
-                    status=status.HTTP_201_CREATED,
-                )
+            return Response(
+                {
+                    "message": "User registered successfully. Please check your email to verify your account.",
+                    "user_id": user.id,
+                },
+                status=status.HTTP_201_CREATED,
+            )
         else:
             print("Data not valid")
             errors = {}
@@ -155,18 +147,12 @@ class ResendVerificationEmailView(APIView):
             user.save()
 
             verification_link = f"{settings.FRONTEND_BASE_URL}/verify-email/{user.email_verification_token}"
-            email_response = send_verification_email(user.email, verification_link)
+            send_verification_email_task.delay(user.email, verification_link)
 
-            if email_response.status_code == 200:
-                return Response(
-                    {"message": "Verification email resent successfully"},
-                    status=status.HTTP_200_OK,
-                )
-            else:
-                return Response(
-                    {"message": "Failed to resend verification email"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                )
+            return Response(
+                {"message": "Verification email resent successfully"},
+                status=status.HTTP_200_OK,
+            )
 
         except User.DoesNotExist:
             return Response(
@@ -332,9 +318,13 @@ class LogoutView(APIView):
             token = RefreshToken(refresh_token)
             token.blacklist()
 
+            # Stop the access token used for this request from authenticating
+            if isinstance(request.auth, AccessToken):
+                revoke_token(request.auth)
+
             # Record logout time
             last_login = LoginHistory.objects.filter(
-                user=request.user, logout_time__isnull=True
+                user_id=request.user.pk, logout_time__isnull=True
             ).first()
             if last_login:
                 last_login.logout_time = timezone.now()
@@ -464,10 +454,9 @@ class UserView(APIView):
             raise AuthenticationFailed("Unauthenticated")
 
         try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        except jwt.ExpiredSignatureError:
+            user, _ = authenticate_token(token)
+        except InvalidToken:
             raise AuthenticationFailed("Authentication Expired")
 
-        user = User.objects.filter(id=payload["id"]).first()
         serializer = UserSerializer(user)
         return Response(serializer.data)
@@ -0,0 +1,112 @@
+import re
+from functools import lru_cache
+
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+
+BUILT_TEMPLATE_DIR = "emails/built"
+DEFAULT_LOCALE = "en"
+
+STYLE_RULE_RE = re.compile(r"([^{}@]+)\{([^{}]*)\}")
+AT_RULE_RE = re.compile(r"@[^{]+\{(?:[^{}]*\{[^{}]*\})*[^{}]*\}")
+
+
+def selector_specificity(selector):
+    ids = selector.count("#")
+    classes = selector.count(".") + selector.count("[")
+    tags = len(re.findall(r"(?:^|[\s>+~])[a-zA-Z][\w-]*", selector))
+    return (ids, classes, tags)
+
+
+def parse_declarations(style):
+    declarations = {}
+    for declaration in style.split(";"):
+        if ":" in declaration:
+            prop, value = declaration.split(":", 1)
+            declarations[prop.strip().lower()] = value.strip()
+    return declarations
+
+
+def inline_css(html):
+    """
+    Move the rules of <style> blocks into style attributes.
+
+    Rules are applied by specificity and then source order, and an element's
+    own style attribute wins. At-rules such as @media and selectors that can't
+    be inlined (e.g. :hover) stay in a <style> block in the head.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    rules = []
+    leftover = []
+
+    for style in soup.find_all("style"):
+        css = re.sub(r"/\*.*?\*/", "", style.get_text(), flags=re.S)
+        leftover.extend(AT_RULE_RE.findall(css))
+        css = AT_RULE_RE.sub("", css)
+
+        for selectors, body in STYLE_RULE_RE.findall(css):
+            for selector in selectors.split(","):
+                selector = selector.strip()
+                if ":" in selector:
+                    leftover.append(f"{selector} {{{body}}}")
+                    continue
+                rules.append(
+                    (selector_specificity(selector), len(rules), selector, body)
+                )
+        style.decompose()
+
+    elements = {}
+    for _, _, selector, body in sorted(rules):
+        for element in soup.select(selector):
+            elements.setdefault(id(element), (element, {}))[1].update(
+                parse_declarations(body)
+            )
+
+    for element, declarations in elements.values():
+        declarations.update(parse_declarations(element.get("style", "")))
+        element["style"] = "; ".join(
+            f"{prop}: {value}" for prop, value in declarations.items()
+        )
+
+    if leftover:
+        style = soup.new_tag("style")
+        style.string = "\n".join(leftover)
+        (soup.head or soup).insert(0, style)
+
+    return str(soup)
+
+
+def get_locale_candidates(locale):
+    locale = (locale or settings.LANGUAGE_CODE).lower()
+    candidates = [locale, locale.split("-")[0], DEFAULT_LOCALE]
+    return list(dict.fromkeys(candidates))
+
+
+@lru_cache(maxsize=None)
+def get_email_template(name, locale=None):
+    """
+    Load a built email template once per (name, locale), falling back from
+    e.g. "fr-ca" to "fr" and then to the default locale.
+    """
+    for candidate in get_locale_candidates(locale):
+        try:
+            return get_template(f"{BUILT_TEMPLATE_DIR}/{candidate}/{name}")
+        except TemplateDoesNotExist:
+            continue
+    raise TemplateDoesNotExist(f"{name} ({locale})")
+
+
+def render_email(name, context, locale=None):
+    """
+    Render the subject, plain text and HTML parts of an email.
+
+    Each email is made of <name>.subject.txt, <name>.txt and <name>.html in
+    emails/src/<locale>/; run the build_email_templates command after editing
+    them.
+    """
+    subject = get_email_template(f"{name}.subject.txt", locale).render(context)
+    text = get_email_template(f"{name}.txt", locale).render(context)
+    html = get_email_template(f"{name}.html", locale).render(context)
+    return subject.strip(), text.strip(), html
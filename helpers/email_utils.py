@@ -1,68 +1,85 @@
 import base64
+import json
 from email.mime.text import MIMEText
 
-import requests
 from django.conf import settings
+from helpers.email_templates import render_email
+from helpers.http_client import get_session
 from pascraper.config.base_config import anthropic_client
 from pascraper.config.logging_config import configure_logger
 
 logger = configure_logger(__name__)
 
+SUPPORT_FROM_EMAIL = "ResumeGuru Support <support@resumeguru.pro>"
 
-def send_verification_email(to_email, verification_link):
-    html_content = f"""
-<html>
-<body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; background-color: #f4f4f8;">
-    <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #ffffff; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
-        <img src="https://your-logo-url.com" alt="ResumeGuru Logo" style="display: block; margin: 0 auto; max-width: 200px;">
-        <h2 style="color: #4f46e5;">Welcome to ResumeGuru!</h2>
-        <p>Hello,</p>
-        <p>Thank you for registering with ResumeGuru. We're excited to have you on board! To get started, please verify your email address by clicking the button below:</p>
-        <p style="text-align: center;">
-            <a href="{verification_link}" style="background-color: #4f46e5; color: white; padding: 14px 20px; text-align: center; text-decoration: none; display: inline-block; border-radius: 4px; font-weight: bold; transition: background-color 0.3s;">Verify Your Email</a>
-        </p>
-        <p>If the button doesn't work, you can also copy and paste this link into your browser:</p>
-        <p style="word-break: break-all; color: #4f46e5;">{verification_link}</p>
-        <p>If you didn't create an account with ResumeGuru, please ignore this email.</p>
-        <p>Best regards,<br>The ResumeGuru Team</p>
-    </div>
-    <div style="text-align: center; padding-top: 20px; font-size: 12px; color: #666;">
-        <p>© 2024 ResumeGuru. All rights reserved.</p>
-        <p>
-            <a href="#" style="color: #4f46e5; text-decoration: none;">Terms of Service</a> |
-            <a href="#" style="color: #4f46e5; text-decoration: none;">Privacy Policy</a>
-        </p>
-    </div>
-</body>
-</html>
-"""
-    return requests.post(
+# Mailgun accepts at most 1000 recipients per batch send
+MAILGUN_BATCH_SIZE = 1000
+
+
+def post_message(data):
+    return get_session().post(
         f"https://api.mailgun.net/v3/{settings.MAILGUN_DOMAIN}/messages",
         auth=("api", settings.MAILGUN_API_KEY),
-        data={
-            "from": "ResumeGuru Support <support@resumeguru.pro>",
+        data=data,
+    )
+
+
+def send_verification_email(to_email, verification_link, locale=None):
+    subject, text, html_content = render_email(
+        "verification", {"verification_link": verification_link}, locale
+    )
+    return post_message(
+        {
+            "from": SUPPORT_FROM_EMAIL,
             "to": [to_email],
-            "subject": "Verify your email",
-            "text": f"Please click this link to verify your email: {verification_link}",
+            "subject": subject,
+            "text": text,
             "html": html_content,
-        },
+        }
     )
 
 
 def send_email(to_email, subject, message, html_content, from_email):
-    return requests.post(
-        f"https://api.mailgun.net/v3/{settings.MAILGUN_DOMAIN}/messages",
-        auth=("api", settings.MAILGUN_API_KEY),
-        data={
+    return post_message(
+        {
             "from": from_email,
             "to": [to_email],
             "subject": subject,
             "text": message,
             "html": html_content,
-        },
+        }
     )
 
 
+def send_batch_email(recipients, subject, message, html_content, from_email):
+    """
+    Send one message to many recipients with Mailgun's batch sending.
+
+    recipients maps each address to its template variables, which the
+    message references as %recipient.<name>%. Every recipient gets their own
+    copy, so addresses are never exposed to each other.
+    """
+    responses = []
+    addresses = list(recipients)
+    for start in range(0, len(addresses), MAILGUN_BATCH_SIZE):
+        batch = addresses[start : start + MAILGUN_BATCH_SIZE]
+        responses.append(
+            post_message(
+                {
+                    "from": from_email,
+                    "to": batch,
+                    "subject": subject,
+                    "text": message,
+                    "html": html_content,
+                    "recipient-variables": json.dumps(
+                        {address: recipients[address] or {} for address in batch}
+                    ),
+                }
+            )
+        )
+    return responses
+
+
 async def generate_personalized_email(conversation, user_message=None):
     """
     Uses the Anthropic API to generate a personalized email response.
@@ -1,6 +1,7 @@
 import os
 
 from celery import Celery
+from kombu import Queue
 from decouple import config
 from django.conf import settings
 
@@ -19,6 +20,61 @@ app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 # app.autodiscover_tasks()
 app.conf.broker_url = config("REDIS_URL")
 
+# Worker profiles, see docker-compose.yml:
+#   browser  Selenium scrapes, concurrency = BROWSER_POOL_SIZE Chromium instances
+#   http     HTTP-only scrapes and outbound API calls, high concurrency
+#   images   Image derivatives, one prefork process per CPU
+#   default  Short database tasks (matching, usage flushes, planning)
+DEFAULT_QUEUE = "default"
+BROWSER_QUEUE = "browser"
+HTTP_QUEUE = "http"
+IMAGES_QUEUE = "images"
+
+app.conf.task_queues = [
+    Queue(DEFAULT_QUEUE),
+    Queue(BROWSER_QUEUE),
+    Queue(HTTP_QUEUE),
+    Queue(IMAGES_QUEUE),
+]
+app.conf.task_default_queue = DEFAULT_QUEUE
+
+# Scraping jobs go to the browser queue unless sitescrapers.scheduler sends them
+# to the http queue because their engine can work without a browser
+app.conf.task_routes = {
+    "sitescrapers.tasks.run_scraping_job": {"queue": BROWSER_QUEUE},
+    "sitescrapers.tasks.generate_image_derivatives": {"queue": IMAGES_QUEUE},
+    "accounts.tasks.send_*": {"queue": HTTP_QUEUE},
+}
+
+# Long tasks must not be prefetched by a busy process, and are only acked
+# once done so a killed worker (e.g. out of memory) hands them back
+app.conf.worker_prefetch_multiplier = 1
+app.conf.task_acks_late = True
+app.conf.task_reject_on_worker_lost = True
+
+# Redis emulates priorities with one list per level, 0 being served first:
+# interactive scrapes (0) before scheduled refreshes (5) before backfills (9)
+app.conf.broker_transport_options = {
+    "priority_steps": list(range(10)),
+    "sep": ":",
+    "queue_order_strategy": "priority",
+}
+
+app.conf.beat_schedule = {
+    "flush-usage-counts": {
+        "task": "accounts.tasks.flush_usage_counts",
+        "schedule": 60.0,
+    },
+    "requeue-expired-jobs": {
+        "task": "sitescrapers.tasks.requeue_expired_jobs",
+        "schedule": 60.0,
+    },
+    "plan-refreshes": {
+        "task": "sitescrapers.tasks.refresh_due_properties",
+        "schedule": float(settings.REFRESH_PLAN_INTERVAL),
+    },
+}
+
 
 @app.task(bind=True)
 def debug_task(self):
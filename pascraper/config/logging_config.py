@@ -1,5 +1,17 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
 import os
+import queue
+import random
+import threading
+import uuid
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 
 # from celery.signals import after_setup_logger
 
@@ -9,20 +21,160 @@ import os
 #     logger.addHandler(logging.StreamHandler())
 #     logger.setLevel(logging.DEBUG)
 
+# Share of DEBUG records kept, e.g. 0.1 keeps one in ten
+DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+# Ids (job_id, request_id, ...) attached to every record logged in this context
+_log_context = contextvars.ContextVar("log_context", default={})
+
+
+@contextmanager
+def bind_log_context(**ids):
+    token = _log_context.set({**_log_context.get(), **ids})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        record.context = _log_context.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate=DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
 
 class CustomFormatter(logging.Formatter):
-    def __init__(self, fmt="%(levelname)s: %(message)s"):
+    def __init__(self, fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s"):
         super().__init__(fmt)
+        # A separate formatter for errors, instead of swapping the format of a
+        # shared one, keeps this safe to use from several threads
+        self.error_formatter = logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s"
+        )
 
     def format(self, record):
         # Change format for ERROR level and above (ERROR, CRITICAL)
         if record.levelno >= logging.ERROR:
-            self._style._fmt = "%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s"
-        else:
-            self._style._fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+            return self.error_formatter.format(record)
         return super().format(record)
 
 
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "context", {}),
+        }
+        if record.levelno >= logging.ERROR:
+            entry["location"] = f"{record.filename}:{record.lineno}"
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Queue records for a background listener without formatting them here.
+
+    Each process gets its own queue and listener thread, started on its first
+    record. A forked child (e.g. a Celery prefork worker) inherits the
+    handler from its parent but not the parent's listener thread.
+    """
+
+    def __init__(self, log_file_path, console=True):
+        super().__init__(None)
+        self.log_file_path = log_file_path
+        self.console = console
+        self.pid = None
+        self.listener = None
+        self.start_lock = threading.Lock()
+
+    def reset_after_fork(self):
+        # The parent's lock may have been held at fork time
+        self.start_lock = threading.Lock()
+        self.pid = None
+        self.listener = None
+
+    def start_listener(self):
+        handlers = []
+        if self.console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(CustomFormatter())
+            handlers.append(console_handler)
+
+        # Several processes append to the same file, so none of them rotates
+        # it; logrotate does (pascraper/config/logrotate.conf, run by the
+        # logrotate service) and the handler reopens the file once moved
+        file_handler = WatchedFileHandler(self.log_file_path)
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+        self.pid = os.getpid()
+
+    def enqueue(self, record):
+        if self.pid != os.getpid():
+            with self.start_lock:
+                if self.pid != os.getpid():
+                    self.start_listener()
+        self.queue.put_nowait(record)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_handlers = {}
+
+
+def reset_handlers_after_fork():
+    for handler in _handlers.values():
+        handler.reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_handlers_after_fork)
+
+
+def get_queue_handler(log_file_path, console=True):
+    """
+    Return the queue handler feeding the listener for a log file.
+
+    The listener thread does the console and disk I/O, so callers only pay
+    for putting the record on an in-memory queue.
+    """
+    key = (log_file_path, console)
+    if key not in _handlers:
+        queue_handler = ContextQueueHandler(log_file_path, console)
+        queue_handler.addFilter(ContextFilter())
+        queue_handler.addFilter(SamplingFilter())
+        _handlers[key] = queue_handler
+    return _handlers[key]
+
+
 def configure_logger(name):
     # Create or get a logger
     logger = logging.getLogger(name)
@@ -30,18 +182,9 @@ def configure_logger(name):
     # Set the log level
     logger.setLevel(logging.DEBUG)  # Set to DEBUG to catch all levels
 
-    # Create console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(CustomFormatter())
-
-    # Create file handler for connection logs
-    file_handler = logging.FileHandler("connections.log")
-    file_handler.setFormatter(CustomFormatter())
-
-    # Add handlers to the logger
-    if not logger.handlers:  # Avoid adding multiple handlers if already present
-        logger.addHandler(console_handler)
-        logger.addHandler(file_handler)
+    # Avoid adding multiple handlers if already present
+    if not logger.handlers:
+        logger.addHandler(get_queue_handler("connections.log"))
 
     return logger
 
@@ -53,15 +196,42 @@ def configure_file_logger(name):
     # Set the log level
     logger.setLevel(logging.DEBUG)  # Set to DEBUG to catch all levels
 
-    # Create file handler for connection logs
-    log_file_path = "pascraper/connections.log"
-    file_handler = logging.FileHandler(log_file_path)
-    file_handler.setFormatter(CustomFormatter())
-
-    # Add handler to the logger
-    if not any(
-        isinstance(handler, logging.FileHandler) for handler in logger.handlers
-    ):  # Avoid adding multiple file handlers
-        logger.addHandler(file_handler)
+    # Avoid adding multiple file handlers
+    if not logger.handlers:
+        logger.addHandler(get_queue_handler("pascraper/connections.log", console=False))
 
     return logger
+
+
+class RequestLogContextMiddleware:
+    """
+    Tag every log record of a request with its request id, taken from the
+    X-Request-ID header when a proxy already set one.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def get_request_id(self, request):
+        return request.headers.get("X-Request-ID") or uuid.uuid4().hex
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_id = self.get_request_id(request)
+        with bind_log_context(request_id=request_id):
+            response = self.get_response(request)
+        response["X-Request-ID"] = request_id
+        return response
+
+    async def __acall__(self, request):
+        request_id = self.get_request_id(request)
+        with bind_log_context(request_id=request_id):
+            response = await self.get_response(request)
+        response["X-Request-ID"] = request_id
+        return response
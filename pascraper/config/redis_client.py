@@ -0,0 +1,13 @@
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def get_redis():
+    """
+    Shared Redis client for counters, locks and buffers that need more than
+    the cache API offers. The client keeps its own connection pool.
+    """
+    return redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
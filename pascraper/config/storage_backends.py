@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
 from storages.backends.s3boto3 import S3Boto3Storage
 
 # class StaticStorage(S3Boto3Storage):
@@ -9,3 +11,12 @@ class MediaStorage(S3Boto3Storage):
     location = "media"
     default_acl = "private"
     file_overwrite = False
+
+
+def get_media_storage():
+    """
+    Use the S3 media storage when it is configured, the default storage otherwise.
+    """
+    if getattr(settings, "AWS_STORAGE_BUCKET_NAME", None):
+        return MediaStorage()
+    return default_storage
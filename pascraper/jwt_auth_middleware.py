@@ -1,18 +1,15 @@
+from accounts.authentication import authenticate_token
 from channels.db import database_sync_to_async
-from django.conf import settings
-from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
-from jwt import decode as jwt_decode
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from rest_framework_simplejwt.tokens import UntypedToken
 
 
 @database_sync_to_async
-def get_user(user_id):
-    User = get_user_model()
+def get_user(token_key):
     try:
-        return User.objects.get(id=user_id)
-    except User.DoesNotExist:
+        user, _ = authenticate_token(token_key)
+        return user
+    except (InvalidToken, TokenError, KeyError):
         return AnonymousUser()
 
 
@@ -22,20 +19,14 @@ class JWTAuthMiddleware:
 
     async def __call__(self, scope, receive, send):
         headers = dict(scope["headers"])
+        scope["user"] = AnonymousUser()
         if b"authorization" in headers:
             try:
                 token_name, token_key = headers[b"authorization"].decode().split()
-                if token_name == "Bearer":
-                    # Decode the token
-                    UntypedToken(token_key)
-                    decoded_data = jwt_decode(
-                        token_key, settings.SECRET_KEY, algorithms=["HS256"]
-                    )
-                    user_id = decoded_data["user_id"]
-                    scope["user"] = await get_user(user_id)
-            except (InvalidToken, TokenError, KeyError):
-                scope["user"] = AnonymousUser()
-        else:
-            scope["user"] = AnonymousUser()
+            except ValueError:
+                token_name = token_key = None
+            if token_name == "Bearer":
+                # Verified once and served from the snapshot cache on reconnects
+                scope["user"] = await get_user(token_key)
 
         return await self.app(scope, receive, send)
@@ -33,15 +33,15 @@ MEDIA_ROOT = BASE_DIR / "media"
 
 
 # ================================ REDIS/CHANNELS =======================================
-# CACHES = {
-#     "default": {
-#         "BACKEND": "django_redis.cache.RedisCache",
-#         "LOCATION": config("REDIS_URL"),
-#         "OPTIONS": {
-#             "CLIENT_CLASS": "django_redis.client.DefaultClient",
-#         }
-#     }
-# }
+# ==> CACHE
+# Shared by every web and worker process, so invalidations apply everywhere
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": config("REDIS_URL"),
+        "KEY_PREFIX": "pascraper",
+    }
+}
 
 # ==> CHANNELS
 default_channel_layer = {
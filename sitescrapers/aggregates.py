@@ -0,0 +1,54 @@
+from django.db import connection
+from sitescrapers.models import Property, PropertySnapshot
+
+# Snapshots are only written when a listing changes, so each week takes the
+# snapshot of every listing that was current at the end of that week rather
+# than only the rows captured within it. LEAD turns the snapshots into
+# validity intervals in one pass, which are then joined to the weeks. A
+# listing counts for the weeks it was still being scraped.
+WEEKLY_MEDIAN_SQL = """
+WITH intervals AS (
+    SELECT snapshot.property_id, snapshot.price, snapshot.outcode,
+           snapshot.captured_at AS valid_from,
+           LEAD(snapshot.captured_at) OVER (
+               PARTITION BY snapshot.property_id ORDER BY snapshot.captured_at
+           ) AS valid_to
+    FROM {snapshot_table} AS snapshot
+    WHERE snapshot.captured_at < %(end)s {area_filter}
+),
+weeks AS (
+    SELECT week, week + interval '1 week' AS week_end
+    FROM generate_series(
+        date_trunc('week', %(start)s::timestamptz), %(end)s::timestamptz, '1 week'
+    ) AS week
+    WHERE week < %(end)s
+)
+SELECT weeks.week, intervals.outcode,
+       PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY intervals.price),
+       COUNT(*)
+FROM weeks
+JOIN intervals
+  ON intervals.valid_from < weeks.week_end
+ AND (intervals.valid_to IS NULL OR intervals.valid_to >= weeks.week_end)
+JOIN {property_table} AS listing
+  ON listing.id = intervals.property_id AND listing.last_scraped_at >= weeks.week
+WHERE intervals.price IS NOT NULL
+GROUP BY weeks.week, intervals.outcode
+ORDER BY intervals.outcode, weeks.week
+"""
+
+
+def get_weekly_median_prices(start, end, outcode=None):
+    """
+    Return (week, outcode, median price, listings) for every week between two
+    datetimes, per area or for one outcode.
+    """
+    sql = WEEKLY_MEDIAN_SQL.format(
+        snapshot_table=PropertySnapshot._meta.db_table,
+        property_table=Property._meta.db_table,
+        # Inside the CTE, so the (outcode, captured_at) index narrows the scan
+        area_filter="AND snapshot.outcode = %(outcode)s" if outcode else "",
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"start": start, "end": end, "outcode": outcode})
+        return cursor.fetchall()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SitescrapersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "sitescrapers"
+
+    def ready(self):
+        from sitescrapers import signals  # noqa: F401
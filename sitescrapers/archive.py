@@ -0,0 +1,232 @@
+import hashlib
+import json
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import django
+import zstandard
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from pascraper.config.storage_backends import get_media_storage
+from sitescrapers.models import ArchiveDictionary, ArchivedPage, Property
+from sitescrapers.persistence import get_changed_fields, normalize_property_data
+from utils.registry import resolve
+
+COMPRESSION_LEVEL = 10
+# zstd's default dictionary size, large enough for a portal's shared markup
+DICTIONARY_SIZE = 112 * 1024
+DICTIONARY_SAMPLES = 2000
+MIN_DICTIONARY_SAMPLES = 50
+
+
+def archive_key(url, captured_at):
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return f"archive/{digest[:2]}/{digest}/{captured_at:%Y%m%dT%H%M%S%f}.json.zst"
+
+
+def encode_pages(pages):
+    return json.dumps(pages, sort_keys=True).encode("utf-8")
+
+
+@lru_cache(maxsize=None)
+def get_dictionary(dictionary_id):
+    # Dictionaries are never changed once trained, so each is loaded once
+    data = ArchiveDictionary.objects.values_list("data", flat=True).get(
+        id=dictionary_id
+    )
+    return zstandard.ZstdCompressionDict(bytes(data))
+
+
+def get_latest_dictionary_id(source):
+    return (
+        ArchiveDictionary.objects.filter(source=source)
+        .order_by("-created_at")
+        .values_list("id", flat=True)
+        .first()
+    )
+
+
+def compress(raw, dictionary_id=None):
+    dictionary = get_dictionary(dictionary_id) if dictionary_id else None
+    compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=dictionary)
+    return compressor.compress(raw)
+
+
+def decompress(blob, dictionary_id=None):
+    dictionary = get_dictionary(dictionary_id) if dictionary_id else None
+    return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(blob)
+
+
+def archive_pages(url, source, pages):
+    """
+    Store the pages of a scrape, compressed with the portal's latest
+    dictionary. Nothing is stored if they are identical to the last capture.
+    """
+    if not pages:
+        return None
+
+    raw = encode_pages(pages)
+    content_hash = hashlib.sha1(raw).hexdigest()
+    last_hash = (
+        ArchivedPage.objects.filter(url=url)
+        .order_by("-captured_at")
+        .values_list("content_hash", flat=True)
+        .first()
+    )
+    if last_hash == content_hash:
+        return None
+
+    dictionary_id = get_latest_dictionary_id(source)
+    blob = compress(raw, dictionary_id)
+    captured_at = timezone.now()
+    storage_key = get_media_storage().save(
+        archive_key(url, captured_at), ContentFile(blob)
+    )
+    return ArchivedPage.objects.create(
+        url=url,
+        source=source,
+        captured_at=captured_at,
+        storage_key=storage_key,
+        dictionary_id=dictionary_id,
+        content_hash=content_hash,
+        raw_size=len(raw),
+        compressed_size=len(blob),
+    )
+
+
+def load_pages(storage_key, dictionary_id=None, storage=None):
+    """
+    Return the {name: html} pages of an archived scrape.
+    """
+    storage = storage or get_media_storage()
+    with storage.open(storage_key, "rb") as archive_file:
+        blob = archive_file.read()
+    return json.loads(decompress(blob, dictionary_id))
+
+
+def replay_archived_page(row):
+    """
+    Re-run the current extractors over one archived scrape.
+
+    Takes and returns plain values so it can run in a process pool. row is
+    (id, url, source, storage_key, dictionary_id); the result is
+    (id, url, source, data, error).
+    """
+    archive_id, url, source, storage_key, dictionary_id = row
+    try:
+        pages = load_pages(storage_key, dictionary_id)
+        data = resolve(url, source).extract(url, pages)
+    except Exception as e:
+        return archive_id, url, source, None, str(e)
+    return archive_id, url, source, data, None
+
+
+def get_worker_pool(max_workers):
+    """
+    Process pool for replaying archived pages. Workers are spawned rather
+    than forked so they don't share the parent's database connections.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=django.setup,
+    )
+
+
+def reextract_archived_pages(rows):
+    """
+    Re-extract and normalise a chunk of archived scrapes in a pool worker,
+    returning (url, fields, error) for each.
+    """
+    results = []
+    for _, url, _, data, error in map(replay_archived_page, rows):
+        fields = normalize_property_data(data) if data is not None else None
+        results.append((url, fields, error))
+    return results
+
+
+def reextract_in_pool(chunks, workers):
+    """
+    Re-extract chunks of replay rows in a process pool, given (key, rows)
+    pairs. Yields (key, results) in submission order, so a caller can
+    checkpoint after each chunk, with a couple of chunks per worker kept in
+    flight.
+    """
+    chunks = iter(chunks)
+    in_flight = deque()
+    with get_worker_pool(workers) as pool:
+        while True:
+            for key, rows in chunks:
+                in_flight.append((key, pool.submit(reextract_archived_pages, rows)))
+                if len(in_flight) >= workers * 2:
+                    break
+            if not in_flight:
+                return
+            key, future = in_flight.popleft()
+            yield key, future.result()
+
+
+def get_listing_changes(results):
+    """
+    Compare re-extracted (url, fields, error) results with the saved
+    listings, loaded in one query. Returns the (listing, fields, changed
+    field names) of the listings that changed and the URLs that aren't saved
+    as listings.
+    """
+    extracted = {url: fields for url, fields, error in results if not error}
+    listings = Property.objects.in_bulk(list(extracted), field_name="url")
+    changes = []
+    missing = []
+    for url, fields in extracted.items():
+        listing = listings.get(url)
+        if listing is None:
+            missing.append(url)
+            continue
+        changed_fields = get_changed_fields(listing, fields)
+        if changed_fields:
+            changes.append((listing, fields, changed_fields))
+    return changes, missing
+
+
+def get_latest_archived_pages(urls):
+    """
+    Return the replay rows of the latest capture of each URL.
+    """
+    return list(
+        ArchivedPage.objects.filter(url__in=urls)
+        .order_by("url", "-captured_at")
+        .distinct("url")
+        .values_list("id", "url", "source", "storage_key", "dictionary_id")
+    )
+
+
+def train_dictionary(
+    source, sample_count=DICTIONARY_SAMPLES, dictionary_size=DICTIONARY_SIZE
+):
+    """
+    Train a new dictionary for a portal on its most recent archived scrapes.
+    Later captures use it, earlier ones keep the dictionary they were
+    compressed with.
+    """
+    archived = (
+        ArchivedPage.objects.filter(source=source)
+        .order_by("-captured_at")
+        .values_list("storage_key", "dictionary_id")[:sample_count]
+    )
+    storage = get_media_storage()
+    samples = [
+        encode_pages(load_pages(storage_key, dictionary_id, storage))
+        for storage_key, dictionary_id in archived
+    ]
+    if len(samples) < MIN_DICTIONARY_SAMPLES:
+        raise ValueError(
+            f"Need at least {MIN_DICTIONARY_SAMPLES} archived {source} pages, "
+            f"found {len(samples)}"
+        )
+
+    dictionary = zstandard.train_dictionary(dictionary_size, samples)
+    return ArchiveDictionary.objects.create(
+        source=source, data=dictionary.as_bytes(), sample_count=len(samples)
+    )
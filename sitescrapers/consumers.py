@@ -1,104 +1,100 @@
 import json
 
+from accounts.metering import UsageLimitExceeded
 from asgiref.sync import sync_to_async
-from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from sitescrapers.models import Property, ScrapingJob
-from utils.onthemarket.onthemarket_scraper import OnTheMarketScraper
-from utils.rightmove.rightmove_scraper import RightmoveScraper
-from utils.zoopla.zoopla_scraper import ZooplaScraper
+from sitescrapers.jobs import (
+    clean_batch_id,
+    create_scraping_job,
+    get_job_for_user,
+    queue_scraping_job,
+)
+from sitescrapers.progress import batch_group, get_replay, job_group, user_group
 
 
 class ScraperConsumer(AsyncWebsocketConsumer):
+    """
+    Start scraping jobs and follow their progress.
+
+    Messages:
+        {"url": "...", "source": "...", "batch_id": "..."}  start a job
+        {"action": "subscribe", "job_id": 1, "last_seq": 0}   follow a job
+        {"action": "subscribe_batch", "batch_id": "..."}       follow a batch
+
+    Jobs run in Celery workers and publish to channel-layer groups, so any
+    socket subscribed to the job, its owner or its batch receives the events.
+    """
+
     async def connect(self):
+        self.groups_joined = set()
         await self.accept()
 
+        user = self.scope.get("user")
+        if user and user.is_authenticated:
+            await self.join_group(user_group(user.pk))
+
     async def disconnect(self, close_code):
-        pass
+        for group in self.groups_joined:
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def join_group(self, group):
+        if group not in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+            self.groups_joined.add(group)
 
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
-        url = text_data_json["url"]
-        source = text_data_json["source"]
-
-        # Create a new scraping job
-        job = await self.create_scraping_job(url)
+        action = text_data_json.get("action", "scrape")
 
         try:
-            # Update job status to in progress
-            await self.update_job_status(job.id, "in_progress")
-
-            # Run the appropriate scraper
-            if source == "rightmove":
-                scraper = RightmoveScraper(url)
-            elif source == "zoopla":
-                scraper = ZooplaScraper(url)
-            elif source == "onthemarket":
-                scraper = OnTheMarketScraper(url)
+            if action == "subscribe":
+                await self.subscribe_job(
+                    text_data_json["job_id"], text_data_json.get("last_seq", 0)
+                )
+            elif action == "subscribe_batch":
+                batch_id = clean_batch_id(text_data_json["batch_id"])
+                await self.join_group(batch_group(self.get_user_id(), batch_id))
+            elif action == "scrape":
+                await self.start_job(text_data_json)
             else:
-                raise ValueError(f"Invalid source: {source}")
-
-            # Run the scraper
-            data = await sync_to_async(scraper.scrape_property)()
-
-            # Save the scraped data
-            property_instance = await self.save_property_data(data, source, url)
-
-            # Update the job with the saved property
-            await self.update_job_property(job.id, property_instance.id)
-
-            # Update job status to completed
-            await self.update_job_status(job.id, "completed")
-
-            # Send success message back to WebSocket
+                raise ValueError(f"Invalid action: {action}")
+        except (KeyError, ValueError, PermissionError, UsageLimitExceeded) as e:
             await self.send(
-                text_data=json.dumps(
-                    {
-                        "status": "success",
-                        "message": "Scraping completed successfully",
-                        "property_id": property_instance.id,
-                    }
-                )
+                text_data=json.dumps({"status": "error", "message": str(e)})
             )
 
-        except Exception as e:
-            # Update job status to failed
-            await self.update_job_status(job.id, "failed")
+    def get_user_id(self):
+        user = self.scope.get("user")
+        return user.pk if user and user.is_authenticated else None
+
+    async def start_job(self, text_data_json):
+        # The source is optional, the registry routes the URL to its site
+        source = text_data_json.get("source")
+        job = await create_scraping_job(
+            text_data_json["url"],
+            source,
+            user=self.scope.get("user"),
+            batch_id=text_data_json.get("batch_id"),
+        )
+        # Join before queueing so no event of the job is missed
+        await self.join_group(job_group(job.id))
+        await queue_scraping_job(job, source)
 
-            # Send error message back to WebSocket
-            await self.send(
-                text_data=json.dumps({"status": "error", "message": str(e)})
+        await self.send(
+            text_data=json.dumps(
+                {"status": "pending", "job_id": job.id, "message": "Scraping queued"}
             )
-
-    @database_sync_to_async
-    def create_scraping_job(self, url):
-        return ScrapingJob.objects.create(url=url)
-
-    @database_sync_to_async
-    def update_job_status(self, job_id, status):
-        job = ScrapingJob.objects.get(id=job_id)
-        job.status = status
-        job.save()
-
-    @database_sync_to_async
-    def update_job_property(self, job_id, property_id):
-        job = ScrapingJob.objects.get(id=job_id)
-        job.property_id = property_id
-        job.save()
-
-    @database_sync_to_async
-    def save_property_data(self, data, source, url):
-        return Property.objects.create(
-            source=source,
-            url=url,
-            address=data["address"],
-            price=data["price"],
-            bedrooms=data["bedrooms"],
-            bathrooms=data["bathrooms"],
-            size=data["size"],
-            house_type=data["house_type"],
-            agent=data["agent"],
-            description=data["description"],
-            images=data["images"],
-            floorplans=data["floorplans"],
         )
+
+    async def subscribe_job(self, job_id, last_seq):
+        if not await get_job_for_user(job_id, self.get_user_id()):
+            raise PermissionError(f"Job {job_id} not found")
+
+        await self.join_group(job_group(job_id))
+
+        # Catch up on everything published while this client was away
+        for event in await sync_to_async(get_replay)(job_id, last_seq):
+            await self.send(text_data=json.dumps(event))
+
+    async def job_progress(self, message):
+        await self.send(text_data=json.dumps(message["event"]))
@@ -0,0 +1,237 @@
+import re
+
+from accounts.metering import record_usage
+from asgiref.sync import sync_to_async
+from django.db.models import F
+from sitescrapers.archive import archive_pages
+from sitescrapers.leases import (
+    Heartbeat,
+    LeaseLost,
+    claim_job,
+    release_job,
+    save_checkpoint,
+    update_job,
+)
+from sitescrapers.models import Property, ScrapingJob
+from sitescrapers.persistence import save_property_data
+from sitescrapers.progress import ProgressPublisher
+from sitescrapers.scheduler import finish_job, get_fresh_property, schedule_job
+from pascraper.config.logging_config import bind_log_context, configure_logger
+from utils.base_scraper import BrowserRequired
+from utils.normalize import normalize_url
+from utils.registry import find_plugins, scrape_url
+
+logger = configure_logger(__name__)
+
+BATCH_ID_RE = re.compile(r"^[\w.-]{1,64}$")
+
+
+def clean_batch_id(batch_id):
+    if batch_id is not None and not BATCH_ID_RE.match(str(batch_id)):
+        raise ValueError("Invalid batch_id")
+    return batch_id
+
+
+async def create_scraping_job(
+    url,
+    source=None,
+    user=None,
+    batch_id=None,
+    priority=ScrapingJob.PRIORITY_INTERACTIVE,
+):
+    """
+    Validate and meter a scrape request and create its job.
+
+    Raises ValueError for URLs no engine handles or bad batch ids, and
+    UsageLimitExceeded when the user is over their tier limit.
+    """
+    if not find_plugins(url, source):
+        raise ValueError(f"No scraper available for {url}")
+    batch_id = clean_batch_id(batch_id)
+
+    user_id = None
+    if user is not None and user.is_authenticated:
+        user_id = user.pk
+        # Every scrape counts against the user's tier
+        await sync_to_async(record_usage)(user, "creation")
+
+    return await ScrapingJob.objects.acreate(
+        url=url,
+        normalized_url=normalize_url(url),
+        priority=priority,
+        user_id=user_id,
+        batch_id=batch_id,
+    )
+
+
+JOB_FIELDS = (
+    "id",
+    "url",
+    "status",
+    "stage",
+    "user_id",
+    "property_id",
+    "created_at",
+    "updated_at",
+)
+PROPERTY_FIELDS = (
+    "id",
+    "source",
+    "url",
+    "address",
+    "price",
+    "bedrooms",
+    "bathrooms",
+    "size",
+    "house_type",
+    "agent",
+    "description",
+    "images",
+    "floorplans",
+    "time_on_market",
+)
+
+
+async def get_job_for_user(job_id, user_id):
+    """
+    Return the job's fields if it exists and belongs to the user, anonymous
+    jobs being visible to anyone with their id.
+    """
+    job = await ScrapingJob.objects.filter(id=job_id).values(*JOB_FIELDS).afirst()
+    if job is None or job["user_id"] not in (None, user_id):
+        return None
+    return job
+
+
+async def get_job_result(job):
+    """
+    Build the API representation of a job, with its property once completed.
+    """
+    result = {
+        "job_id": job["id"],
+        "url": job["url"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+    if job["status"] in ("completed", "superseded") and job["property_id"]:
+        result["property"] = (
+            await Property.objects.filter(id=job["property_id"])
+            .values(*PROPERTY_FIELDS)
+            .afirst()
+        )
+    return result
+
+
+async def queue_scraping_job(job, source=None):
+    # Publishing to the broker is blocking I/O, keep it off the event loop
+    await sync_to_async(schedule_job, thread_sensitive=False)(job, source)
+
+
+def execute_scraping_job(job_id, source=None):
+    """
+    Scrape, persist and post-process the URL of a job, publishing progress to
+    the job's channel-layer groups along the way.
+    """
+    with bind_log_context(job_id=job_id):
+        _execute_scraping_job(job_id, source)
+
+
+def _execute_scraping_job(job_id, source):
+    # A job can be queued more than once (priority bumps, browser hand-offs,
+    # the reaper), only the first message to claim it runs it
+    token = claim_job(job_id)
+    if not token:
+        logger.info(f"Scraping job {job_id} already claimed or superseded")
+        return
+
+    job = ScrapingJob.objects.get(id=job_id)
+    publisher = ProgressPublisher(job.id, user_id=job.user_id, batch_id=job.batch_id)
+
+    try:
+        with Heartbeat(job.id, token, normalized_url=job.normalized_url):
+            run_job_stages(job, token, source, publisher)
+    except LeaseLost:
+        # The reaper handed the job to another worker, leave it to that one
+        logger.warning(f"Scraping job {job.id} was requeued while running")
+    except BrowserRequired:
+        # The page needs Chromium after all, hand the job to a browser worker
+        from pascraper.celery import BROWSER_QUEUE
+        from sitescrapers.tasks import run_scraping_job
+
+        # Not a failed attempt, so it doesn't count towards MAX_ATTEMPTS
+        if release_job(job, token, "pending", attempts=F("attempts") - 1):
+            publisher.publish("progress", stage="waiting_for_browser")
+            run_scraping_job.apply_async(
+                (job.id, source), queue=BROWSER_QUEUE, priority=job.priority
+            )
+    except Exception as e:
+        logger.error(f"Scraping job {job.id} failed: {e}")
+        if release_job(job, token, "failed"):
+            publisher.publish("failed", message=str(e))
+            finish_job(job, str(e))
+
+
+def run_job_stages(job, token, source, publisher):
+    """
+    Run the stages a job hasn't completed yet, checkpointing after each one
+    so a requeued job resumes where its last worker stopped.
+    """
+    if not job.has_reached(ScrapingJob.STAGE_SCRAPED):
+        fresh_property = get_fresh_property(job)
+        if fresh_property:
+            if not release_job(job, token, "superseded", property=fresh_property):
+                raise LeaseLost(f"Lost the lease of scraping job {job.id}")
+            publisher.publish("superseded", property_id=fresh_property.id)
+            finish_job(job)
+            return
+
+        publisher.publish("in_progress", stage="scraping", url=job.url)
+        plugin, data, pages = scrape_url(job.url, source)
+        try:
+            archive_pages(job.url, plugin.source, pages)
+        except Exception as e:
+            # The archive is only used for re-extraction, don't fail the job
+            logger.warning(f"Could not archive the pages of {job.url}: {e}")
+        save_checkpoint(
+            job, token, ScrapingJob.STAGE_SCRAPED, source=plugin.source, data=data
+        )
+    else:
+        publisher.publish("in_progress", stage="resuming", url=job.url)
+
+    if not job.has_reached(ScrapingJob.STAGE_SAVED):
+        source = job.checkpoint["source"]
+        publisher.publish("progress", stage="saving", source=source)
+        property_instance = save_property_data(job.checkpoint["data"], source, job.url)
+        # The scraped data is no longer needed once it is saved
+        update_job(
+            job,
+            token,
+            stage=ScrapingJob.STAGE_SAVED,
+            checkpoint={},
+            property=property_instance,
+        )
+    else:
+        property_instance = job.property
+
+    if not release_job(job, token, "completed"):
+        raise LeaseLost(f"Lost the lease of scraping job {job.id}")
+
+    # The job is completed from here on, so nothing below may keep the
+    # followers and subscribers from hearing about it
+    message = "Scraping completed successfully"
+    try:
+        # Resize images in a Celery worker instead of in the scrape.
+        # Derivatives already stored are skipped, so a repeat is cheap.
+        from sitescrapers.tasks import generate_image_derivatives
+
+        generate_image_derivatives.delay(property_instance.id)
+    except Exception as e:
+        logger.error(f"Could not queue image derivatives of job {job.id}: {e}")
+    try:
+        publisher.publish(
+            "completed", message=message, property_id=property_instance.id
+        )
+    finally:
+        finish_job(job, message)
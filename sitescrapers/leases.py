@@ -0,0 +1,166 @@
+import threading
+import uuid
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+from pascraper.config.logging_config import configure_logger
+from redis.exceptions import RedisError
+from sitescrapers.models import ScrapingJob
+from sitescrapers.progress import ProgressPublisher
+from sitescrapers.scheduler import finish_job, refresh_flight, send_job
+
+logger = configure_logger(__name__)
+
+LEASE_DURATION = timedelta(minutes=5)
+HEARTBEAT_INTERVAL = 60
+# Claims before a job that keeps losing its worker is marked failed
+MAX_ATTEMPTS = 3
+
+
+class LeaseLost(Exception):
+    """
+    The job was requeued by the reaper while this worker still ran it.
+    """
+
+
+def claim_job(job_id):
+    """
+    Move a pending job to in_progress under a new lease and return the lease
+    token, or None if another message for it already ran or it was superseded.
+    """
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    claimed = ScrapingJob.objects.filter(id=job_id, status="pending").update(
+        status="in_progress",
+        lease_owner=token,
+        lease_expires_at=now + LEASE_DURATION,
+        heartbeat_at=now,
+        attempts=F("attempts") + 1,
+        updated_at=now,
+    )
+    return token if claimed else None
+
+
+def update_job(job, token, **fields):
+    """
+    Save fields of a job only while this worker still holds its lease.
+    """
+    fields["updated_at"] = timezone.now()
+    updated = ScrapingJob.objects.filter(
+        id=job.id, status="in_progress", lease_owner=token
+    ).update(**fields)
+    if not updated:
+        raise LeaseLost(f"Lost the lease of scraping job {job.id}")
+    for field, value in fields.items():
+        setattr(job, field, value)
+
+
+def save_checkpoint(job, token, stage, **checkpoint):
+    update_job(job, token, stage=stage, checkpoint=checkpoint)
+
+
+def release_job(job, token, status, **fields):
+    """
+    Leave in_progress for status and drop the lease, returning False if the
+    lease was already lost.
+    """
+    fields["updated_at"] = timezone.now()
+    released = ScrapingJob.objects.filter(
+        id=job.id, status="in_progress", lease_owner=token
+    ).update(status=status, lease_owner=None, lease_expires_at=None, **fields)
+    if released:
+        job.status = status
+        for field, value in fields.items():
+            setattr(job, field, value)
+    return bool(released)
+
+
+class Heartbeat:
+    """
+    Renew a job's lease from a background thread while the worker is busy
+    in a long blocking call such as a browser scrape. A lost lease is noticed
+    by the worker at its next checkpoint.
+
+    Given the job's normalized URL, it also keeps the job's singleflight key
+    from expiring under a scrape that runs longer than FLIGHT_TTL.
+    """
+
+    def __init__(self, job_id, token, interval=HEARTBEAT_INTERVAL, normalized_url=None):
+        self.job_id = job_id
+        self.token = token
+        self.normalized_url = normalized_url
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        return False
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                now = timezone.now()
+                renewed = ScrapingJob.objects.filter(
+                    id=self.job_id, status="in_progress", lease_owner=self.token
+                ).update(heartbeat_at=now, lease_expires_at=now + LEASE_DURATION)
+                if not renewed:
+                    logger.warning(f"Lost the lease of scraping job {self.job_id}")
+                    return
+                try:
+                    refresh_flight(self.normalized_url, self.job_id)
+                except RedisError as e:
+                    logger.warning(
+                        f"Could not refresh the flight of {self.job_id}: {e}"
+                    )
+        finally:
+            # The thread has its own database connection
+            connection.close()
+
+
+def reap_expired_jobs():
+    """
+    Requeue in_progress jobs whose worker stopped renewing their lease, so
+    they resume from their last checkpoint, and fail the ones that ran out
+    of attempts. Returns the number of jobs requeued.
+    """
+    now = timezone.now()
+    expired = ScrapingJob.objects.filter(
+        Q(lease_expires_at__lt=now)
+        # Jobs started before leases existed
+        | Q(lease_expires_at__isnull=True, updated_at__lt=now - LEASE_DURATION),
+        status="in_progress",
+    )
+
+    requeued = 0
+    for job in expired:
+        stale = ScrapingJob.objects.filter(
+            id=job.id, status="in_progress", lease_owner=job.lease_owner
+        )
+        if job.attempts >= MAX_ATTEMPTS:
+            if stale.update(
+                status="failed", lease_owner=None, lease_expires_at=None, updated_at=now
+            ):
+                job.status = "failed"
+                message = f"Gave up after {job.attempts} attempts"
+                ProgressPublisher(
+                    job.id, user_id=job.user_id, batch_id=job.batch_id
+                ).publish("failed", message=message)
+                finish_job(job, message)
+            continue
+
+        if stale.update(
+            status="pending", lease_owner=None, lease_expires_at=None, updated_at=now
+        ):
+            logger.warning(f"Requeuing scraping job {job.id} from stage {job.stage}")
+            send_job(job, job.checkpoint.get("source"))
+            requeued += 1
+
+    return requeued
@@ -0,0 +1,114 @@
+import gc
+import resource
+import time
+import tracemalloc
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+from sitescrapers.archive import load_pages
+from sitescrapers.models import ArchivedPage, Property
+from utils import extraction
+from utils.registry import resolve
+
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the memory the extractors allocate and retain per scrape, "
+        "over archived pages or saved HTML files"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source", choices=[source for source, _ in Property.PROPERTY_SOURCES]
+        )
+        parser.add_argument("--limit", type=int, default=50)
+        parser.add_argument(
+            "--file",
+            action="append",
+            default=[],
+            help="HTML file to extract as a listing's main page, needs --url",
+        )
+        parser.add_argument("--url", help="Listing URL the --file pages belong to")
+        parser.add_argument(
+            "--large-page-size",
+            type=int,
+            default=extraction.LARGE_PAGE_SIZE,
+            help="Size in bytes above which pages are pruned before parsing",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=1,
+            help="Extract each scrape this many times, to show retained growth",
+        )
+
+    def get_scrapes(self, options):
+        if options["file"]:
+            if not options["url"]:
+                raise CommandError("--file needs --url")
+            for path in options["file"]:
+                with open(path, encoding="utf-8") as html_file:
+                    yield options["url"], options["source"], {"main": html_file.read()}
+            return
+
+        archived = ArchivedPage.objects.order_by("-captured_at")
+        if options["source"]:
+            archived = archived.filter(source=options["source"])
+        for url, source, storage_key, dictionary_id in archived.values_list(
+            "url", "source", "storage_key", "dictionary_id"
+        )[: options["limit"]]:
+            yield url, source, load_pages(storage_key, dictionary_id)
+
+    def measure(self, plugin, url, pages):
+        gc.collect()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        started = time.perf_counter()
+        data = plugin.extract(url, pages)
+        elapsed = time.perf_counter() - started
+        del data
+        # Only what the cyclic collector can't reclaim counts as retained
+        gc.collect()
+        after, peak = tracemalloc.get_traced_memory()
+        return peak - before, after - before, elapsed
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        extraction.LARGE_PAGE_SIZE = options["large_page_size"]
+        totals = {"scrapes": 0, "peak": 0, "retained": 0, "elapsed": 0.0}
+
+        tracemalloc.start()
+        try:
+            for url, source, pages in self.get_scrapes(options):
+                plugin = resolve(url, source)
+                size = sum(len(html) for html in pages.values())
+                for _ in range(options["repeat"]):
+                    try:
+                        peak, retained, elapsed = self.measure(plugin, url, pages)
+                    except Exception as e:
+                        self.stderr.write(f"{url}: {e}")
+                        break
+                    totals["scrapes"] += 1
+                    totals["peak"] = max(totals["peak"], peak)
+                    totals["retained"] += retained
+                    totals["elapsed"] += elapsed
+                    self.stdout.write(
+                        f"{url}: {size / MB:.1f}MB of HTML, peak {peak / MB:.1f}MB, "
+                        f"retained {retained / 1024:.0f}KB, {elapsed:.2f}s"
+                    )
+        finally:
+            tracemalloc.stop()
+
+        if not totals["scrapes"]:
+            raise CommandError("No pages to extract")
+        # ru_maxrss is in kilobytes on Linux
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{totals['scrapes']} extractions: peak {totals['peak'] / MB:.1f}MB, "
+                f"retained {totals['retained'] / 1024:.0f}KB in total, "
+                f"{totals['elapsed'] / totals['scrapes']:.2f}s each, "
+                f"max RSS {max_rss:.0f}MB"
+            )
+        )
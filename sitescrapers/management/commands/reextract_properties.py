@@ -0,0 +1,135 @@
+import json
+import os
+import time
+from collections import Counter
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from sitescrapers.archive import (
+    get_latest_archived_pages,
+    get_listing_changes,
+    reextract_in_pool,
+)
+from sitescrapers.models import Property
+from sitescrapers.persistence import update_extracted_fields
+
+DEFAULT_CHECKPOINT = ".reextract_properties.json"
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-extracts every listing from its latest archived pages and updates "
+        "the fields that changed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source", choices=[source for source, _ in Property.PROPERTY_SOURCES]
+        )
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=200,
+            help="Listings per unit of work handed to a worker",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=DEFAULT_CHECKPOINT,
+            help="File recording the last listing id done, for --resume",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue after the listing recorded in the checkpoint file",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Count the changes without saving them",
+        )
+
+    def read_checkpoint(self, path):
+        try:
+            with open(path) as checkpoint_file:
+                return json.load(checkpoint_file)
+        except (OSError, ValueError):
+            return {"last_id": 0, "counts": {}}
+
+    def write_checkpoint(self, path, last_id, counts):
+        # Written to a temporary file and renamed, so a crash can't leave
+        # half a checkpoint behind
+        with open(f"{path}.tmp", "w") as checkpoint_file:
+            json.dump({"last_id": last_id, "counts": counts}, checkpoint_file)
+        os.replace(f"{path}.tmp", path)
+
+    def get_chunks(self, listings, after_id, chunk_size):
+        """
+        Yield ((last id, listing count), archive rows) per chunk of listings
+        in id order, walking the table by id rather than with an offset.
+        """
+        while True:
+            chunk = list(
+                listings.filter(id__gt=after_id)
+                .order_by("id")
+                .values_list("id", "url")[:chunk_size]
+            )
+            if not chunk:
+                return
+            after_id = chunk[-1][0]
+            yield (after_id, len(chunk)), get_latest_archived_pages(
+                [url for _, url in chunk]
+            )
+
+    def save_changes(self, results, counts, dry_run):
+        changes, missing = get_listing_changes(results)
+        failed = sum(1 for _, _, error in results if error)
+        counts["failed"] += failed
+        counts["extracted"] += len(results) - failed - len(missing)
+        counts["changed"] += len(changes)
+        for _, _, changed_fields in changes:
+            for name in changed_fields:
+                counts[f"field:{name}"] += 1
+
+        if not dry_run:
+            update_extracted_fields(changes)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        listings = Property.objects.all()
+        if options["source"]:
+            listings = listings.filter(source=options["source"])
+
+        checkpoint = {"last_id": 0, "counts": {}}
+        if options["resume"]:
+            checkpoint = self.read_checkpoint(options["checkpoint"])
+        counts = Counter(checkpoint["counts"])
+        total = listings.count()
+        done = listings.filter(id__lte=checkpoint["last_id"]).count()
+        chunks = self.get_chunks(listings, checkpoint["last_id"], options["chunk_size"])
+
+        started = time.monotonic()
+        processed = 0
+        # Chunks come back in submission order, so the checkpoint never
+        # skips one
+        for (last_id, size), results in reextract_in_pool(chunks, options["workers"]):
+            self.save_changes(results, counts, options["dry_run"])
+            processed += size
+            if not options["dry_run"]:
+                self.write_checkpoint(options["checkpoint"], last_id, counts)
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"{done + processed}/{total} listings, "
+                f"{processed / elapsed:.0f}/s, {counts['changed']} changed, "
+                f"{counts['failed']} failed"
+            )
+
+        for key, count in sorted(counts.items()):
+            if key.startswith("field:"):
+                self.stdout.write(f"  {key[6:]}: {count}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{counts['extracted']} re-extracted, {counts['changed']} changed, "
+                f"{counts['failed']} failed"
+            )
+        )
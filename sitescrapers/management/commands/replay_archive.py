@@ -0,0 +1,104 @@
+import os
+from collections import Counter
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+from more_itertools import chunked
+from sitescrapers.archive import get_listing_changes, reextract_in_pool
+from sitescrapers.models import ArchivedPage, Property
+from sitescrapers.persistence import update_extracted_fields
+from utils.normalize import get_day_start
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-runs the current extractors over the latest archived pages of each listing"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source", choices=[source for source, _ in Property.PROPERTY_SOURCES]
+        )
+        parser.add_argument("--url", help="Only replay this listing")
+        parser.add_argument(
+            "--since", help="Only replay pages captured on or after YYYY-MM-DD"
+        )
+        parser.add_argument("--limit", type=int)
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Archived scrapes per unit of work handed to a worker",
+        )
+        parser.add_argument(
+            "--save",
+            action="store_true",
+            help=(
+                "Save the changed fields of existing listings instead of only "
+                "reporting them"
+            ),
+        )
+
+    def get_archived_pages(self, options):
+        archived = ArchivedPage.objects.all()
+        if options["source"]:
+            archived = archived.filter(source=options["source"])
+        if options["url"]:
+            archived = archived.filter(url=options["url"])
+        if options["since"]:
+            archived = archived.filter(
+                captured_at__gte=get_day_start(parse_date(options["since"]))
+            )
+        # The latest capture of each listing
+        archived = archived.order_by("url", "-captured_at").distinct("url")
+        if options["limit"]:
+            archived = archived[: options["limit"]]
+        return archived.values_list(
+            "id", "url", "source", "storage_key", "dictionary_id"
+        ).iterator()
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        counts = Counter()
+        field_counts = Counter()
+        batches = (
+            (None, batch)
+            for batch in chunked(
+                self.get_archived_pages(options), options["batch_size"]
+            )
+        )
+
+        for _, results in reextract_in_pool(batches, options["workers"]):
+            failed = [(url, error) for url, _, error in results if error]
+            for url, error in failed:
+                self.stderr.write(f"{url}: {error}")
+            counts["failed"] += len(failed)
+            counts["extracted"] += len(results) - len(failed)
+
+            changes, missing = get_listing_changes(results)
+            # Only listings already scraped are updated from replays
+            counts["missing"] += len(missing)
+            for url in missing:
+                self.stdout.write(f"{url}: not saved as a listing")
+            counts["changed"] += len(changes)
+            for listing, _, changed_fields in changes:
+                field_counts.update(changed_fields)
+                if not options["save"]:
+                    self.stdout.write(f"{listing.url}: {', '.join(changed_fields)}")
+
+            if options["save"]:
+                update_extracted_fields(changes)
+
+            self.stdout.write(
+                f"Replayed {counts['extracted'] + counts['failed']} scrapes"
+            )
+
+        for field, count in field_counts.most_common():
+            self.stdout.write(f"  {field}: {count}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{counts['extracted']} extracted, {counts['changed']} changed, "
+                f"{counts['missing']} not saved as listings, {counts['failed']} failed"
+            )
+        )
@@ -0,0 +1,34 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from sitescrapers.matching import get_blocking_key, resolve_all
+from sitescrapers.models import Property
+from utils.normalize import extract_postcode
+
+
+class Command(BaseCommand):
+    help = "Links listings of the same property across portals to a canonical property"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild-keys",
+            action="store_true",
+            help="Recompute postcodes and blocking keys before matching",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["rebuild_keys"]:
+            listings = []
+            for listing in Property.objects.only("id", "address", "price").iterator():
+                listing.postcode = extract_postcode(listing.address)
+                listing.blocking_key = get_blocking_key(listing.postcode, listing.price)
+                listings.append(listing)
+            Property.objects.bulk_update(
+                listings, ["postcode", "blocking_key"], batch_size=1000
+            )
+            self.stdout.write(f"Rebuilt blocking keys for {len(listings)} listings")
+
+        changed = resolve_all()
+        self.stdout.write(
+            self.style.SUCCESS(f"Linked {changed} listings to canonical properties")
+        )
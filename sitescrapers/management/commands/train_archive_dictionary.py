@@ -0,0 +1,41 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+from sitescrapers.archive import DICTIONARY_SAMPLES, DICTIONARY_SIZE, train_dictionary
+from sitescrapers.models import Property
+
+
+class Command(BaseCommand):
+    help = (
+        "Trains the zstd dictionary new archived pages of a portal are compressed with"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "source", choices=[source for source, _ in Property.PROPERTY_SOURCES]
+        )
+        parser.add_argument(
+            "--samples",
+            type=int,
+            default=DICTIONARY_SAMPLES,
+            help="Number of recent archived scrapes to train on",
+        )
+        parser.add_argument(
+            "--size",
+            type=int,
+            default=DICTIONARY_SIZE,
+            help="Dictionary size in bytes",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        try:
+            dictionary = train_dictionary(
+                options["source"], options["samples"], options["size"]
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Trained {dictionary} on {dictionary.sample_count} scrapes"
+            )
+        )
@@ -0,0 +1,186 @@
+import math
+from collections import defaultdict
+
+import Levenshtein
+from django.db import transaction
+from sitescrapers.models import CanonicalProperty, Property
+from utils.normalize import get_outcode, normalize_address
+
+# Listings are only compared with others in the same outcode and in the same or
+# a neighbouring price band, each band being roughly 5% wide.
+PRICE_BAND_RATIO = 1.05
+MATCH_THRESHOLD = 0.85
+
+MATCH_FIELDS = (
+    "id",
+    "address",
+    "postcode",
+    "bedrooms",
+    "bathrooms",
+    "blocking_key",
+    "canonical_id",
+)
+
+
+def price_band(price):
+    if not price or price <= 0:
+        return None
+    return int(math.log(float(price)) / math.log(PRICE_BAND_RATIO))
+
+
+def get_blocking_key(postcode, price):
+    """
+    Build the blocking key used to find candidate duplicates, e.g. 'NW8:265'.
+    """
+    outcode = get_outcode(postcode)
+    band = price_band(price)
+    if not outcode or band is None:
+        return None
+    return f"{outcode}:{band}"
+
+
+def neighbouring_keys(key):
+    outcode, band = key.rsplit(":", 1)
+    band = int(band)
+    return [f"{outcode}:{b}" for b in (band - 1, band, band + 1)]
+
+
+def match_score(a, b):
+    """
+    Score from 0 to 1 how likely two listings are the same property.
+    """
+    if a.bedrooms is not None and b.bedrooms is not None and a.bedrooms != b.bedrooms:
+        return 0.0
+
+    score = 0.7 * Levenshtein.ratio(
+        normalize_address(a.address), normalize_address(b.address)
+    )
+    if a.bedrooms is not None and a.bedrooms == b.bedrooms:
+        score += 0.2
+    if a.bathrooms is not None and a.bathrooms == b.bathrooms:
+        score += 0.1
+    # Only some portals show the full postcode, but it is decisive when they do
+    if a.postcode and " " in a.postcode and a.postcode == b.postcode:
+        score += 0.1
+    return min(score, 1.0)
+
+
+def create_canonical(listing):
+    return CanonicalProperty.objects.create(
+        address=listing.address,
+        postcode=listing.postcode,
+        bedrooms=listing.bedrooms,
+        bathrooms=listing.bathrooms,
+    )
+
+
+@transaction.atomic
+def resolve_listing(listing):
+    """
+    Link a single listing to the canonical property of its best match, or to a
+    new canonical property if nothing in its block matches.
+    """
+    best_match, best_score = None, 0.0
+    if listing.blocking_key:
+        candidates = (
+            Property.objects.filter(
+                blocking_key__in=neighbouring_keys(listing.blocking_key)
+            )
+            .exclude(id=listing.id)
+            .only(*MATCH_FIELDS)
+        )
+        for candidate in candidates:
+            score = match_score(listing, candidate)
+            if score > best_score:
+                best_match, best_score = candidate, score
+
+    if best_match and best_score >= MATCH_THRESHOLD:
+        if best_match.canonical_id is None:
+            best_match.canonical = create_canonical(best_match)
+            best_match.save(update_fields=["canonical"])
+        canonical = best_match.canonical
+        previous_id = listing.canonical_id
+        if previous_id and previous_id != canonical.id:
+            # The listing was its own entity so far, fold that entity in
+            Property.objects.filter(canonical_id=previous_id).update(
+                canonical=canonical
+            )
+            CanonicalProperty.objects.filter(
+                id=previous_id, listings__isnull=True
+            ).delete()
+    elif listing.canonical_id:
+        return listing.canonical
+    else:
+        canonical = create_canonical(listing)
+
+    listing.canonical = canonical
+    listing.save(update_fields=["canonical"])
+    return canonical
+
+
+class _DisjointSet:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        self.parent.setdefault(item, item)
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+@transaction.atomic
+def resolve_all(queryset=None, batch_size=1000):
+    """
+    Cluster every listing into canonical properties.
+
+    Listings are bucketed by blocking key first, so each listing is only scored
+    against the handful of listings in its own and neighbouring buckets.
+    """
+    queryset = queryset if queryset is not None else Property.objects.all()
+    listings = {
+        listing.id: listing for listing in queryset.only(*MATCH_FIELDS).iterator()
+    }
+
+    blocks = defaultdict(list)
+    for listing in listings.values():
+        if listing.blocking_key:
+            blocks[listing.blocking_key].append(listing)
+
+    clusters = _DisjointSet()
+    for listing in listings.values():
+        clusters.find(listing.id)
+        if not listing.blocking_key:
+            continue
+        for key in neighbouring_keys(listing.blocking_key):
+            for candidate in blocks.get(key, ()):
+                if (
+                    candidate.id < listing.id
+                    and match_score(listing, candidate) >= MATCH_THRESHOLD
+                ):
+                    clusters.union(listing.id, candidate.id)
+
+    members = defaultdict(list)
+    for listing_id in listings:
+        members[clusters.find(listing_id)].append(listings[listing_id])
+
+    changed = []
+    for root_id, group in members.items():
+        existing = sorted(m.canonical_id for m in group if m.canonical_id)
+        canonical_id = (
+            existing[0] if existing else create_canonical(listings[root_id]).id
+        )
+        for member in group:
+            if member.canonical_id != canonical_id:
+                member.canonical_id = canonical_id
+                changed.append(member)
+
+    Property.objects.bulk_update(changed, ["canonical"], batch_size=batch_size)
+    CanonicalProperty.objects.filter(listings__isnull=True).delete()
+    return len(changed)
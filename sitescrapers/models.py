@@ -1,5 +1,25 @@
+from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
+from django.utils import timezone
+from utils.normalize import get_outcode
+
+
+class CanonicalProperty(models.Model):
+    """
+    A single real-world property that may be listed on several portals.
+    """
+
+    address = models.TextField()
+    postcode = models.CharField(max_length=10, null=True, blank=True, db_index=True)
+    bedrooms = models.PositiveIntegerField(null=True, blank=True)
+    bathrooms = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.address
 
 
 class Property(models.Model):
@@ -8,11 +28,17 @@ class Property(models.Model):
         ("zoopla", "Zoopla"),
         ("onthemarket", "OnTheMarket"),
     ]
+    LISTING_STATUSES = [
+        ("available", "Available"),
+        ("under_offer", "Under offer"),
+        ("sold", "Sold"),
+        ("let_agreed", "Let agreed"),
+    ]
 
     source = models.CharField(max_length=20, choices=PROPERTY_SOURCES)
     url = models.URLField(unique=True)
     address = models.TextField()
-    price = models.DecimalField(max_digits=12, decimal_places=2)
+    price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     bedrooms = models.PositiveIntegerField(null=True, blank=True)
     bathrooms = models.PositiveIntegerField(null=True, blank=True)
     size = models.CharField(max_length=50, null=True, blank=True)
@@ -21,6 +47,24 @@ class Property(models.Model):
     description = models.TextField()
     images = ArrayField(models.URLField(), blank=True)
     floorplans = ArrayField(models.URLField(), blank=True)
+    image_derivatives = models.JSONField(default=dict, blank=True)
+    time_on_market = models.CharField(max_length=100, null=True, blank=True)
+    payload_hash = models.CharField(max_length=40, null=True, blank=True)
+    postcode = models.CharField(max_length=10, null=True, blank=True)
+    blocking_key = models.CharField(max_length=32, null=True, blank=True, db_index=True)
+    listing_status = models.CharField(
+        max_length=20, choices=LISTING_STATUSES, default="available"
+    )
+    # updated_at also moves on derivative and linking saves, this only on scrapes
+    last_scraped_at = models.DateTimeField(null=True, blank=True)
+    next_refresh_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    canonical = models.ForeignKey(
+        CanonicalProperty,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="listings",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -28,23 +72,244 @@ class Property(models.Model):
         return f"{self.source} - {self.address}"
 
 
+class PropertySnapshot(models.Model):
+    """
+    Append-only history of a property's price and time on market.
+
+    A row is only written when the normalised scrape result changes, so the
+    table grows with actual changes rather than with every re-scrape.
+    """
+
+    property = models.ForeignKey(
+        Property, on_delete=models.CASCADE, related_name="snapshots"
+    )
+    captured_at = models.DateTimeField(default=timezone.now)
+    price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    outcode = models.CharField(max_length=4, null=True, blank=True)
+    time_on_market = models.CharField(max_length=100, null=True, blank=True)
+    payload_hash = models.CharField(max_length=40)
+
+    class Meta:
+        indexes = [
+            # Rows arrive in time order, so a BRIN index stays tiny
+            BrinIndex(fields=["captured_at"]),
+            models.Index(fields=["property", "captured_at"]),
+            models.Index(fields=["outcode", "captured_at"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Property snapshots are append-only")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.property_id} @ {self.captured_at:%Y-%m-%d %H:%M} - {self.price}"
+
+
+class ArchiveDictionary(models.Model):
+    """
+    A zstd dictionary trained on one portal's pages. Listing pages of a portal
+    share most of their markup, so a dictionary shrinks them far more than
+    compressing each page on its own.
+    """
+
+    source = models.CharField(max_length=20, choices=Property.PROPERTY_SOURCES)
+    data = models.BinaryField()
+    sample_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["source", "-created_at"])]
+
+    def __str__(self):
+        return f"{self.source} dictionary {self.id} ({len(self.data)} bytes)"
+
+
+class ArchivedPage(models.Model):
+    """
+    The raw HTML a scrape read, stored compressed in media storage so the
+    listing can be re-extracted without fetching it again.
+
+    One row per scrape, the blob holds every page of it by name (e.g. the
+    Rightmove main, images and floorplans pages).
+    """
+
+    url = models.URLField(db_index=True)
+    source = models.CharField(max_length=20, choices=Property.PROPERTY_SOURCES)
+    captured_at = models.DateTimeField(default=timezone.now)
+    storage_key = models.CharField(max_length=255)
+    # Pages compressed without a dictionary have none
+    dictionary = models.ForeignKey(
+        ArchiveDictionary, on_delete=models.PROTECT, null=True, blank=True
+    )
+    content_hash = models.CharField(max_length=40)
+    raw_size = models.PositiveIntegerField()
+    compressed_size = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            BrinIndex(fields=["captured_at"]),
+            models.Index(fields=["url", "-captured_at"]),
+            models.Index(fields=["source", "id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.url} @ {self.captured_at:%Y-%m-%d %H:%M}"
+
+
 class ScrapingJob(models.Model):
     JOB_STATUS_CHOICES = [
         ("pending", "Pending"),
         ("in_progress", "In Progress"),
         ("completed", "Completed"),
         ("failed", "Failed"),
+        ("superseded", "Superseded"),
+    ]
+    TERMINAL_STATUSES = ("completed", "failed", "superseded")
+
+    # Stages a job has completed, in order. A resumed job skips the stages it
+    # already checkpointed.
+    STAGE_QUEUED = "queued"
+    STAGE_SCRAPED = "scraped"
+    STAGE_SAVED = "saved"
+    STAGES = [STAGE_QUEUED, STAGE_SCRAPED, STAGE_SAVED]
+    STAGE_CHOICES = [
+        (STAGE_QUEUED, "Queued"),
+        (STAGE_SCRAPED, "Scraped"),
+        (STAGE_SAVED, "Saved"),
+    ]
+
+    # Celery priorities, 0 is served first
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_REFRESH = 5
+    PRIORITY_BACKFILL = 9
+    PRIORITY_CHOICES = [
+        (PRIORITY_INTERACTIVE, "Interactive"),
+        (PRIORITY_REFRESH, "Scheduled refresh"),
+        (PRIORITY_BACKFILL, "Backfill"),
     ]
 
     url = models.URLField()
+    normalized_url = models.CharField(
+        max_length=500, null=True, blank=True, db_index=True
+    )
     status = models.CharField(
         max_length=20, choices=JOB_STATUS_CHOICES, default="pending"
     )
+    priority = models.PositiveSmallIntegerField(
+        choices=PRIORITY_CHOICES, default=PRIORITY_INTERACTIVE
+    )
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES, default=STAGE_QUEUED)
+    # Output of the last completed stage, e.g. the scraped data before saving
+    checkpoint = models.JSONField(default=dict, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # The worker running the job holds a lease it renews with heartbeats, a
+    # job whose lease expired is requeued by reap_expired_jobs
+    lease_owner = models.CharField(max_length=64, null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    # Set when this job shares the execution of another job for the same URL
+    leader = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="followers",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     property = models.ForeignKey(
         Property, on_delete=models.SET_NULL, null=True, blank=True
     )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    batch_id = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+
+    class Meta:
+        # plan_refreshes skips listings with an active job for their URL
+        indexes = [models.Index(fields=["url", "status"])]
 
     def __str__(self):
         return f"Job for {self.url} - {self.status}"
+
+    def has_reached(self, stage):
+        return self.STAGES.index(self.stage) >= self.STAGES.index(stage)
+
+
+class SavedSearch(models.Model):
+    """
+    Listing criteria a user wants to be notified about. Empty criteria match
+    anything.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="saved_searches",
+    )
+    name = models.CharField(max_length=100)
+    source = models.CharField(
+        max_length=20, choices=Property.PROPERTY_SOURCES, null=True, blank=True
+    )
+    outcode = models.CharField(max_length=4, null=True, blank=True)
+    min_price = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True
+    )
+    max_price = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True
+    )
+    min_bedrooms = models.PositiveIntegerField(null=True, blank=True)
+    max_bedrooms = models.PositiveIntegerField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def matches_property(self, property_instance):
+        price = property_instance.price
+        bedrooms = property_instance.bedrooms
+        outcode = get_outcode(property_instance.postcode)
+        return (
+            (not self.source or self.source == property_instance.source)
+            and (not self.outcode or self.outcode.upper() == outcode)
+            and (
+                self.min_price is None
+                or (price is not None and price >= self.min_price)
+            )
+            and (
+                self.max_price is None
+                or (price is not None and price <= self.max_price)
+            )
+            and (
+                self.min_bedrooms is None
+                or (bedrooms is not None and bedrooms >= self.min_bedrooms)
+            )
+            and (
+                self.max_bedrooms is None
+                or (bedrooms is not None and bedrooms <= self.max_bedrooms)
+            )
+        )
+
+    def __str__(self):
+        return f"{self.name} ({self.user_id})"
+
+
+class SavedSearchMatch(models.Model):
+    search = models.ForeignKey(
+        SavedSearch, on_delete=models.CASCADE, related_name="matches"
+    )
+    property = models.ForeignKey(
+        Property, on_delete=models.CASCADE, related_name="search_matches"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    notified_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["search", "property"], name="unique_saved_search_match"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.search_id} -> {self.property_id}"
@@ -0,0 +1,122 @@
+import hashlib
+import json
+
+from django.db import transaction
+from django.utils import timezone
+from sitescrapers.matching import get_blocking_key, resolve_listing
+from sitescrapers.models import Property, PropertySnapshot
+from sitescrapers.refresh import get_next_refresh_at
+from utils.normalize import (
+    extract_postcode,
+    get_outcode,
+    parse_int,
+    parse_listing_status,
+    parse_price,
+)
+
+
+def normalize_property_data(data):
+    """
+    Convert the raw strings returned by the scrapers into model field values.
+    """
+    address = data.get("address") or ""
+    price = parse_price(data.get("price"))
+    postcode = extract_postcode(address)
+    return {
+        "address": address,
+        "price": price,
+        "bedrooms": parse_int(data.get("bedrooms")),
+        "bathrooms": parse_int(data.get("bathrooms")),
+        "size": data.get("size"),
+        "house_type": data.get("house_type") or "",
+        "agent": data.get("agent") or "",
+        "description": data.get("description") or "",
+        "images": data.get("images") or [],
+        "floorplans": data.get("floorplans") or [],
+        "time_on_market": data.get("time_on_market"),
+        "listing_status": parse_listing_status(
+            data.get("listing_status"), data.get("price"), data.get("time_on_market")
+        ),
+        "postcode": postcode,
+        "blocking_key": get_blocking_key(postcode, price),
+    }
+
+
+def get_changed_fields(property_instance, fields):
+    """
+    Return the names of the normalised fields that differ from a property.
+    """
+    return [
+        name
+        for name, value in fields.items()
+        if getattr(property_instance, name) != value
+    ]
+
+
+def get_payload_hash(fields):
+    payload = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def update_extracted_fields(changes):
+    """
+    Write re-extracted fields to existing listings, given (listing, fields,
+    changed field names) for each. Nothing was fetched, so no snapshot is
+    recorded, last_scraped_at is kept and saved searches aren't matched.
+    """
+    # Group the listings by the fields that changed, so each UPDATE only
+    # writes those
+    grouped = {}
+    for listing, fields, changed_fields in changes:
+        for name in changed_fields:
+            setattr(listing, name, fields[name])
+        listing.payload_hash = get_payload_hash(fields)
+        grouped.setdefault(tuple(changed_fields), []).append(listing)
+
+    with transaction.atomic():
+        for changed_fields, listings in grouped.items():
+            Property.objects.bulk_update(
+                listings, [*changed_fields, "payload_hash"], batch_size=500
+            )
+
+
+@transaction.atomic
+def save_property_data(data, source, url):
+    """
+    Create or refresh the property for a URL, record a snapshot if anything
+    changed and link it to its canonical entity.
+    """
+    fields = normalize_property_data(data)
+    payload_hash = get_payload_hash(fields)
+    previous_hash = (
+        Property.objects.filter(url=url).values_list("payload_hash", flat=True).first()
+    )
+
+    property_instance, _ = Property.objects.update_or_create(
+        url=url,
+        defaults={
+            "source": source,
+            "payload_hash": payload_hash,
+            "last_scraped_at": timezone.now(),
+            **fields,
+        },
+    )
+    if previous_hash != payload_hash:
+        PropertySnapshot.objects.create(
+            property=property_instance,
+            price=fields["price"],
+            outcode=get_outcode(fields["postcode"]),
+            time_on_market=fields["time_on_market"],
+            payload_hash=payload_hash,
+        )
+
+        # New or changed listings are checked against the saved searches
+        from sitescrapers.tasks import match_saved_searches
+
+        transaction.on_commit(lambda: match_saved_searches.delay(property_instance.id))
+
+    property_instance.next_refresh_at = get_next_refresh_at(property_instance)
+    property_instance.save(update_fields=["next_refresh_at"])
+
+    resolve_listing(property_instance)
+    return property_instance
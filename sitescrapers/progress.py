@@ -0,0 +1,164 @@
+import asyncio
+import json
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from pascraper.config.redis_client import get_redis
+
+# Events kept per job so a reconnecting client can catch up
+REPLAY_BUFFER_SIZE = 100
+REPLAY_BUFFER_TTL = 60 * 60 * 24
+
+# Progress events closer together than this are coalesced into the latest
+# one, which is sent once the interval has passed
+COALESCE_INTERVAL = 0.5
+
+TERMINAL_STATUSES = ("completed", "failed", "superseded")
+
+EVENTS_KEY = "job-events:{job_id}"
+SEQUENCE_KEY = "job-events:{job_id}:seq"
+
+
+def job_group(job_id):
+    return f"job_{job_id}"
+
+
+def user_group(user_id):
+    return f"user_{user_id}"
+
+
+def batch_group(user_id, batch_id):
+    # Batch ids are picked by clients, so they are scoped to their owner
+    return f"batch_{user_id}_{batch_id}"
+
+
+def get_replay(job_id, after_seq=0):
+    """
+    Return the buffered events of a job with a sequence number above after_seq.
+    """
+    events = [
+        json.loads(raw)
+        for raw in get_redis().lrange(EVENTS_KEY.format(job_id=job_id), 0, -1)
+    ]
+    return [event for event in events if event["seq"] > after_seq]
+
+
+class ProgressPublisher:
+    """
+    Publish the progress of one scraping job to its channel-layer groups.
+
+    Every event goes to the job group and, when known, the owner's user group
+    and the batch group. Clients subscribed to several of them can drop
+    duplicates by (job_id, seq).
+    """
+
+    def __init__(self, job_id, user_id=None, batch_id=None):
+        self.job_id = job_id
+        self.groups = [job_group(job_id)]
+        if user_id:
+            self.groups.append(user_group(user_id))
+        if batch_id:
+            self.groups.append(batch_group(user_id, batch_id))
+        self.channel_layer = get_channel_layer()
+        self.last_sent = 0.0
+        self.pending = None
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def publish(self, status, stage=None, **data):
+        event = {
+            "job_id": self.job_id,
+            "status": status,
+            "stage": stage,
+            "data": data,
+            "ts": time.time(),
+        }
+
+        with self.lock:
+            # Hold back bursts of progress events, only the latest one matters
+            wait = self.last_sent + COALESCE_INTERVAL - event["ts"]
+            if status == "progress" and wait > 0:
+                self.pending = event
+                if self.timer is None:
+                    self.timer = threading.Timer(wait, self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+
+            self.cancel_timer()
+            # A newer progress event replaces the held one, any other event
+            # (e.g. the terminal one) is sent after it
+            if self.pending and status != "progress":
+                self.send(self.pending)
+            self.pending = None
+            self.send(event)
+
+    def flush(self):
+        """
+        Send the held progress event once the coalescing interval is over.
+        """
+        with self.lock:
+            self.timer = None
+            if self.pending:
+                event, self.pending = self.pending, None
+                self.send(event)
+
+    def cancel_timer(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+    def send(self, event):
+        redis = get_redis()
+        event["seq"] = redis.incr(SEQUENCE_KEY.format(job_id=self.job_id))
+
+        events_key = EVENTS_KEY.format(job_id=self.job_id)
+        pipeline = redis.pipeline()
+        pipeline.rpush(events_key, json.dumps(event))
+        pipeline.ltrim(events_key, -REPLAY_BUFFER_SIZE, -1)
+        pipeline.expire(events_key, REPLAY_BUFFER_TTL)
+        pipeline.expire(SEQUENCE_KEY.format(job_id=self.job_id), REPLAY_BUFFER_TTL)
+        pipeline.execute()
+
+        for group in self.groups:
+            async_to_sync(self.channel_layer.group_send)(
+                group, {"type": "job.progress", "event": event}
+            )
+        self.last_sent = event["ts"]
+
+
+class JobSubscription:
+    """
+    Receive the events of one job on a channel of its own, for HTTP clients
+    that wait on a job without a websocket.
+
+        async with JobSubscription(job_id) as subscription:
+            event = await subscription.receive(timeout=30)
+    """
+
+    def __init__(self, job_id):
+        self.group = job_group(job_id)
+        self.channel_layer = get_channel_layer()
+        self.channel = None
+
+    async def __aenter__(self):
+        self.channel = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(self.group, self.channel)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.channel_layer.group_discard(self.group, self.channel)
+
+    async def receive(self, timeout):
+        """
+        Return the next event, or None if none arrived within timeout seconds.
+        """
+        try:
+            message = await asyncio.wait_for(
+                self.channel_layer.receive(self.channel), timeout
+            )
+        except asyncio.TimeoutError:
+            return None
+        return message["event"]
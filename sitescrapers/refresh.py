@@ -0,0 +1,113 @@
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Exists, Min, OuterRef
+from django.utils import timezone
+from pascraper.config.logging_config import configure_logger
+from sitescrapers.models import Property, ScrapingJob
+from sitescrapers.scheduler import schedule_job
+from utils.normalize import normalize_url
+
+logger = configure_logger(__name__)
+
+MIN_REFRESH_INTERVAL = timedelta(hours=6)
+MAX_REFRESH_INTERVAL = timedelta(days=14)
+# Under offer listings usually sell or come back on the market within days
+UNDER_OFFER_REFRESH_INTERVAL = timedelta(days=2)
+# Sold and let listings are only checked for relisting
+SOLD_REFRESH_INTERVAL = timedelta(days=30)
+# Pushed back when a refresh is queued, so a failed one is retried later
+# rather than on every run. A successful scrape sets the real next refresh.
+RETRY_DELAY = timedelta(hours=12)
+
+ACTIVE_JOB_STATUSES = ("pending", "in_progress")
+
+
+def get_refresh_interval(age, changes, listing_status):
+    """
+    Pick how long to wait before re-scraping a listing.
+
+    age is the time since the listing was first seen and changes the number
+    of changes observed since then. Listings are re-scraped about twice per
+    observed change, and ones that never changed back off as they get older.
+    """
+    if listing_status in ("sold", "let_agreed"):
+        return SOLD_REFRESH_INTERVAL
+
+    interval = age / (2 * changes) if changes else age / 2
+    interval = max(MIN_REFRESH_INTERVAL, min(interval, MAX_REFRESH_INTERVAL))
+    if listing_status == "under_offer":
+        interval = min(interval, UNDER_OFFER_REFRESH_INTERVAL)
+    return interval
+
+
+def get_next_refresh_at(property_instance):
+    """
+    Compute when a property is next due for refresh from its snapshot history.
+    """
+    now = timezone.now()
+    history = property_instance.snapshots.aggregate(
+        count=Count("id"), first_seen=Min("captured_at")
+    )
+    first_seen = history["first_seen"] or property_instance.created_at or now
+    changes = max(history["count"] - 1, 0)
+    interval = get_refresh_interval(
+        now - first_seen, changes, property_instance.listing_status
+    )
+    return (property_instance.last_scraped_at or now) + interval
+
+
+def get_run_budget(daily_budget):
+    runs_per_day = timedelta(days=1).total_seconds() / settings.REFRESH_PLAN_INTERVAL
+    return math.ceil(daily_budget / runs_per_day)
+
+
+def plan_refreshes():
+    """
+    Queue refresh jobs for the listings that are due, most overdue first.
+
+    Each site gets its share of its daily budget per run, and its jobs are
+    spread over the time until the next run instead of being sent at once.
+    Returns {source: number of jobs queued}.
+    """
+    now = timezone.now()
+    active_jobs = ScrapingJob.objects.filter(
+        url=OuterRef("url"), status__in=ACTIVE_JOB_STATUSES
+    )
+    planned = {}
+
+    for source, _ in Property.PROPERTY_SOURCES:
+        budget = get_run_budget(settings.REFRESH_BUDGETS.get(source, 0))
+        if not budget:
+            continue
+
+        due = list(
+            Property.objects.filter(source=source, next_refresh_at__lte=now)
+            .exclude(Exists(active_jobs))
+            .order_by("next_refresh_at")
+            .values_list("id", "url")[:budget]
+        )
+        if not due:
+            continue
+
+        jobs = ScrapingJob.objects.bulk_create(
+            ScrapingJob(
+                url=url,
+                normalized_url=normalize_url(url),
+                priority=ScrapingJob.PRIORITY_REFRESH,
+            )
+            for _, url in due
+        )
+        Property.objects.filter(id__in=[id for id, _ in due]).update(
+            next_refresh_at=now + RETRY_DELAY
+        )
+
+        spacing = settings.REFRESH_PLAN_INTERVAL / len(jobs)
+        for index, job in enumerate(jobs):
+            schedule_job(job, source, countdown=int(index * spacing))
+
+        planned[source] = len(jobs)
+        logger.info(f"Queued {len(jobs)} {source} refreshes")
+
+    return planned
@@ -0,0 +1,192 @@
+import math
+from collections import defaultdict
+
+from accounts.tasks import send_batch_email_task
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.html import escape
+from helpers.email_templates import render_email
+from helpers.email_utils import SUPPORT_FROM_EMAIL
+from sitescrapers.models import SavedSearch, SavedSearchMatch
+from utils.normalize import get_outcode
+
+INDEX_VERSION_KEY = "saved-searches:version"
+
+# Postings under ANY hold the searches that leave a criterion empty
+ANY = "*"
+
+# Price bands grow geometrically from PRICE_BAND_BASE, so a search's price
+# range only spans a handful of postings
+PRICE_BAND_BASE = 10000
+PRICE_BAND_RATIO = 1.5
+MAX_PRICE_BAND = 20
+MAX_BEDROOMS = 6
+
+DIMENSIONS = ("source", "outcode", "price_band", "bedrooms")
+
+
+def get_price_band(price):
+    if price <= PRICE_BAND_BASE:
+        return 0
+    band = int(math.log(float(price) / PRICE_BAND_BASE, PRICE_BAND_RATIO)) + 1
+    return min(band, MAX_PRICE_BAND)
+
+
+def get_range_keys(low, high, key, maximum):
+    if low is None and high is None:
+        return [ANY]
+    low = key(low) if low is not None else 0
+    high = key(high) if high is not None else maximum
+    return list(range(low, high + 1))
+
+
+def get_search_keys(search):
+    return {
+        "source": [search.source or ANY],
+        "outcode": [search.outcode.upper() if search.outcode else ANY],
+        "price_band": get_range_keys(
+            search.min_price, search.max_price, get_price_band, MAX_PRICE_BAND
+        ),
+        "bedrooms": get_range_keys(
+            search.min_bedrooms,
+            search.max_bedrooms,
+            lambda bedrooms: min(bedrooms, MAX_BEDROOMS),
+            MAX_BEDROOMS,
+        ),
+    }
+
+
+def get_property_keys(property_instance):
+    price = property_instance.price
+    bedrooms = property_instance.bedrooms
+    return {
+        "source": property_instance.source,
+        "outcode": get_outcode(property_instance.postcode),
+        "price_band": get_price_band(price) if price is not None else None,
+        "bedrooms": min(bedrooms, MAX_BEDROOMS) if bedrooms is not None else None,
+    }
+
+
+class SavedSearchIndex:
+    """
+    Inverted index from (source, area, price band, bedrooms) to the active
+    saved searches, so a listing is only checked against the searches that
+    could match it.
+    """
+
+    def __init__(self, searches):
+        self.searches = {}
+        self.postings = {dimension: defaultdict(set) for dimension in DIMENSIONS}
+        for search in searches:
+            self.add(search)
+
+    def add(self, search):
+        self.searches[search.id] = search
+        for dimension, keys in get_search_keys(search).items():
+            for key in keys:
+                self.postings[dimension][key].add(search.id)
+
+    def candidates(self, property_instance):
+        sets = []
+        for dimension, key in get_property_keys(property_instance).items():
+            postings = self.postings[dimension]
+            ids = postings.get(ANY, set())
+            if key is not None:
+                ids = ids | postings.get(key, set())
+            if not ids:
+                return []
+            sets.append(ids)
+
+        sets.sort(key=len)
+        ids = set.intersection(*sets)
+        return [self.searches[search_id] for search_id in ids]
+
+    def match(self, property_instance):
+        return [
+            search
+            for search in self.candidates(property_instance)
+            if search.matches_property(property_instance)
+        ]
+
+
+_index = None
+_index_version = None
+
+
+def invalidate_index():
+    cache.add(INDEX_VERSION_KEY, 0, timeout=None)
+    cache.incr(INDEX_VERSION_KEY)
+
+
+def get_index():
+    """
+    Return this process's index, rebuilt when a saved search has changed.
+    """
+    global _index, _index_version
+
+    version = cache.get(INDEX_VERSION_KEY, 0)
+    if _index is None or version != _index_version:
+        _index = SavedSearchIndex(SavedSearch.objects.filter(is_active=True))
+        _index_version = version
+    return _index
+
+
+def record_matches(property_instance):
+    """
+    Store the saved searches a listing matches and return the new ones.
+    """
+    searches = get_index().match(property_instance)
+    if not searches:
+        return []
+
+    known = set(
+        SavedSearchMatch.objects.filter(
+            property=property_instance, search__in=searches
+        ).values_list("search_id", flat=True)
+    )
+    new_searches = [search for search in searches if search.id not in known]
+    SavedSearchMatch.objects.bulk_create(
+        [
+            SavedSearchMatch(search=search, property=property_instance)
+            for search in new_searches
+        ],
+        ignore_conflicts=True,
+    )
+    return new_searches
+
+
+def notify_matches(property_instance, searches):
+    """
+    Email every owner of the matched searches in one batch send.
+
+    The recipient variables are substituted into the text and HTML parts
+    alike, so the user-supplied names get an escaped copy for the HTML part.
+    """
+    recipients = {}
+    for search in SavedSearch.objects.filter(
+        id__in=[search.id for search in searches]
+    ).values("name", "user__email", "user__first_name"):
+        if not search["user__email"]:
+            continue
+        variables = recipients.setdefault(
+            search["user__email"],
+            {"first_name": search["user__first_name"] or "", "search_names": []},
+        )
+        variables["search_names"].append(search["name"])
+
+    if recipients:
+        for variables in recipients.values():
+            variables["search_names"] = ", ".join(variables["search_names"])
+            variables["first_name_html"] = escape(variables["first_name"])
+            variables["search_names_html"] = escape(variables["search_names"])
+
+        subject, text, html_content = render_email(
+            "saved_search_match", {"property": property_instance}
+        )
+        send_batch_email_task.delay(
+            recipients, subject, text, html_content, SUPPORT_FROM_EMAIL
+        )
+
+    SavedSearchMatch.objects.filter(
+        property=property_instance, search__in=searches
+    ).update(notified_at=timezone.now())
@@ -0,0 +1,179 @@
+import hashlib
+
+from django.utils import timezone
+from pascraper.config.logging_config import configure_logger
+from pascraper.config.redis_client import get_redis
+from sitescrapers.models import Property, ScrapingJob
+from sitescrapers.progress import ProgressPublisher
+from utils.registry import get_queue
+
+logger = configure_logger(__name__)
+
+# One execution per normalized URL at a time. The key holds the id of the job
+# doing the scrape and expires in case its worker dies; the job's heartbeat
+# keeps it alive while it runs.
+FLIGHT_KEY = "scrape-flight:{digest}"
+FLIGHT_TTL = 60 * 15
+# Times a job retries joining a flight that changed hands under it
+MAX_FLIGHT_ATTEMPTS = 3
+
+# Delete the flight key only if it still belongs to the finishing job
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Take the flight over from a finished leader, unless another job already did
+TAKEOVER_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("set", KEYS[1], ARGV[2], "EX", ARGV[3])
+end
+return false
+"""
+
+# Extend the flight only while the running job still holds it
+REFRESH_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("expire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def get_flight_key(normalized_url):
+    digest = hashlib.sha1(normalized_url.encode("utf-8")).hexdigest()
+    return FLIGHT_KEY.format(digest=digest)
+
+
+def send_job(job, source=None, countdown=None):
+    from sitescrapers.tasks import run_scraping_job
+
+    run_scraping_job.apply_async(
+        (job.id, source),
+        queue=get_queue(job.url, source),
+        priority=job.priority,
+        countdown=countdown,
+    )
+
+
+def schedule_job(job, source=None, countdown=None):
+    """
+    Queue a new job, or attach it to the in-flight job for the same URL so
+    both share one execution (singleflight).
+
+    A follower with a higher priority than its pending leader re-sends the
+    leader at that priority; whichever message a worker takes first runs it.
+    """
+    redis = get_redis()
+    key = get_flight_key(job.normalized_url)
+    # A delayed job holds the flight until it has had time to run
+    ttl = FLIGHT_TTL + (countdown or 0)
+    for _ in range(MAX_FLIGHT_ATTEMPTS):
+        if redis.set(key, job.id, nx=True, ex=ttl):
+            send_job(job, source, countdown)
+            return
+
+        leader_id = redis.get(key)
+        if leader_id is None:
+            # Expired since the SET, try to take it again
+            continue
+        leader = ScrapingJob.objects.filter(id=leader_id).first()
+        if leader is not None and leader.status not in ScrapingJob.TERMINAL_STATUSES:
+            break
+        # The key outlived its job, take the flight over unless another job
+        # got there first, in which case that one is followed
+        if redis.eval(TAKEOVER_SCRIPT, 1, key, leader_id, job.id, ttl):
+            send_job(job, source, countdown)
+            return
+    else:
+        # The flight kept changing hands, run this job on its own
+        logger.warning(f"Job {job.id} could not join a flight for {job.url}")
+        send_job(job, source, countdown)
+        return
+
+    job.leader = leader
+    job.save(update_fields=["leader", "updated_at"])
+    logger.info(f"Job {job.id} follows job {leader.id} for {job.normalized_url}")
+
+    if job.priority < leader.priority and leader.status == "pending":
+        ScrapingJob.objects.filter(id=leader.id).update(priority=job.priority)
+        leader.priority = job.priority
+        send_job(leader, source)
+
+    # The leader may have finished before this job was attached to it
+    leader.refresh_from_db(fields=["status", "property"])
+    if leader.status in ScrapingJob.TERMINAL_STATUSES:
+        settle_followers([leader.id], leader.status, leader.property_id)
+
+
+def release_flight(job):
+    if job.normalized_url:
+        get_redis().eval(
+            RELEASE_SCRIPT, 1, get_flight_key(job.normalized_url), str(job.id)
+        )
+
+
+def refresh_flight(normalized_url, job_id):
+    if normalized_url:
+        get_redis().eval(
+            REFRESH_SCRIPT, 1, get_flight_key(normalized_url), str(job_id), FLIGHT_TTL
+        )
+
+
+def get_fresh_property(job):
+    """
+    Return the job's property if it was scraped after a non-interactive job
+    was queued, in which case the job has nothing left to do.
+    """
+    if job.priority == ScrapingJob.PRIORITY_INTERACTIVE:
+        return None
+    return Property.objects.filter(
+        url=job.url, last_scraped_at__gte=job.created_at
+    ).first()
+
+
+def settle_followers(leader_ids, status, property_id, message=None):
+    """
+    Give the pending followers of finished jobs their leader's outcome.
+    """
+    if status == "superseded":
+        status = "completed"
+
+    followers = ScrapingJob.objects.filter(leader_id__in=leader_ids, status="pending")
+    for follower in followers:
+        settled = ScrapingJob.objects.filter(id=follower.id, status="pending").update(
+            status=status, property_id=property_id, updated_at=timezone.now()
+        )
+        if settled:
+            ProgressPublisher(
+                follower.id, user_id=follower.user_id, batch_id=follower.batch_id
+            ).publish(status, message=message, property_id=property_id)
+
+
+def finish_job(job, message=None):
+    """
+    Release a finished job's flight, settle its followers and supersede the
+    queued refresh jobs its result made redundant.
+    """
+    release_flight(job)
+    leader_ids = [job.id]
+
+    if job.status == "completed" and job.normalized_url:
+        superseded = ScrapingJob.objects.filter(
+            normalized_url=job.normalized_url,
+            status="pending",
+            leader__isnull=True,
+            priority__gt=ScrapingJob.PRIORITY_INTERACTIVE,
+        ).exclude(id=job.id)
+        superseded_ids = list(superseded.values_list("id", flat=True))
+        if superseded_ids:
+            ScrapingJob.objects.filter(id__in=superseded_ids, status="pending").update(
+                status="superseded",
+                property_id=job.property_id,
+                updated_at=timezone.now(),
+            )
+            leader_ids += superseded_ids
+
+    settle_followers(leader_ids, job.status, job.property_id, message)
@@ -0,0 +1,36 @@
+from rest_framework import serializers
+from sitescrapers.models import SavedSearch
+
+
+class SavedSearchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SavedSearch
+        fields = [
+            "id",
+            "name",
+            "source",
+            "outcode",
+            "min_price",
+            "max_price",
+            "min_bedrooms",
+            "max_bedrooms",
+            "is_active",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = ["id", "created_at", "updated_at"]
+
+    def validate_outcode(self, value):
+        return value.upper() if value else value
+
+    def validate(self, attrs):
+        for low, high in (("min_price", "max_price"), ("min_bedrooms", "max_bedrooms")):
+            low_value = attrs.get(low, getattr(self.instance, low, None))
+            high_value = attrs.get(high, getattr(self.instance, high, None))
+            if (
+                low_value is not None
+                and high_value is not None
+                and low_value > high_value
+            ):
+                raise serializers.ValidationError({low: f"Must not exceed {high}"})
+        return attrs
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from sitescrapers.models import SavedSearch
+from sitescrapers.saved_searches import invalidate_index
+
+
+@receiver(post_save, sender=SavedSearch)
+@receiver(post_delete, sender=SavedSearch)
+def invalidate_saved_search_index(sender, instance, **kwargs):
+    invalidate_index()
@@ -0,0 +1,62 @@
+from celery import shared_task
+from sitescrapers.jobs import execute_scraping_job
+from sitescrapers.leases import reap_expired_jobs
+from sitescrapers.models import Property
+from sitescrapers.refresh import plan_refreshes
+from sitescrapers.saved_searches import notify_matches, record_matches
+from utils.image_derivatives import DerivativeGenerator
+
+
+@shared_task
+def run_scraping_job(job_id, source=None):
+    """
+    Run a scraping job outside of the websocket or HTTP request that created it.
+    """
+    execute_scraping_job(job_id, source)
+
+
+@shared_task
+def generate_image_derivatives(property_id):
+    """
+    Create thumbnails and WebP/AVIF variants for a property's images.
+    """
+    property_instance = Property.objects.filter(id=property_id).first()
+    if not property_instance:
+        return
+
+    image_urls = list(property_instance.images) + list(property_instance.floorplans)
+    # Image workers already run one process per CPU, so render inline
+    generator = DerivativeGenerator(max_workers=0)
+    property_instance.image_derivatives = generator.generate(image_urls)
+    property_instance.save(update_fields=["image_derivatives"])
+
+
+@shared_task
+def match_saved_searches(property_id):
+    """
+    Record the saved searches a new or changed property matches and notify
+    their owners.
+    """
+    property_instance = Property.objects.filter(id=property_id).first()
+    if not property_instance:
+        return
+
+    searches = record_matches(property_instance)
+    if searches:
+        notify_matches(property_instance, searches)
+
+
+@shared_task
+def refresh_due_properties():
+    """
+    Queue the listings due for a refresh, run by Celery beat.
+    """
+    return plan_refreshes()
+
+
+@shared_task
+def requeue_expired_jobs():
+    """
+    Requeue scraping jobs whose worker died mid-scrape, run by Celery beat.
+    """
+    return reap_expired_jobs()
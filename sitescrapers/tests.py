@@ -1,3 +1,1279 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import fakeredis
+import requests
+from django.core.files.storage import InMemoryStorage
+from django.db import connection
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+from accounts.factories import UserFactory
+from sitescrapers import (
+    archive,
+    leases,
+    progress,
+    refresh,
+    saved_searches,
+    scheduler,
+    views,
+)
+from sitescrapers.jobs import execute_scraping_job, run_job_stages
+from sitescrapers.leases import (
+    MAX_ATTEMPTS,
+    Heartbeat,
+    LeaseLost,
+    claim_job,
+    reap_expired_jobs,
+    update_job,
+)
+from sitescrapers.matching import (
+    get_blocking_key,
+    match_score,
+    resolve_all,
+    resolve_listing,
+)
+from sitescrapers.models import (
+    CanonicalProperty,
+    Property,
+    PropertySnapshot,
+    SavedSearch,
+    SavedSearchMatch,
+    ScrapingJob,
+)
+from sitescrapers.persistence import normalize_property_data
+from sitescrapers.progress import ProgressPublisher, get_replay
+from utils import base_scraper, extraction, field_strategies, registry
+from utils.base_scraper import BrowserRequired
+from PIL import Image
+from pascraper.celery import BROWSER_QUEUE, HTTP_QUEUE, IMAGES_QUEUE, app
+from utils.extraction import free_soup, iter_tag_attributes, parse_html, prune_html
+from utils.http_cache import EVICT_TO, HTTPCache
+from utils.image_derivatives import (
+    DERIVATIVE_FORMATS,
+    DerivativeGenerator,
+    derivative_key,
+    render_derivatives,
+)
+from utils.proxy_pool import (
+    BAN_COOLDOWN,
+    MAX_BAN_COOLDOWN,
+    MAX_CONSECUTIVE_FAILURES,
+    ProxyEndpoint,
+    ProxyPool,
+)
+from utils.rightmove import rightmove_scraper
+from utils.rightmove.rightmove_scraper import RightmoveScraper
+from utils.field_strategies import (
+    ExtractionStats,
+    FieldStrategies,
+    Page,
+    RegexStrategy,
+    SelectorStrategy,
+    get_hour,
+)
+from utils.zoopla.zoopla_scraper import ZooplaScraper
+
+ZOOPLA_FIXTURES = (
+    Path(__file__).resolve().parent.parent / "utils" / "zoopla" / "fixtures"
+)
+ZOOPLA_URL = "https://www.zoopla.co.uk/for-sale/details/64512345/"
+
+
+def load_fixture(name):
+    return (ZOOPLA_FIXTURES / name).read_text()
+
+
+class ZooplaScraperTests(SimpleTestCase):
+    def test_extracts_embedded_listing_json(self):
+        scraper = ZooplaScraper(ZOOPLA_URL)
+        scraper.extract_details(parse_html(load_fixture("listing_next_data.html")))
+        data = scraper.property_details
+
+        self.assertEqual(data["price"], "£650,000")
+        self.assertEqual(data["bedrooms"], 2)
+        self.assertEqual(data["bathrooms"], 1)
+        self.assertEqual(data["address"], "Abbey Road, London NW8")
+        self.assertEqual(data["house_type"], "Flat")
+        self.assertEqual(data["agent"], "Hamptons - St John's Wood")
+        self.assertEqual(data["size"], "753 sq. ft")
+        self.assertEqual(
+            data["images"],
+            [
+                "https://lid.zoocdn.com/u/1024/768/3f/2a/3f2a0c.jpg",
+                "https://lid.zoocdn.com/u/1024/768/9b/11/9b11d4.jpg",
+            ],
+        )
+        self.assertEqual(
+            data["floorplans"], ["https://lid.zoocdn.com/u/1024/768/fp/01/fp01aa.gif"]
+        )
+        self.assertEqual(data["features"], ["Share of freehold", "Porter"])
+
+    def test_extracts_pruned_large_page(self):
+        scraper = ZooplaScraper(ZOOPLA_URL)
+        with mock.patch("utils.extraction.LARGE_PAGE_SIZE", 0):
+            data = scraper.extract_pages({"main": load_fixture("listing_dom.html")})
+
+        self.assertEqual(data["price"], "£425,000")
+        self.assertEqual(data["address"], "Elm Grove, Bristol BS6")
+        self.assertEqual(data["features"], ["Garden", "Cellar"])
+
+    def test_falls_back_to_dom_selectors(self):
+        scraper = ZooplaScraper(ZOOPLA_URL)
+        scraper.extract_details(parse_html(load_fixture("listing_dom.html")))
+        data = scraper.property_details
+
+        self.assertEqual(data["price"], "£425,000")
+        self.assertEqual(data["bedrooms"], "3 beds")
+        self.assertEqual(data["bathrooms"], "2 baths")
+        self.assertEqual(data["address"], "Elm Grove, Bristol BS6")
+        self.assertEqual(data["agent"], "Ocean Estate Agents")
+        self.assertEqual(len(data["images"]), 2)
+        self.assertEqual(len(data["floorplans"]), 1)
+        self.assertEqual(data["features"], ["Garden", "Cellar"])
+
+    def test_scrape_skips_browser_when_http_response_has_listing(self):
+        scraper = ZooplaScraper(ZOOPLA_URL)
+        with mock.patch.object(
+            scraper,
+            "get_html_content",
+            return_value=load_fixture("listing_next_data.html"),
+        ), mock.patch.object(scraper, "init_selenium") as init_selenium:
+            data = scraper.scrape()
+
+        init_selenium.assert_not_called()
+        self.assertEqual(data["price"], "£650,000")
+        # The fetched page is kept so it can be archived and replayed
+        self.assertEqual(scraper.extract_pages(scraper.pages)["price"], "£650,000")
+
+    def test_scrape_quits_browser_as_failed_when_it_raises(self):
+        scraper = ZooplaScraper(ZOOPLA_URL)
+
+        def init_selenium():
+            scraper.driver = mock.Mock()
+            type(scraper.driver).page_source = mock.PropertyMock(
+                side_effect=TimeoutError
+            )
+
+        http = mock.patch.object(scraper, "get_html_content", return_value=None)
+        browser = mock.patch.object(scraper, "init_selenium", init_selenium)
+        quitting = mock.patch.object(scraper, "quit_selenium")
+        with http, browser, quitting as quit_selenium, self.assertRaises(TimeoutError):
+            scraper.scrape()
+
+        quit_selenium.assert_called_once_with(ok=False)
+
+
+class FieldStrategiesTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch.object(
+            field_strategies, "get_redis", return_value=self.redis
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.page = Page(
+            parse_html('<p class="price">£300,000</p><p>Stamp duty £5,000</p>')
+        )
+
+    def record_hits(self, strategies, name, attempts, hits):
+        key = strategies.stats_key(get_hour())
+        self.redis.hset(
+            key, mapping={f"{name}:attempts": attempts, f"{name}:hits": hits}
+        )
+
+    def test_promotes_strategy_with_better_hit_rate(self):
+        strategies = FieldStrategies(
+            "test",
+            "price",
+            [
+                SelectorStrategy("old_class", "div.gone"),
+                SelectorStrategy("new_class", "p.price"),
+            ],
+        )
+        self.record_hits(strategies, "old_class", 50, 5)
+        self.record_hits(strategies, "new_class", 50, 50)
+
+        ranking = [strategy.name for strategy in strategies.ranked()]
+
+        self.assertEqual(ranking, ["new_class", "old_class"])
+
+    def test_unscoped_fallback_stays_below_scoped_strategies(self):
+        strategies = FieldStrategies(
+            "test",
+            "price",
+            [
+                SelectorStrategy("price_class", "p.price"),
+                RegexStrategy("price_text", r"£[\d,]+"),
+            ],
+        )
+        self.record_hits(strategies, "price_class", 50, 5)
+        self.record_hits(strategies, "price_text", 50, 50)
+
+        ranking = [strategy.name for strategy in strategies.ranked()]
+
+        self.assertEqual(ranking, ["price_class", "price_text"])
+
+    def test_shadow_sample_tries_every_strategy(self):
+        strategies = FieldStrategies(
+            "test",
+            "price",
+            [
+                SelectorStrategy("price_class", "p.price"),
+                RegexStrategy("price_text", r"£[\d,]+"),
+            ],
+        )
+        shadow = ExtractionStats(shadow_sample_rate=1)
+        regular = ExtractionStats(shadow_sample_rate=0)
+
+        self.assertEqual(shadow.extract(strategies, self.page), "£300,000")
+        self.assertEqual(regular.extract(strategies, self.page), "£300,000")
+        self.assertEqual(shadow.counts[strategies]["price_text:attempts"], 1)
+        self.assertEqual(regular.counts[strategies]["price_text:attempts"], 0)
+
+    def test_alerts_once_when_success_rate_drops(self):
+        strategies = FieldStrategies(
+            "test", "price", [SelectorStrategy("price_class", "div.gone")]
+        )
+
+        with mock.patch.object(field_strategies.logger, "error") as error:
+            for _ in range(2):
+                stats = ExtractionStats(shadow_sample_rate=0)
+                for _ in range(field_strategies.ALERT_MIN_ATTEMPTS):
+                    stats.extract(strategies, self.page)
+                stats.flush()
+
+        error.assert_called_once()
+        key = strategies.stats_key(get_hour())
+        self.assertEqual(self.redis.hget(key, "_field:attempts"), "40")
+
+
+class ExtractionTests(SimpleTestCase):
+    def test_prune_html_drops_unread_markup_and_keeps_the_text(self):
+        html = (
+            "<html><head><style>p {}</style></head><body>"
+            "<p>Before<svg><path d='M0'/></svg> after</p>"
+            "<noscript>enable js</noscript><iframe src='/ad'></iframe>"
+            "<p class='price'>£300,000</p></body></html>"
+        )
+
+        pruned = prune_html(html)
+
+        for tag in ("<style", "<svg", "<path", "<noscript", "<iframe"):
+            self.assertNotIn(tag, pruned)
+        soup = parse_html(pruned)
+        self.assertEqual(soup.p.get_text(), "Before after")
+        self.assertEqual(soup.select_one(".price").get_text(), "£300,000")
+
+    def test_only_large_pages_are_pruned(self):
+        html = "<html><body><svg></svg><p>Listing</p></body></html>"
+
+        self.assertIsNotNone(parse_html(html).svg)
+        with mock.patch.object(extraction, "LARGE_PAGE_SIZE", len(html) - 1):
+            self.assertIsNone(parse_html(html).svg)
+
+    def test_iter_tag_attributes_yields_tags_in_document_order(self):
+        html = (
+            "<div><img src='/1.jpg'><a href='/x'>x</a>"
+            "<div><img src='/2.jpg' alt='Floorplan'></div></div>"
+        )
+
+        self.assertEqual(
+            list(iter_tag_attributes(html, ("img",))),
+            [
+                ("img", {"src": "/1.jpg"}),
+                ("img", {"src": "/2.jpg", "alt": "Floorplan"}),
+            ],
+        )
+
+    def test_free_soup_breaks_up_the_tree(self):
+        soup = parse_html("<p>Listing</p>")
+
+        free_soup(soup)
+        free_soup(None)
+
+        self.assertTrue(soup.decomposed)
+
+    def test_rightmove_parses_only_the_main_page(self):
+        scraper = RightmoveScraper("https://www.rightmove.co.uk/properties/1")
+        pages = {
+            "main": "<h1>1 High St</h1>",
+            "images": "<img src='https://media/1.jpg'><img src='https://media/max_1.jpg'>",
+            "floorplans": "<img src='https://media/plan.gif' alt='Floorplan 1'>",
+        }
+        soups = []
+
+        def extract_main_page():
+            soups.append(scraper.soup)
+            return {"address": scraper.soup.h1.get_text()}
+
+        parse = mock.patch.object(
+            rightmove_scraper, "parse_html", wraps=rightmove_scraper.parse_html
+        )
+        main_page = mock.patch.object(scraper, "extract_main_page", extract_main_page)
+        with parse as parse_html_mock, main_page:
+            data = scraper.extract_pages(pages)
+
+        parse_html_mock.assert_called_once_with(pages["main"])
+        self.assertEqual(
+            data,
+            {
+                "address": "1 High St",
+                "images": ["https://media/1.jpg"],
+                "floorplans": ["https://media/plan.gif"],
+            },
+        )
+        self.assertTrue(soups[0].decomposed)
+        self.assertIsNone(scraper.soup)
+
+
+class ProgressPublisherTests(SimpleTestCase):
+    def setUp(self):
+        redis = fakeredis.FakeRedis(decode_responses=True)
+        patchers = [
+            mock.patch.object(progress, "get_redis", return_value=redis),
+            mock.patch.object(progress, "get_channel_layer"),
+            mock.patch.object(progress, "COALESCE_INTERVAL", 0.05),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.publisher = ProgressPublisher(1)
+        self.publisher.channel_layer.group_send = mock.AsyncMock()
+
+    def get_stages(self):
+        return [(event["status"], event["stage"]) for event in get_replay(1)]
+
+    def test_last_event_of_a_burst_is_sent_after_the_interval(self):
+        for stage in ("scraping", "parsing", "saving"):
+            self.publisher.publish("progress", stage=stage)
+        self.assertEqual(self.get_stages(), [("progress", "scraping")])
+
+        time.sleep(0.2)
+
+        self.assertEqual(
+            self.get_stages(), [("progress", "scraping"), ("progress", "saving")]
+        )
+
+    def test_terminal_event_flushes_held_event_first(self):
+        self.publisher.publish("progress", stage="scraping")
+        self.publisher.publish("progress", stage="saving")
+        self.publisher.publish("completed")
+
+        self.assertEqual(
+            self.get_stages(),
+            [("progress", "scraping"), ("progress", "saving"), ("completed", None)],
+        )
+
+
+def create_listing(url, address, postcode="NW8 9AA", price=650000, **fields):
+    fields.setdefault("bedrooms", 2)
+    return Property.objects.create(
+        url=url,
+        source="zoopla",
+        address=address,
+        postcode=postcode,
+        price=price,
+        blocking_key=get_blocking_key(postcode, price),
+        images=[],
+        floorplans=[],
+        **fields,
+    )
+
+
+class ListingMatchingTests(TestCase):
+    def test_blocking_key_is_outcode_and_price_band(self):
+        self.assertEqual(
+            get_blocking_key("NW8 9AA", 650000).split(":")[0],
+            "NW8",
+        )
+        self.assertIsNone(get_blocking_key("NW8 9AA", None))
+        self.assertNotEqual(
+            get_blocking_key("NW8 9AA", 650000), get_blocking_key("NW8 9AA", 800000)
+        )
+
+    def test_score_rejects_different_bedroom_counts(self):
+        a = Property(address="12 Abbey Road, London", bedrooms=2)
+        b = Property(address="12 Abbey Road, London", bedrooms=3)
+
+        self.assertEqual(match_score(a, b), 0.0)
+
+    def test_resolve_listing_links_duplicate_to_same_canonical(self):
+        first = create_listing("https://a/1", "12 Abbey Road, London NW8 9AA")
+        resolve_listing(first)
+        duplicate = create_listing(
+            "https://b/1", "12 Abbey Rd, London NW8 9AA", price=655000
+        )
+
+        canonical = resolve_listing(duplicate)
+
+        first.refresh_from_db()
+        self.assertEqual(first.canonical, canonical)
+        self.assertEqual(CanonicalProperty.objects.count(), 1)
+
+    def test_resolve_listing_keeps_different_property_apart(self):
+        first = create_listing("https://a/1", "12 Abbey Road, London NW8 9AA")
+        other = create_listing("https://a/2", "7 Grove End Gardens, London NW8 9AA")
+
+        self.assertNotEqual(resolve_listing(first), resolve_listing(other))
+
+    def test_resolve_all_clusters_matches_and_drops_orphans(self):
+        listings = [
+            create_listing("https://a/1", "12 Abbey Road, London NW8 9AA"),
+            create_listing("https://b/1", "12 Abbey Rd, London NW8 9AA"),
+            create_listing("https://c/1", "12 Abbey Road London NW8"),
+            create_listing("https://a/2", "7 Grove End Gardens, London NW8 9AA"),
+        ]
+        for listing in listings:
+            resolve_listing(listing)
+        # Split the cluster up again, as if the listings were linked wrongly
+        orphan = CanonicalProperty.objects.create(address="Gone")
+        Property.objects.filter(url="https://c/1").update(canonical=None)
+
+        resolve_all()
+
+        canonical_ids = dict(Property.objects.values_list("url", "canonical_id"))
+        self.assertEqual(canonical_ids["https://a/1"], canonical_ids["https://b/1"])
+        self.assertEqual(canonical_ids["https://a/1"], canonical_ids["https://c/1"])
+        self.assertNotEqual(canonical_ids["https://a/1"], canonical_ids["https://a/2"])
+        self.assertFalse(CanonicalProperty.objects.filter(id=orphan.id).exists())
+        self.assertEqual(CanonicalProperty.objects.count(), 2)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class SavedSearchTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.listing = create_listing(
+            "https://a/1", "1 Abbey Road", postcode="NW8 9AA", price=650000
+        )
+
+    def create_search(self, name, user=None, **criteria):
+        return SavedSearch.objects.create(user=user or self.user, name=name, **criteria)
+
+    def get_candidates(self, listing=None):
+        index = saved_searches.SavedSearchIndex(SavedSearch.objects.all())
+        return {search.name for search in index.candidates(listing or self.listing)}
+
+    def test_candidates_by_outcode_price_band_and_bedrooms(self):
+        self.create_search("area", outcode="nw8")
+        self.create_search("other area", outcode="SW1")
+        self.create_search("price", min_price=500000, max_price=700000)
+        self.create_search("cheap", max_price=200000)
+        self.create_search("bedrooms", min_bedrooms=2, max_bedrooms=2)
+        self.create_search("large", min_bedrooms=4)
+        self.create_search("other site", source="rightmove")
+        self.create_search("anything")
+
+        self.assertEqual(
+            self.get_candidates(), {"area", "price", "bedrooms", "anything"}
+        )
+
+    def test_no_candidates_outside_every_search(self):
+        self.create_search("area", outcode="SW1", max_price=300000)
+        listing = create_listing("https://a/2", "2 High St", postcode="E1 6AN")
+
+        self.assertEqual(self.get_candidates(listing), set())
+        index = saved_searches.SavedSearchIndex(SavedSearch.objects.all())
+        self.assertEqual(index.match(listing), [])
+
+    def test_notifies_owners_with_an_email_and_escapes_names_for_html(self):
+        search = self.create_search("Flats <b> & more")
+        no_email = self.create_search("No email", user=UserFactory(email=None))
+        for matched in (search, no_email):
+            SavedSearchMatch.objects.create(search=matched, property=self.listing)
+
+        with mock.patch.object(saved_searches, "send_batch_email_task") as task:
+            saved_searches.notify_matches(self.listing, [search, no_email])
+
+        recipients = task.delay.call_args.args[0]
+        self.assertEqual(list(recipients), [self.user.email])
+        variables = recipients[self.user.email]
+        self.assertEqual(variables["search_names"], "Flats <b> & more")
+        self.assertEqual(variables["search_names_html"], "Flats &lt;b&gt; &amp; more")
+        self.assertFalse(
+            SavedSearchMatch.objects.filter(notified_at__isnull=True).exists()
+        )
+
+
+class RefreshPlanTests(TestCase):
+    @override_settings(REFRESH_BUDGETS={"zoopla": 240}, REFRESH_PLAN_INTERVAL=3600)
+    def test_skips_listings_with_an_active_job(self):
+        due = timezone.now() - timedelta(hours=1)
+        queued = create_listing("https://a/1", "1 High St", next_refresh_at=due)
+        busy = create_listing("https://a/2", "2 High St", next_refresh_at=due)
+        ScrapingJob.objects.create(url=busy.url, status="in_progress")
+
+        with mock.patch.object(refresh, "schedule_job") as schedule_job:
+            planned = refresh.plan_refreshes()
+
+        self.assertEqual(planned, {"zoopla": 1})
+        (job, source), _ = schedule_job.call_args
+        self.assertEqual((job.url, source), (queued.url, "zoopla"))
+
+
+class ScrapingJobAPITests(TestCase):
+    def post(self, body):
+        return self.client.post(
+            reverse("scraping_jobs"), body, content_type="application/json"
+        )
+
+    def test_rejects_bodies_that_are_not_objects(self):
+        for body in ('["https://a/1"]', '"https://a/1"', "null", "{"):
+            with self.subTest(body=body):
+                response = self.post(body)
+
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(ScrapingJob.objects.exists())
+
+    def test_requires_a_url(self):
+        response = self.post("{}")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "URL parameter is required"})
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+)
+class ScrapingJobStatusTests(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch.object(progress, "get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_replay_event(self, job, seq, status):
+        self.redis.rpush(
+            progress.EVENTS_KEY.format(job_id=job.id),
+            json.dumps({"job_id": job.id, "status": status, "seq": seq}),
+        )
+
+    async def finish_job(self, job, delay):
+        await asyncio.sleep(delay)
+        await ScrapingJob.objects.filter(id=job.id).aupdate(status="completed")
+        await progress.get_channel_layer().group_send(
+            progress.job_group(job.id),
+            {"type": "job.progress", "event": {"status": "completed", "seq": 1}},
+        )
+
+    def test_wait_is_clamped(self):
+        factory = RequestFactory()
+        for wait, expected in (("5", 5), ("-5", 0), ("600", views.MAX_WAIT), ("x", 0)):
+            with self.subTest(wait=wait):
+                request = factory.get("/", {"wait": wait})
+
+                self.assertEqual(views.get_wait(request), expected)
+
+    def test_format_event(self):
+        self.assertEqual(
+            views.format_event("progress", {"stage": "scraped"}, 3),
+            'id: 3\nevent: progress\ndata: {"stage": "scraped"}\n\n',
+        )
+        self.assertEqual(
+            views.format_event("result", {}), "event: result\ndata: {}\n\n"
+        )
+
+    def test_finished_job_is_returned_without_waiting(self):
+        job = ScrapingJob.objects.create(url="https://a/1", status="completed")
+
+        started = time.monotonic()
+        response = self.client.get(
+            reverse("scraping_job_status", args=[job.id]), {"wait": 30}
+        )
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "completed")
+
+    def test_other_users_jobs_are_not_found(self):
+        job = ScrapingJob.objects.create(url="https://a/1", user=UserFactory())
+
+        response = self.client.get(reverse("scraping_job_status", args=[job.id]))
+
+        self.assertEqual(response.status_code, 404)
+
+    async def test_long_poll_wakes_on_terminal_event(self):
+        job = await ScrapingJob.objects.acreate(url="https://a/1")
+
+        started = time.monotonic()
+        finishing = asyncio.ensure_future(self.finish_job(job, 0.1))
+        result = await views.ScrapingJobStatusAPIView().wait_for_job(job.id, None, 30)
+        await finishing
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(result["status"], "completed")
+
+    async def test_long_poll_gives_up_at_the_deadline(self):
+        job = await ScrapingJob.objects.acreate(url="https://a/1")
+
+        result = await views.ScrapingJobStatusAPIView().wait_for_job(job.id, None, 0.1)
+
+        self.assertEqual(result["status"], "pending")
+
+    async def test_stream_replays_missed_events_then_the_result(self):
+        job = await ScrapingJob.objects.acreate(url="https://a/1", status="completed")
+        self.add_replay_event(job, 1, "progress")
+        self.add_replay_event(job, 2, "completed")
+
+        chunks = [
+            chunk
+            async for chunk in views.ScrapingJobEventsAPIView().stream(job.id, None, 1)
+        ]
+
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(chunks[0].startswith("id: 2\nevent: completed\n"))
+        self.assertTrue(chunks[1].startswith("event: result\n"))
+        self.assertIn('"status": "completed"', chunks[1])
+
+    async def test_stream_forwards_live_events_until_the_job_ends(self):
+        job = await ScrapingJob.objects.acreate(url="https://a/1")
+
+        finishing = asyncio.ensure_future(self.finish_job(job, 0.1))
+        chunks = [
+            chunk
+            async for chunk in views.ScrapingJobEventsAPIView().stream(job.id, None, 0)
+        ]
+        await finishing
+
+        self.assertEqual(
+            [chunk.split("\n")[-4] for chunk in chunks],
+            ["event: completed", "event: result"],
+        )
+
+
+class SingleflightTests(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patchers = [
+            mock.patch.object(scheduler, "get_redis", return_value=self.redis),
+            mock.patch.object(scheduler, "send_job"),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.url = "https://www.zoopla.co.uk/for-sale/details/1/"
+        self.key = scheduler.get_flight_key(self.url)
+
+    def create_job(self, **fields):
+        return ScrapingJob.objects.create(
+            url=self.url, normalized_url=self.url, **fields
+        )
+
+    def test_takes_the_flight_over_from_a_finished_leader(self):
+        leader = self.create_job(status="completed")
+        self.redis.set(self.key, leader.id)
+        job = self.create_job()
+
+        scheduler.schedule_job(job)
+
+        self.assertEqual(self.redis.get(self.key), str(job.id))
+        self.assertGreater(self.redis.ttl(self.key), 0)
+        scheduler.send_job.assert_called_once_with(job, None, None)
+
+    def test_follows_the_job_that_took_the_flight_over_first(self):
+        finished = self.create_job(status="failed")
+        rival = self.create_job()
+        self.redis.set(self.key, finished.id)
+        get = self.redis.get
+
+        def get_then_lose_race(key):
+            value = get(key)
+            self.redis.set(key, rival.id)
+            return value
+
+        job = self.create_job()
+        with mock.patch.object(self.redis, "get", get_then_lose_race):
+            scheduler.schedule_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.leader_id, rival.id)
+        self.assertEqual(self.redis.get(self.key), str(rival.id))
+        scheduler.send_job.assert_not_called()
+
+    def test_heartbeat_refresh_only_extends_the_holders_flight(self):
+        self.redis.set(self.key, 1, ex=10)
+
+        scheduler.refresh_flight(self.url, 2)
+        self.assertLessEqual(self.redis.ttl(self.key), 10)
+
+        scheduler.refresh_flight(self.url, 1)
+        self.assertEqual(self.redis.ttl(self.key), scheduler.FLIGHT_TTL)
+
+
+class JobLeaseTests(TestCase):
+    def setUp(self):
+        self.job = ScrapingJob.objects.create(url="https://www.zoopla.co.uk/x/1")
+
+    def test_claims_a_pending_job_once(self):
+        token = claim_job(self.job.id)
+
+        self.assertIsNotNone(token)
+        self.assertIsNone(claim_job(self.job.id))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "in_progress")
+        self.assertEqual(self.job.lease_owner, token)
+        self.assertEqual(self.job.attempts, 1)
+
+    def test_update_with_a_lost_lease_raises(self):
+        claim_job(self.job.id)
+
+        with self.assertRaises(LeaseLost):
+            update_job(self.job, "stale-token", stage=ScrapingJob.STAGE_SCRAPED)
+
+    def expire_lease(self):
+        ScrapingJob.objects.filter(id=self.job.id).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+    @mock.patch.object(leases, "send_job")
+    def test_reaper_requeues_expired_job(self, send_job):
+        claim_job(self.job.id)
+        self.expire_lease()
+
+        self.assertEqual(reap_expired_jobs(), 1)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "pending")
+        self.assertIsNone(self.job.lease_owner)
+        send_job.assert_called_once()
+
+    @mock.patch.object(leases, "finish_job")
+    @mock.patch.object(leases, "ProgressPublisher")
+    @mock.patch.object(leases, "send_job")
+    def test_reaper_fails_job_out_of_attempts(self, send_job, publisher, finish_job):
+        claim_job(self.job.id)
+        ScrapingJob.objects.filter(id=self.job.id).update(attempts=MAX_ATTEMPTS)
+        self.expire_lease()
+
+        self.assertEqual(reap_expired_jobs(), 0)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "failed")
+        send_job.assert_not_called()
+        finish_job.assert_called_once()
+
+    @mock.patch("sitescrapers.jobs.finish_job")
+    @mock.patch("sitescrapers.tasks.generate_image_derivatives.delay")
+    def test_completed_job_is_finished_when_derivatives_fail(self, delay, finish_job):
+        delay.side_effect = ConnectionError("broker down")
+        listing = create_listing("https://www.zoopla.co.uk/x/1", "1 High St, N1 1AA")
+        token = claim_job(self.job.id)
+        self.job.refresh_from_db()
+        update_job(self.job, token, stage=ScrapingJob.STAGE_SAVED, property=listing)
+
+        run_job_stages(self.job, token, "zoopla", mock.Mock())
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "completed")
+        finish_job.assert_called_once()
+
+    @mock.patch("sitescrapers.tasks.run_scraping_job.apply_async")
+    def test_browser_pages_are_handed_to_the_browser_queue(self, apply_async):
+        run_job_stages = mock.patch(
+            "sitescrapers.jobs.run_job_stages",
+            side_effect=BrowserRequired(self.job.url),
+        )
+        heartbeat = mock.patch("sitescrapers.jobs.Heartbeat")
+        publisher = mock.patch("sitescrapers.jobs.ProgressPublisher")
+        with run_job_stages, heartbeat, publisher:
+            execute_scraping_job(self.job.id, "zoopla")
+
+        apply_async.assert_called_once_with(
+            (self.job.id, "zoopla"), queue=BROWSER_QUEUE, priority=self.job.priority
+        )
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "pending")
+        # The hand-off isn't a failed attempt
+        self.assertEqual(self.job.attempts, 0)
+
+
+class CeleryRoutingTests(SimpleTestCase):
+    def get_queue(self, task_name):
+        return app.amqp.router.route({}, task_name)["queue"].name
+
+    def test_tasks_are_routed_to_their_worker_profile(self):
+        self.assertEqual(
+            self.get_queue("sitescrapers.tasks.run_scraping_job"), BROWSER_QUEUE
+        )
+        self.assertEqual(
+            self.get_queue("sitescrapers.tasks.generate_image_derivatives"),
+            IMAGES_QUEUE,
+        )
+        self.assertEqual(self.get_queue("accounts.tasks.send_email"), HTTP_QUEUE)
+        self.assertEqual(
+            self.get_queue("accounts.tasks.flush_usage_counts"),
+            app.conf.task_default_queue,
+        )
+
+    def test_scrapes_go_to_the_queue_of_their_cheapest_engine(self):
+        for url, queue in (
+            ("https://www.zoopla.co.uk/for-sale/details/64512345/", HTTP_QUEUE),
+            ("https://www.rightmove.co.uk/properties/1", BROWSER_QUEUE),
+            ("https://www.onthemarket.com/details/1/", BROWSER_QUEUE),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(registry.get_queue(url), queue)
+
+    @mock.patch("sitescrapers.tasks.run_scraping_job.apply_async")
+    def test_send_job_uses_the_engine_queue_and_job_priority(self, apply_async):
+        job = ScrapingJob(
+            id=1,
+            url="https://www.zoopla.co.uk/for-sale/details/64512345/",
+            priority=ScrapingJob.PRIORITY_REFRESH,
+        )
+
+        scheduler.send_job(job, "zoopla")
+
+        apply_async.assert_called_once_with(
+            (1, "zoopla"),
+            queue=HTTP_QUEUE,
+            priority=ScrapingJob.PRIORITY_REFRESH,
+            countdown=None,
+        )
+
+
+class HeartbeatTests(TransactionTestCase):
+    def test_renews_the_lease_while_running(self):
+        job = ScrapingJob.objects.create(url="https://www.zoopla.co.uk/x/1")
+        token = claim_job(job.id)
+        job.refresh_from_db()
+        expires_at = job.lease_expires_at
+
+        with Heartbeat(job.id, token, interval=0.05):
+            time.sleep(0.3)
+
+        job.refresh_from_db()
+        self.assertGreater(job.lease_expires_at, expires_at)
+
+
+def make_response(status_code=200, body=b"", **headers):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers.update(headers)
+    return response
+
+
+class HTTPCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = HTTPCache(directory.name, max_size=1000)
+        self.session = mock.Mock()
+
+    def get(self, url, *responses, **kwargs):
+        self.session.get.side_effect = responses
+        return self.cache.get(url, session=self.session, **kwargs)
+
+    def test_serves_304_from_cache(self):
+        self.get("https://a/1", make_response(body=b"page", ETag='"v1"'))
+
+        response = self.get("https://a/1", make_response(304))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"page")
+        self.assertTrue(response.from_cache)
+        headers = self.session.get.call_args.kwargs["headers"]
+        self.assertEqual(headers["If-None-Match"], '"v1"')
+
+    def test_serves_fresh_response_without_a_request(self):
+        self.get(
+            "https://a/1",
+            make_response(body=b"page", **{"Cache-Control": "max-age=60"}),
+        )
+        self.session.get.reset_mock()
+
+        response = self.cache.get("https://a/1", session=self.session)
+
+        self.assertEqual(response.content, b"page")
+        self.session.get.assert_not_called()
+
+    def test_does_not_store_no_store_responses(self):
+        self.get(
+            "https://a/1",
+            make_response(body=b"page", ETag='"v1"', **{"Cache-Control": "no-store"}),
+        )
+
+        self.assertIsNone(self.cache.lookup(self.cache.get_key("https://a/1")))
+
+    def test_does_not_store_rejected_responses(self):
+        self.get(
+            "https://a/1",
+            make_response(body=b"captcha", ETag='"v1"'),
+            validate=lambda response: False,
+        )
+
+        self.assertIsNone(self.cache.lookup(self.cache.get_key("https://a/1")))
+
+    def test_evicts_least_recently_used_entries(self):
+        for url in ("https://a/1", "https://a/2", "https://a/3"):
+            self.get(url, make_response(body=b"x" * 300, ETag='"v1"'))
+            time.sleep(0.01)
+        # Reading the first entry makes the second the least recently used
+        self.cache.read(self.cache.get_key("https://a/1"))
+
+        self.get("https://a/4", make_response(body=b"x" * 300, ETag='"v1"'))
+
+        cached = {
+            url
+            for url in ("https://a/1", "https://a/2", "https://a/3", "https://a/4")
+            if self.cache.lookup(self.cache.get_key(url))
+        }
+        self.assertEqual(cached, {"https://a/1", "https://a/3", "https://a/4"})
+
+    def test_does_not_evict_below_the_size_limit(self):
+        with mock.patch.object(self.cache, "evict") as evict:
+            for url in ("https://a/1", "https://a/2", "https://a/3"):
+                self.get(url, make_response(body=b"x" * 300, ETag='"v1"'))
+
+        evict.assert_not_called()
+
+    def test_keeps_a_running_total_of_the_cache_size(self):
+        self.get("https://a/1", make_response(body=b"x" * 300, ETag='"v1"'))
+        self.get("https://a/2", make_response(body=b"x" * 200, ETag='"v1"'))
+        self.get("https://a/1", make_response(body=b"x" * 100, ETag='"v2"'))
+
+        self.assertEqual(self.cache.total, 300)
+        self.assertEqual(self.cache.get_total(self.cache.db), 300)
+
+        self.get("https://a/3", make_response(body=b"x" * 900, ETag='"v1"'))
+
+        self.assertEqual(self.cache.total, self.cache.get_total(self.cache.db))
+        self.assertLessEqual(self.cache.total, 1000 * EVICT_TO)
+
+
+def january(day):
+    return datetime(2026, 1, day, 12, tzinfo=dt_timezone.utc)
+
+
+@skipUnless(connection.vendor == "postgresql", "Uses PostgreSQL window functions")
+class MedianPriceTrendTests(TestCase):
+    def setUp(self):
+        self.flat = create_listing(
+            "https://a/1", "1 High St", postcode="N1 1AA", last_scraped_at=january(30)
+        )
+        self.house = create_listing(
+            "https://a/2", "2 High St", postcode="N1 1AA", last_scraped_at=january(30)
+        )
+        for listing, day, price in (
+            (self.flat, 5, 100),
+            (self.house, 6, 300),
+            (self.house, 20, 500),
+        ):
+            PropertySnapshot.objects.create(
+                property=listing,
+                price=price,
+                outcode="N1",
+                captured_at=january(day),
+                payload_hash="x",
+            )
+
+    def get_trends(self, **params):
+        response = self.client.get(reverse("median_price_trends"), params)
+        return [
+            (trend["week"], trend["median_price"], trend["listings"])
+            for trend in response.json()["trends"]
+        ]
+
+    def test_unchanged_listings_are_carried_forward(self):
+        trends = self.get_trends(start="2026-01-05", end="2026-01-25", area="n1")
+
+        self.assertEqual(
+            trends,
+            [
+                ("2026-01-05", "200.00", 2),
+                ("2026-01-12", "200.00", 2),
+                ("2026-01-19", "300.00", 2),
+            ],
+        )
+
+    def test_listings_stop_counting_once_no_longer_scraped(self):
+        Property.objects.filter(id=self.flat.id).update(last_scraped_at=january(10))
+
+        trends = self.get_trends(start="2026-01-12", end="2026-01-18")
+
+        self.assertEqual(trends, [("2026-01-12", "300.00", 1)])
+
+
+class ReextractionTests(TestCase):
+    def test_reextracts_chunks_in_submission_order(self):
+        def reextract(rows):
+            time.sleep(0.01 * len(rows))
+            return [(url, {}, None) for url in rows]
+
+        chunks = [(index, ["u"] * (5 - index)) for index in range(5)]
+        with mock.patch.object(
+            archive, "get_worker_pool", return_value=ThreadPoolExecutor(2)
+        ), mock.patch.object(archive, "reextract_archived_pages", reextract):
+            keys = [key for key, _ in archive.reextract_in_pool(chunks, workers=2)]
+
+        self.assertEqual(keys, [0, 1, 2, 3, 4])
+
+    def test_compares_results_with_listings_in_one_query(self):
+        listing = create_listing("https://a/1", "1 High St")
+        unchanged = create_listing("https://a/2", "2 High St")
+        fields = normalize_property_data(
+            {"address": "1 High St NW8 9AA", "price": "£700,000", "bedrooms": "2"}
+        )
+        results = [
+            ("https://a/1", fields, None),
+            ("https://a/2", {"address": unchanged.address}, None),
+            ("https://a/3", fields, None),
+            ("https://a/4", None, "Could not parse"),
+        ]
+
+        with self.assertNumQueries(1):
+            changes, missing = archive.get_listing_changes(results)
+
+        self.assertEqual(missing, ["https://a/3"])
+        self.assertEqual(len(changes), 1)
+        changed_listing, _, changed_fields = changes[0]
+        self.assertEqual(changed_listing.id, listing.id)
+        self.assertIn("price", changed_fields)
+        self.assertIn("address", changed_fields)
+
+
+class ProxyPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = ProxyPool(["http://proxy-a:8080", "http://proxy-b:8080"])
+
+    def test_score_and_latency_follow_results(self):
+        endpoint = ProxyEndpoint("http://proxy-a:8080")
+
+        endpoint.record_failure(now=0)
+        self.assertAlmostEqual(endpoint.score, 0.8)
+        endpoint.record_success(latency=2.0)
+        self.assertAlmostEqual(endpoint.score, 0.84)
+        self.assertEqual(endpoint.latency, 2.0)
+        endpoint.record_success(latency=1.0)
+        self.assertAlmostEqual(endpoint.latency, 1.8)
+        self.assertEqual(endpoint.consecutive_failures, 0)
+
+    def test_bans_evict_for_a_doubling_cooldown(self):
+        endpoint = ProxyEndpoint("http://proxy-a:8080")
+
+        endpoint.record_failure(now=0, banned=True)
+        self.assertEqual(endpoint.banned_until, BAN_COOLDOWN)
+        self.assertFalse(endpoint.is_available(BAN_COOLDOWN - 1))
+        self.assertTrue(endpoint.is_available(BAN_COOLDOWN))
+
+        endpoint.record_failure(now=BAN_COOLDOWN, banned=True)
+        self.assertEqual(endpoint.banned_until, BAN_COOLDOWN * 3)
+
+        for _ in range(10):
+            endpoint.record_failure(now=0, banned=True)
+        self.assertEqual(endpoint.banned_until, MAX_BAN_COOLDOWN)
+
+    def test_repeated_failures_evict_without_a_ban(self):
+        endpoint = ProxyEndpoint("http://proxy-a:8080")
+
+        for _ in range(MAX_CONSECUTIVE_FAILURES - 1):
+            endpoint.record_failure(now=0)
+        self.assertTrue(endpoint.is_available(1))
+
+        endpoint.record_failure(now=0)
+        self.assertFalse(endpoint.is_available(1))
+
+    def test_domain_sticks_to_its_endpoint_until_it_fails(self):
+        url = "https://www.zoopla.co.uk/for-sale/details/1/"
+        first = self.pool.acquire(url)
+        first.release()
+
+        second = self.pool.acquire(url)
+        self.assertIs(second.endpoint, first.endpoint)
+        self.assertIs(second.profile, first.profile)
+        second.check_response(403)
+        second.release()
+
+        self.assertFalse(first.endpoint.is_available(time.time()))
+        third = self.pool.acquire(url)
+        self.assertIsNot(third.endpoint, first.endpoint)
+
+    def test_choice_is_weighted_by_score_over_latency(self):
+        healthy, slow = self.pool.endpoints
+        healthy.latency = 1.0
+        slow.latency = 4.0
+        slow.score = 0.5
+
+        with mock.patch("random.choices", return_value=[healthy]) as choices:
+            chosen = self.pool.choose(self.pool.endpoints, now=0)
+
+        self.assertIs(chosen, healthy)
+        self.assertEqual(choices.call_args.kwargs["weights"], [1.0, 0.125])
+
+    def test_falls_back_to_the_endpoint_back_first_when_all_are_banned(self):
+        first, second = self.pool.endpoints
+        first.banned_until = 200
+        second.banned_until = 100
+
+        self.assertIs(self.pool.choose(self.pool.endpoints, now=0), second)
+
+    def test_failed_browser_scrape_counts_against_the_endpoint(self):
+        scraper = RightmoveScraper("https://www.rightmove.co.uk/properties/1")
+
+        def init_selenium():
+            scraper.proxy_lease = self.pool.acquire(scraper.base_url, browser=True)
+            scraper.driver = mock.Mock()
+
+        browser = mock.patch.object(scraper, "init_selenium", init_selenium)
+        timeout = mock.patch.object(
+            scraper, "scrape_property", side_effect=TimeoutError
+        )
+        with browser, timeout, self.assertRaises(TimeoutError):
+            scraper.scrape()
+
+        endpoint = next(e for e in self.pool.endpoints if e.consecutive_failures)
+        self.assertLess(endpoint.score, 1)
+        self.assertIsNone(scraper.proxy_lease)
+
+    def test_fresh_cached_page_takes_no_lease(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        http_cache = HTTPCache(directory.name, max_size=1000)
+        session = mock.Mock()
+        session.get.return_value = make_response(
+            body=b"<html>listing</html>", **{"Cache-Control": "max-age=60"}
+        )
+        http_cache.get(ZOOPLA_URL, session=session)
+        pool = mock.Mock()
+
+        with mock.patch.object(
+            base_scraper, "get_http_cache", return_value=http_cache
+        ), mock.patch.object(base_scraper, "get_proxy_pool", return_value=pool):
+            html = ZooplaScraper(ZOOPLA_URL).get_html_content()
+
+        self.assertEqual(html, "<html>listing</html>")
+        pool.acquire.assert_not_called()
+
+
+def make_image(size=(2000, 1000), fmt="JPEG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "#4f46e5").save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+class ImageDerivativeTests(SimpleTestCase):
+    def test_renders_every_variant_and_format_within_its_box(self):
+        rendered = render_derivatives(make_image())
+
+        self.assertEqual(
+            set(rendered),
+            {
+                f"{variant}.{fmt}"
+                for variant in ("thumb", "medium")
+                for fmt in DERIVATIVE_FORMATS
+            },
+        )
+        with Image.open(io.BytesIO(rendered["thumb.webp"])) as thumb:
+            self.assertEqual(thumb.size, (320, 160))
+        with Image.open(io.BytesIO(rendered["medium.webp"])) as medium:
+            self.assertEqual(medium.size, (1024, 512))
+
+    def test_renders_nothing_for_bytes_that_are_not_an_image(self):
+        self.assertEqual(render_derivatives(b"<html>captcha</html>"), {})
+
+    def test_generates_once_and_reuses_stored_derivatives(self):
+        generator = DerivativeGenerator(storage=InMemoryStorage(), max_workers=0)
+        url = "https://lid.zoocdn.com/u/1024/768/3f/2a/3f2a0c.jpg"
+
+        with mock.patch.object(
+            generator, "download", return_value=make_image()
+        ) as download:
+            first = generator.generate([url, url])
+            second = generator.generate([url])
+
+        download.assert_called_once()
+        self.assertEqual(first, second)
+        self.assertEqual(first[url]["thumb.webp"], derivative_key(url, "thumb", "webp"))
+        self.assertTrue(generator.storage.exists(first[url]["medium.webp"]))
+
+    def test_skips_images_that_fail_to_download(self):
+        generator = DerivativeGenerator(storage=InMemoryStorage(), max_workers=0)
+
+        with mock.patch.object(generator, "download", return_value=None):
+            self.assertEqual(generator.generate(["https://a/1.jpg"]), {})
+
+
+def make_plugin(source, cost, scrape=None):
+    scraper_class = type(
+        f"{source.title()}Scraper",
+        (),
+        {
+            "__init__": lambda self, url: setattr(self, "pages", {"main": source}),
+            "scrape": scrape or (lambda self: {"source": source}),
+        },
+    )
+    return registry.SitePlugin(
+        source, scraper_class, [r"^https://example\.com/"], (), cost
+    )
+
+
+class RegistryTests(SimpleTestCase):
+    def test_finds_plugins_by_url_and_source(self):
+        zoopla = "https://www.zoopla.co.uk/for-sale/details/64512345/"
+
+        self.assertEqual(
+            [plugin.source for plugin in registry.find_plugins(zoopla)], ["zoopla"]
+        )
+        self.assertEqual(registry.find_plugins(zoopla, source="rightmove"), [])
+        self.assertEqual(
+            registry.resolve("https://www.rightmove.co.uk/properties/1").source,
+            "rightmove",
+        )
+        with self.assertRaises(ValueError):
+            registry.resolve("https://example.com/listing/1")
+
+    def test_scrape_url_falls_back_to_the_next_engine(self):
+        def fail(scraper):
+            raise TimeoutError("blocked")
+
+        plugins = [make_plugin("browser", 10), make_plugin("http", 1, fail)]
+        with mock.patch.object(registry, "_plugins", plugins):
+            plugin, data, pages = registry.scrape_url("https://example.com/1")
+
+        self.assertEqual(plugin.source, "browser")
+        self.assertEqual(data, {"source": "browser"})
+        self.assertEqual(pages, {"main": "browser"})
+
+    def test_scrape_url_uses_the_cheapest_engine_first(self):
+        plugins = [make_plugin("browser", 10), make_plugin("http", 1)]
+        with mock.patch.object(registry, "_plugins", plugins):
+            plugin, data, _ = registry.scrape_url("https://example.com/1")
+
+        self.assertEqual((plugin.source, data), ("http", {"source": "http"}))
+
+    def test_scrape_url_hands_browser_pages_back_instead_of_falling_back(self):
+        def needs_browser(scraper):
+            raise BrowserRequired("https://example.com/1")
+
+        plugins = [make_plugin("browser", 10), make_plugin("http", 1, needs_browser)]
+        with mock.patch.object(registry, "_plugins", plugins), self.assertRaises(
+            BrowserRequired
+        ):
+            registry.scrape_url("https://example.com/1")
+
+    def test_last_engine_failure_is_raised(self):
+        def fail(scraper):
+            raise TimeoutError("blocked")
+
+        with mock.patch.object(registry, "_plugins", [make_plugin("http", 1, fail)]):
+            with self.assertRaises(TimeoutError):
+                registry.scrape_url("https://example.com/1")
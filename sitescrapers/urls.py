@@ -1,8 +1,44 @@
 from django.urls import path
-from sitescrapers.views import OnTheMarketAPIView, RightmoveAPIView, ZooplaAPIView
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import routers
+from sitescrapers.views import (
+    MedianPriceAPIView,
+    OnTheMarketAPIView,
+    PriceHistoryAPIView,
+    RightmoveAPIView,
+    SavedSearchViewSet,
+    ScrapingJobAPIView,
+    ScrapingJobEventsAPIView,
+    ScrapingJobStatusAPIView,
+    ScrapeAPIView,
+    ZooplaAPIView,
+)
+
+router = routers.DefaultRouter()
+
+router.register(r"saved-searches", SavedSearchViewSet, basename="saved-search")
 
 urlpatterns = [
+    path("scrape/", ScrapeAPIView.as_view(), name="scrape_api"),
     path("rightmove/", RightmoveAPIView.as_view(), name="rightmove_api"),
     path("zoopla/", ZooplaAPIView.as_view(), name="zoopla_api"),
     path("onthemarket/", OnTheMarketAPIView.as_view(), name="onthemarket_api"),
-]
+    path(
+        "properties/<int:property_id>/history/",
+        PriceHistoryAPIView.as_view(),
+        name="property_price_history",
+    ),
+    path("price-trends/", MedianPriceAPIView.as_view(), name="median_price_trends"),
+    # Token authenticated, so CSRF doesn't apply
+    path("jobs/", csrf_exempt(ScrapingJobAPIView.as_view()), name="scraping_jobs"),
+    path(
+        "jobs/<int:job_id>/",
+        ScrapingJobStatusAPIView.as_view(),
+        name="scraping_job_status",
+    ),
+    path(
+        "jobs/<int:job_id>/events/",
+        ScrapingJobEventsAPIView.as_view(),
+        name="scraping_job_events",
+    ),
+] + router.urls
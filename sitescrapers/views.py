@@ -1,39 +1,320 @@
-from django.http import JsonResponse
-from rest_framework import status
+import json
+import time
+from datetime import timedelta
+
+from accounts.authentication import get_request_user
+from accounts.metering import UsageLimitExceeded, record_usage
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import status, viewsets
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
-from utils.onthemarket.onthemarket_scraper import OnTheMarketScraper
-from utils.rightmove.rightmove_scraper import RightmoveScraper
-from utils.zoopla.zoopla_scraper import ZooplaScraper
+from rest_framework_simplejwt.exceptions import InvalidToken
+from sitescrapers.aggregates import get_weekly_median_prices
+from sitescrapers.jobs import (
+    create_scraping_job,
+    get_job_for_user,
+    get_job_result,
+    queue_scraping_job,
+)
+from sitescrapers.models import Property, PropertySnapshot, SavedSearch
+from sitescrapers.progress import TERMINAL_STATUSES, JobSubscription, get_replay
+from sitescrapers.serializers import SavedSearchSerializer
+from utils.normalize import get_day_start
+from utils.registry import find_plugins, scrape_url
 
 
-class RightmoveAPIView(APIView):
-    def get(self, request):
-        url = request.GET.get("url")
-        if not url:
-            return JsonResponse({"error": "URL parameter is required"}, status=400)
-        scraper = RightmoveScraper(url)
-        data = scraper.scrape_property()
-        return JsonResponse(data, status=status.HTTP_200_OK)
+class ScrapeAPIView(APIView):
+    """
+    Scrape a listing URL with whichever registered engine can handle it.
+
+    Subclasses pin the source so only that site's engines are considered.
+    """
 
+    source = None
 
-class ZooplaAPIView(APIView):
     def get(self, request):
         url = request.GET.get("url")
         if not url:
             return JsonResponse({"error": "URL parameter is required"}, status=400)
-        scraper = ZooplaScraper(url)
-        data = scraper.scrape()
-        return JsonResponse(data, status=status.HTTP_200_OK)
+        source = self.source or request.GET.get("source")
+        if not find_plugins(url, source):
+            return JsonResponse(
+                {"error": f"No scraper available for {url}"}, status=400
+            )
+        if request.user.is_authenticated:
+            # Every scrape counts against the user's tier
+            record_usage(request.user, "creation")
+        plugin, data, _ = scrape_url(url, source)
+        return JsonResponse(
+            {"source": plugin.source, **data}, status=status.HTTP_200_OK
+        )
+
+
+class RightmoveAPIView(ScrapeAPIView):
+    source = "rightmove"
+
+
+class ZooplaAPIView(ScrapeAPIView):
+    source = "zoopla"
+
+
+class OnTheMarketAPIView(ScrapeAPIView):
+    source = "onthemarket"
+
+
+# Weeks of price trends returned when no ?start is given
+DEFAULT_TREND_WEEKS = 52
+
 
+def get_time_range(request):
+    """
+    Return the optional ?start=YYYY-MM-DD&end=YYYY-MM-DD range (end day
+    included) as aware datetimes, start inclusive and end exclusive.
+    """
+    start = parse_date(request.GET.get("start") or "")
+    end = parse_date(request.GET.get("end") or "")
+    start_at = get_day_start(start) if start else None
+    end_at = get_day_start(end + timedelta(days=1)) if end else None
+    return start_at, end_at
+
+
+def filter_time_range(queryset, request):
+    # Bounds on the column itself, so the captured_at indexes can be used
+    start_at, end_at = get_time_range(request)
+    if start_at:
+        queryset = queryset.filter(captured_at__gte=start_at)
+    if end_at:
+        queryset = queryset.filter(captured_at__lt=end_at)
+    return queryset
+
+
+class PriceHistoryAPIView(APIView):
+    def get(self, request, property_id):
+        if not Property.objects.filter(id=property_id).exists():
+            return JsonResponse({"error": "Property not found"}, status=404)
+
+        snapshots = filter_time_range(
+            PropertySnapshot.objects.filter(property_id=property_id), request
+        ).order_by("captured_at")
+        history = [
+            {
+                "captured_at": captured_at.isoformat(),
+                "price": str(price) if price is not None else None,
+                "time_on_market": time_on_market,
+            }
+            for captured_at, price, time_on_market in snapshots.values_list(
+                "captured_at", "price", "time_on_market"
+            )
+        ]
+        return JsonResponse(
+            {"property_id": property_id, "history": history}, status=status.HTTP_200_OK
+        )
+
+
+class MedianPriceAPIView(APIView):
+    """
+    Weekly median asking price, optionally limited to one area (outcode).
+    """
 
-class OnTheMarketAPIView(APIView):
     def get(self, request):
-        url = request.GET.get("url")
-        if not url:
+        start_at, end_at = get_time_range(request)
+        end_at = end_at or timezone.now()
+        start_at = start_at or end_at - timedelta(weeks=DEFAULT_TREND_WEEKS)
+        area = request.GET.get("area")
+        outcode = area.strip().upper() if area else None
+
+        trends = [
+            {
+                "area": area_outcode,
+                "week": week.date().isoformat(),
+                "median_price": f"{median_price:.2f}",
+                "listings": listings,
+            }
+            for week, area_outcode, median_price, listings in get_weekly_median_prices(
+                start_at, end_at, outcode
+            )
+        ]
+        return JsonResponse({"trends": trends}, status=status.HTTP_200_OK)
+
+
+class SavedSearchViewSet(viewsets.ModelViewSet):
+    """
+    Manage the saved searches of the current user. New listings matching an
+    active search are emailed to its owner.
+    """
+
+    serializer_class = SavedSearchSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return SavedSearch.objects.filter(user_id=self.request.user.pk).order_by(
+            "-created_at"
+        )
+
+    def perform_create(self, serializer):
+        serializer.save(user_id=self.request.user.pk)
+
+
+class ScrapingJobAPIView(View):
+    """
+    Async job submission: POST {"url": "...", "source": "...", "batch_id": "..."}
+    queues a scrape and answers 202 with the job id straight away.
+
+    Runs natively on ASGI, so waiting on the database or broker doesn't hold
+    a worker thread.
+    """
+
+    async def post(self, request):
+        try:
+            payload = json.loads(request.body or "{}")
+            if not isinstance(payload, dict):
+                return JsonResponse({"error": "Expected a JSON object"}, status=400)
+            user = await get_request_user(request, session=False)
+            job = await create_scraping_job(
+                payload["url"],
+                payload.get("source"),
+                user=user,
+                batch_id=payload.get("batch_id"),
+            )
+        except InvalidToken as e:
+            return JsonResponse(e.detail, status=e.status_code)
+        except UsageLimitExceeded as e:
+            return JsonResponse({"error": str(e.detail)}, status=e.status_code)
+        except KeyError:
             return JsonResponse({"error": "URL parameter is required"}, status=400)
-        scraper = OnTheMarketScraper(url)
-        data = scraper.scrape()
-        return JsonResponse(data, status=status.HTTP_200_OK)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        await queue_scraping_job(job, payload.get("source"))
+        return JsonResponse(
+            {"job_id": job.id, "status": job.status}, status=status.HTTP_202_ACCEPTED
+        )
+
+
+# Longest a long-poll or event stream request is held open, in seconds
+MAX_WAIT = 60
+MAX_STREAM_DURATION = 60 * 10
+KEEPALIVE_INTERVAL = 15
+
+
+def get_wait(request):
+    try:
+        return min(max(float(request.GET.get("wait", 0)), 0), MAX_WAIT)
+    except ValueError:
+        return 0
+
+
+class ScrapingJobStatusAPIView(View):
+    """
+    Async status of a job, with the scraped property once it has completed.
+
+    With ?wait=<seconds> (up to 60) the request long-polls: it answers as soon
+    as the job completes or fails, woken by the job's channel-layer group
+    rather than by polling the database.
+    """
+
+    async def get(self, request, job_id):
+        try:
+            user = await get_request_user(request)
+        except InvalidToken as e:
+            return JsonResponse(e.detail, status=e.status_code)
+
+        job = await get_job_for_user(job_id, user.pk)
+        if job is None:
+            return JsonResponse({"error": "Job not found"}, status=404)
+
+        wait = get_wait(request)
+        if wait and job["status"] not in TERMINAL_STATUSES:
+            job = await self.wait_for_job(job_id, user.pk, wait)
+        return JsonResponse(await get_job_result(job), status=status.HTTP_200_OK)
+
+    async def wait_for_job(self, job_id, user_id, wait):
+        deadline = time.monotonic() + wait
+        async with JobSubscription(job_id) as subscription:
+            # Read the state again once subscribed, the job may have finished
+            # in between
+            job = await get_job_for_user(job_id, user_id)
+            while job["status"] not in TERMINAL_STATUSES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                event = await subscription.receive(remaining)
+                if event is None:
+                    break
+                if event["status"] in TERMINAL_STATUSES:
+                    job = await get_job_for_user(job_id, user_id) or job
+        return job
+
+
+def format_event(name, data, event_id=None):
+    lines = [f"event: {name}", f"data: {json.dumps(data, default=str)}"]
+    if event_id is not None:
+        lines.insert(0, f"id: {event_id}")
+    return "\n".join(lines) + "\n\n"
+
+
+class ScrapingJobEventsAPIView(View):
+    """
+    Server-Sent Events stream of a job's progress, for clients that can't use
+    the ws/scraper/ websocket.
+
+    Events missed before connecting, or after Last-Event-ID on a reconnect,
+    are replayed first. The stream ends with a "result" event once the job
+    completes or fails.
+    """
+
+    async def get(self, request, job_id):
+        try:
+            user = await get_request_user(request)
+        except InvalidToken as e:
+            return JsonResponse(e.detail, status=e.status_code)
+
+        if await get_job_for_user(job_id, user.pk) is None:
+            return JsonResponse({"error": "Job not found"}, status=404)
+
+        try:
+            last_seq = int(
+                request.headers.get("Last-Event-ID") or request.GET.get("last_seq", 0)
+            )
+        except ValueError:
+            last_seq = 0
+
+        response = StreamingHttpResponse(
+            self.stream(job_id, user.pk, last_seq), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # Stop nginx from buffering the stream
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def stream(self, job_id, user_id, last_seq):
+        deadline = time.monotonic() + MAX_STREAM_DURATION
+        async with JobSubscription(job_id) as subscription:
+            for event in await sync_to_async(get_replay)(job_id, last_seq):
+                last_seq = event["seq"]
+                yield format_event(event["status"], event, event["seq"])
+
+            job = await get_job_for_user(job_id, user_id)
+            while job and job["status"] not in TERMINAL_STATUSES:
+                if time.monotonic() > deadline:
+                    return
+                event = await subscription.receive(KEEPALIVE_INTERVAL)
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                if event["seq"] <= last_seq:
+                    continue
+                last_seq = event["seq"]
+                yield format_event(event["status"], event, event["seq"])
+                if event["status"] in TERMINAL_STATUSES:
+                    job = await get_job_for_user(job_id, user_id)
+
+            if job:
+                yield format_event("result", await get_job_result(job))
 
 
 # if any part fails, what happens, does it reach out to us
@@ -2,31 +2,80 @@
 
 import os
 import time
+from abc import ABC, abstractmethod
 
 import requests
+from pascraper.config.logging_config import configure_logger
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
+from utils.http_cache import get_http_cache
+from utils.proxy_pool import get_proxy_pool
 
+logger = configure_logger(__name__)
 
-class BaseScraper:
+# HTTP-only workers set SCRAPER_BROWSER_ENABLED=0 so a scrape that needs
+# Chromium is handed to the browser queue instead of starting one there
+BROWSER_ENABLED = os.environ.get("SCRAPER_BROWSER_ENABLED", "1") != "0"
+
+
+class BrowserRequired(Exception):
+    """
+    Raised when a scrape needs a browser on a process that may not start one.
+    """
+
+
+class BaseScraper(ABC):
     def __init__(self, url):
         self.base_url = url
         self.image_url = f"{url}#/media?id=media0&ref=photoCollage&channel=RES_BUY"
         self.floor_image_url = f"{url}#/floorplan?activePlan=1&channel=RES_BUY"
         self.driver = None
+        self.proxy_lease = None
+        # HTML of every page the scrape read, by name, kept for the archive
+        self.pages = {}
+
+    def record_page(self, name, html):
+        if html:
+            self.pages[name] = html
+        return html
+
+    @abstractmethod
+    def extract_pages(self, pages):
+        """
+        Extract the property details from recorded pages, without fetching
+        anything, so archived pages can be re-run through current extractors.
+        """
 
     def get_html_content(self):
         """
         Fetch the HTML content of the page using requests.
         """
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        try:
-            response = requests.get(self.url, headers=headers)
-            response.raise_for_status()
+        http_cache = get_http_cache()
+        # A fresh cached copy takes no request, so it takes no egress point
+        # either and doesn't skew its latency
+        response = http_cache.get_fresh(self.base_url)
+        if response is not None:
             return response.text
+
+        try:
+            with get_proxy_pool().acquire(self.base_url) as lease:
+                # Unchanged pages are answered with a 304 and read from disk.
+                # Responses are checked for a block page before being cached.
+                response = http_cache.get(
+                    self.base_url,
+                    headers=lease.headers,
+                    proxies=lease.proxies,
+                    timeout=20,
+                    validate=lambda r: lease.check_response(r.status_code, r.text),
+                )
+                if lease.banned:
+                    logger.warning(
+                        f"Blocked fetching {self.base_url} via {lease.endpoint.name}"
+                    )
+                    return None
+                response.raise_for_status()
+                return response.text
         except requests.exceptions.RequestException as e:
             print(f"Error fetching URL: {e}")
             return None
@@ -35,22 +84,37 @@ class BaseScraper:
         """
         Initialize Selenium WebDriver.
         """
+        if not BROWSER_ENABLED:
+            raise BrowserRequired(self.base_url)
+
         options = Options()
         options.add_argument("--headless")  # Run in headless mode
         options.add_argument("--no-sandbox")
         options.add_argument("--disable-dev-shm-usage")
         options.add_argument("--disable-gpu")
-        options.add_argument("--window-size=1920,1080")
         options.add_argument("--disable-features=VizDisplayCompositor")
 
+        # Egress point and browser profile, kept until quit_selenium
+        self.proxy_lease = get_proxy_pool().acquire(self.base_url, browser=True)
+        profile = self.proxy_lease.profile
+        options.add_argument(f"--window-size={profile['window_size']}")
+        options.add_argument(f"--user-agent={profile['user_agent']}")
+        options.add_argument(f"--lang={profile['accept_language'].split(',')[0]}")
+        if self.proxy_lease.endpoint.url:
+            options.add_argument(f"--proxy-server={self.proxy_lease.endpoint.url}")
+
         # Specify the path to the Chromium executable
         options.binary_location = "/usr/bin/chromium"
 
         # Specify the path to the Chromium Driver
         service = Service("/usr/bin/chromedriver")
 
-        self.driver = webdriver.Chrome(service=service, options=options)
-        self.driver.get(self.base_url)
+        try:
+            self.driver = webdriver.Chrome(service=service, options=options)
+            self.driver.get(self.base_url)
+        except Exception:
+            self.quit_selenium(ok=False)
+            raise
 
         # Let the page load completely
         time.sleep(5)  # Adjust as needed to ensure full page load
@@ -59,12 +123,18 @@ class BaseScraper:
         self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
         time.sleep(2)
 
-    def quit_selenium(self):
+    def quit_selenium(self, ok=True):
         """
-        Quit the Selenium WebDriver.
+        Quit the Selenium WebDriver and report how its egress point did.
         """
         if self.driver:
+            if ok and self.proxy_lease:
+                self.proxy_lease.check_response(200, self.driver.title)
             self.driver.quit()
+            self.driver = None
+        if self.proxy_lease:
+            self.proxy_lease.release(ok=ok)
+            self.proxy_lease = None
 
     def download_images(self, image_urls, save_folder="property_images"):
         """
@@ -75,7 +145,7 @@ class BaseScraper:
 
         for idx, img_url in enumerate(image_urls):
             try:
-                img_data = requests.get(img_url).content
+                img_data = get_http_cache().get(img_url, timeout=20).content
                 img_name = os.path.join(save_folder, f"image_{idx}.jpg")
                 with open(img_name, "wb") as img_file:
                     img_file.write(img_data)
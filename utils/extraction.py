@@ -0,0 +1,188 @@
+# extraction.py
+
+import json
+import re
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+# Pages above this size are pruned while streamed through lxml before they
+# are turned into a BeautifulSoup tree, which takes several times more memory
+LARGE_PAGE_SIZE = 2 * 1024 * 1024
+FEED_SIZE = 64 * 1024
+# Markup no extractor reads, often most of a large page's elements
+PRUNED_TAGS = ("svg", "style", "noscript", "iframe")
+
+
+def parse_html(html):
+    if len(html) > LARGE_PAGE_SIZE:
+        html = prune_html(html)
+    return BeautifulSoup(html, "lxml")
+
+
+def free_soup(soup):
+    """
+    Break up a parsed tree once extraction is done. Tags reference each
+    other in cycles, so otherwise the tree lingers until the cyclic garbage
+    collector gets round to it.
+    """
+    if soup is not None:
+        soup.decompose()
+
+
+def iter_html_events(html, feed_size=FEED_SIZE):
+    """
+    Parse a page in chunks, yielding ("end", element) as each element closes.
+    """
+    parser = etree.HTMLPullParser(events=("end",))
+    for start in range(0, len(html), feed_size):
+        parser.feed(html[start : start + feed_size])
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+def remove_element(element):
+    # Keep the text that follows the element in the document
+    parent = element.getparent()
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + element.tail
+        else:
+            parent.text = (parent.text or "") + element.tail
+    parent.remove(element)
+
+
+def prune_html(html):
+    """
+    Return the page without its PRUNED_TAGS, removing each as soon as it has
+    been parsed so the full tree never exists at once.
+    """
+    element = None
+    for _, element in iter_html_events(html):
+        if element.tag in PRUNED_TAGS and element.getparent() is not None:
+            remove_element(element)
+    if element is None:
+        return html
+    root = element.getroottree().getroot()
+    return etree.tostring(root, method="html", encoding="unicode")
+
+
+def iter_tag_attributes(html, tags):
+    """
+    Yield the (tag, attributes) of the given tags in document order without
+    building a tree. Elements are dropped as soon as they have been parsed,
+    so memory stays flat however large the page is.
+    """
+    for _, element in iter_html_events(html):
+        if element.tag in tags:
+            yield element.tag, dict(element.attrib)
+        element.clear()
+        # Earlier siblings are done with, unlink them from the parent too
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def load_script_json(soup, script_id):
+    """
+    Load the JSON payload of a <script id="..."> tag, e.g. Next.js __NEXT_DATA__.
+    """
+    script = soup.find("script", id=script_id)
+    if not script or not script.string:
+        return None
+    try:
+        return json.loads(script.string)
+    except ValueError:
+        return None
+
+
+def load_script_variable(soup, name):
+    """
+    Load a JSON object assigned to a global in an inline script, e.g.
+    Rightmove's window.PAGE_MODEL = {...}.
+    """
+    assignment = re.compile(rf"(?:window\.)?{re.escape(name)}\s*=\s*")
+    for script in soup.find_all("script", src=False):
+        text = script.string or ""
+        match = assignment.search(text)
+        if not match:
+            continue
+        try:
+            data, _ = json.JSONDecoder().raw_decode(text, match.end())
+        except ValueError:
+            continue
+        return data
+    return None
+
+
+def load_json_ld(soup):
+    """
+    Return every JSON-LD object embedded in the page.
+    """
+    objects = []
+    for script in soup.find_all("script", type="application/ld+json"):
+        try:
+            data = json.loads(script.string or "")
+        except ValueError:
+            continue
+        if isinstance(data, list):
+            objects.extend(data)
+        elif isinstance(data, dict):
+            objects.extend(data.get("@graph", [data]))
+    return objects
+
+
+def dig(data, path, default=None):
+    """
+    Follow a dotted path such as 'counts.numBedrooms' or 'images.0.url'.
+    """
+    for part in path.split("."):
+        if isinstance(data, dict):
+            data = data.get(part)
+        elif isinstance(data, list) and part.isdigit() and int(part) < len(data):
+            data = data[int(part)]
+        else:
+            return default
+        if data is None:
+            return default
+    return data
+
+
+def find_key(data, key):
+    """
+    Depth-first search for the first value stored under a key.
+    """
+    if isinstance(data, dict):
+        if key in data:
+            return data[key]
+        children = data.values()
+    elif isinstance(data, list):
+        children = data
+    else:
+        return None
+    for child in children:
+        found = find_key(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def select_text(soup, selector):
+    tag = soup.select_one(selector)
+    if tag:
+        return tag.get_text(" ", strip=True)
+    return None
+
+
+def select_all_text(soup, selector):
+    return [tag.get_text(" ", strip=True) for tag in soup.select(selector)]
+
+
+def select_image_urls(soup, selector):
+    images = []
+    for img_tag in soup.select(selector):
+        img_url = img_tag.get("data-src") or img_tag.get("src")
+        if img_url and img_url.startswith("http") and img_url not in images:
+            images.append(img_url)
+    return images
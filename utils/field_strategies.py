@@ -0,0 +1,231 @@
+# field_strategies.py
+
+import random
+import re
+import time
+from collections import Counter
+
+from pascraper.config.logging_config import configure_logger
+from pascraper.config.redis_client import get_redis
+from redis.exceptions import RedisError
+from utils.extraction import dig, select_text
+
+logger = configure_logger(__name__)
+
+# Hourly hit counters per field, {strategy}:attempts / {strategy}:hits
+STATS_KEY = "extraction:{source}:{field}:{hour}"
+STATS_TTL = 60 * 60 * 48
+# Hours of counters the strategy ranking is computed from
+RANKING_WINDOW = 6
+RANKING_TTL = 5 * 60
+
+# Share of pages on which every strategy is tried, so the ones ranked below
+# the winner keep fresh hit rates and can be promoted
+SHADOW_SAMPLE_RATE = 0.1
+
+# Alert when fewer than this share of a field's extractions succeed within
+# the current hour, once it has enough attempts
+ALERT_THRESHOLD = 0.8
+ALERT_MIN_ATTEMPTS = 20
+ALERT_KEY = "extraction:alert:{source}:{field}"
+ALERT_INTERVAL = 60 * 60
+
+FIELD_TOTAL = "_field"
+
+# Strategies are only ranked against others of their tier, and lower tiers
+# are always tried first. Unscoped fallbacks, like a regex over the whole
+# page text, find something on almost any page, so a high hit rate doesn't
+# mean they found the right value.
+SCOPED = 0
+UNSCOPED = 1
+
+
+class Page:
+    """
+    A parsed page plus the embedded JSON loaded from it, so strategies
+    reading the same payload only parse it once.
+    """
+
+    def __init__(self, soup):
+        self.soup = soup
+        self.text = None
+        self.loaded = {}
+
+    def load(self, loader):
+        if loader not in self.loaded:
+            self.loaded[loader] = loader(self.soup)
+        return self.loaded[loader]
+
+    def get_text(self):
+        if self.text is None:
+            self.text = self.soup.get_text(" ", strip=True)
+        return self.text
+
+
+class JsonPathStrategy:
+    def __init__(self, name, loader, path, tier=SCOPED):
+        self.name = name
+        self.loader = loader
+        self.path = path
+        self.tier = tier
+
+    def extract(self, page):
+        data = page.load(self.loader)
+        return dig(data, self.path) if data else None
+
+
+class SelectorStrategy:
+    def __init__(self, name, selector, tier=SCOPED):
+        self.name = name
+        self.selector = selector
+        self.tier = tier
+
+    def extract(self, page):
+        return select_text(page.soup, self.selector)
+
+
+class RegexStrategy:
+    def __init__(self, name, pattern, tier=UNSCOPED):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.tier = tier
+
+    def extract(self, page):
+        match = self.pattern.search(page.get_text())
+        return match.group() if match else None
+
+
+def get_hour(timestamp=None):
+    return time.strftime("%Y%m%d%H", time.gmtime(timestamp))
+
+
+class FieldStrategies:
+    """
+    Ordered ways of extracting one field of one portal.
+
+    The declared order is the starting ranking. Once the strategies have hit
+    counters, they are tried best hit rate first within their tier, so a
+    strategy that keeps working takes over from one that broke (e.g. an
+    obfuscated class name that changed).
+    """
+
+    def __init__(self, source, field, strategies):
+        self.source = source
+        self.field = field
+        self.strategies = strategies
+        self.ranking = list(strategies)
+        self.ranked_at = 0
+
+    def stats_key(self, hour):
+        return STATS_KEY.format(source=self.source, field=self.field, hour=hour)
+
+    def get_hit_rates(self):
+        now = time.time()
+        pipeline = get_redis().pipeline(transaction=False)
+        for hours_ago in range(RANKING_WINDOW):
+            pipeline.hgetall(self.stats_key(get_hour(now - hours_ago * 3600)))
+        totals = Counter()
+        for stats in pipeline.execute():
+            totals.update({name: int(count) for name, count in stats.items()})
+
+        # Smoothed so a strategy with a couple of lucky hits doesn't jump ahead
+        return {
+            strategy.name: (totals[f"{strategy.name}:hits"] + 1)
+            / (totals[f"{strategy.name}:attempts"] + 2)
+            for strategy in self.strategies
+        }
+
+    def ranked(self):
+        if time.time() - self.ranked_at < RANKING_TTL:
+            return self.ranking
+        try:
+            rates = self.get_hit_rates()
+        except RedisError as e:
+            logger.warning(f"Could not rank {self.source} {self.field}: {e}")
+        else:
+            # sorted() is stable, ties keep the declared order
+            ranking = sorted(self.strategies, key=lambda s: (s.tier, -rates[s.name]))
+            if ranking[0] is not self.ranking[0]:
+                logger.info(
+                    f"Promoted {ranking[0].name} for {self.source} {self.field}"
+                )
+            self.ranking = ranking
+        self.ranked_at = time.time()
+        return self.ranking
+
+
+class ExtractionStats:
+    """
+    Counts strategy attempts and hits during a scrape and sends them to
+    Redis in one round trip with flush().
+    """
+
+    def __init__(self, shadow_sample_rate=SHADOW_SAMPLE_RATE):
+        self.shadow = random.random() < shadow_sample_rate
+        self.counts = {}
+
+    def extract(self, field_strategies, page):
+        """
+        Return the first value a strategy finds, in ranking order.
+        """
+        counts = self.counts.setdefault(field_strategies, Counter())
+        value = None
+        for strategy in field_strategies.ranked():
+            try:
+                found = strategy.extract(page)
+            except Exception as e:
+                logger.warning(
+                    f"{strategy.name} failed on {field_strategies.field}: {e}"
+                )
+                found = None
+            counts[f"{strategy.name}:attempts"] += 1
+            if found:
+                counts[f"{strategy.name}:hits"] += 1
+                if value is None:
+                    value = found
+                if not self.shadow:
+                    break
+
+        counts[f"{FIELD_TOTAL}:attempts"] += 1
+        if value is not None:
+            counts[f"{FIELD_TOTAL}:hits"] += 1
+        return value
+
+    def flush(self):
+        if not self.counts:
+            return
+        hour = get_hour()
+        fields = list(self.counts.items())
+        try:
+            pipeline = get_redis().pipeline(transaction=False)
+            for field_strategies, counts in fields:
+                key = field_strategies.stats_key(hour)
+                for name, count in counts.items():
+                    pipeline.hincrby(key, name, count)
+                # Totals for the hour, read back with the increments
+                pipeline.hincrby(key, f"{FIELD_TOTAL}:attempts", 0)
+                pipeline.hincrby(key, f"{FIELD_TOTAL}:hits", 0)
+                pipeline.expire(key, STATS_TTL)
+            results = iter(pipeline.execute())
+
+            for field_strategies, counts in fields:
+                for _ in counts:
+                    next(results)
+                attempts, hits, _ = next(results), next(results), next(results)
+                self.check_success_rate(field_strategies, attempts, hits)
+        except RedisError as e:
+            logger.warning(f"Could not record extraction stats: {e}")
+        self.counts = {}
+
+    def check_success_rate(self, field_strategies, attempts, hits):
+        if attempts < ALERT_MIN_ATTEMPTS or hits / attempts >= ALERT_THRESHOLD:
+            return
+        alert_key = ALERT_KEY.format(
+            source=field_strategies.source, field=field_strategies.field
+        )
+        # One alert per field per interval
+        if get_redis().set(alert_key, 1, nx=True, ex=ALERT_INTERVAL):
+            logger.error(
+                f"Extraction of {field_strategies.source} {field_strategies.field} "
+                f"is failing: {hits}/{attempts} pages this hour"
+            )
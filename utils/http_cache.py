@@ -0,0 +1,285 @@
+# http_cache.py
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from pascraper.config.logging_config import configure_logger
+
+logger = configure_logger(__name__)
+
+MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+# Eviction starts once the size limit is exceeded and frees space down to
+# this share of it, so it doesn't run again on the next store
+EVICT_TO = 0.9
+EVICT_BATCH = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    content_type TEXT,
+    fresh_until REAL NOT NULL,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+"""
+
+
+def get_fresh_until(headers, now):
+    """
+    How long a response may be reused without asking the server, from its
+    Cache-Control max-age.
+    """
+    match = MAX_AGE_RE.search(headers.get("Cache-Control", ""))
+    return now + int(match.group(1)) if match else now
+
+
+def is_storable(response):
+    cache_control = response.headers.get("Cache-Control", "")
+    if "no-store" in cache_control:
+        return False
+    # Without a validator or a lifetime, a cached copy could never be reused
+    return bool(
+        response.headers.get("ETag")
+        or response.headers.get("Last-Modified")
+        or MAX_AGE_RE.search(cache_control)
+    )
+
+
+class HTTPCache:
+    """
+    On-disk cache of GET responses, bounded in size with LRU eviction.
+
+    Bodies are files named by the hash of their URL, the validators and
+    access times live in a SQLite index. A cached response within its
+    max-age is served without a request; otherwise the request carries
+    If-None-Match / If-Modified-Since and a 304 is answered from the cache.
+
+    The size of the cache is kept as a running total, adjusted on every
+    store and eviction, and only summed from the index again before evicting
+    since other processes share the directory.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.local = threading.local()
+        self.evict_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        db = self.connect()
+        db.executescript(SCHEMA)
+        self.total = self.get_total(db)
+        db.close()
+
+    def connect(self):
+        db = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    @property
+    def db(self):
+        # One connection per thread and process, SQLite ones can't be shared
+        if getattr(self.local, "pid", None) != os.getpid():
+            self.local.db = self.connect()
+            self.local.pid = os.getpid()
+        return self.local.db
+
+    def get_total(self, db):
+        return db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get_key(self, url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def lookup(self, key):
+        row = self.db.execute(
+            "SELECT etag, last_modified, content_type, fresh_until FROM entries "
+            "WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None or not os.path.exists(self.get_path(key)):
+            return None
+        return dict(zip(("etag", "last_modified", "content_type", "fresh_until"), row))
+
+    def read(self, key):
+        with open(self.get_path(key), "rb") as body_file:
+            body = body_file.read()
+        with self.db:
+            self.db.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+        return body
+
+    def store(self, key, url, response):
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, so a reader never sees half a body
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as body_file:
+            body_file.write(response.content)
+        os.replace(temp_path, path)
+
+        now = time.time()
+        with self.db:
+            replaced = self.db.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    url,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    response.headers.get("Content-Type"),
+                    get_fresh_until(response.headers, now),
+                    len(response.content),
+                    now,
+                ),
+            )
+        self.total += len(response.content) - (replaced[0] if replaced else 0)
+        if self.total > self.max_size:
+            self.evict()
+
+    def refresh(self, key, response):
+        """
+        Take the new lifetime and validators a 304 may carry.
+        """
+        now = time.time()
+        with self.db:
+            self.db.execute(
+                "UPDATE entries SET fresh_until = ?, accessed_at = ?, "
+                "etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) "
+                "WHERE key = ?",
+                (
+                    get_fresh_until(response.headers, now),
+                    now,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    key,
+                ),
+            )
+
+    def evict(self):
+        with self.evict_lock:
+            # Other processes store into the same directory, resync first
+            total = self.get_total(self.db)
+            target = self.max_size * EVICT_TO
+            while total > target:
+                rows = self.db.execute(
+                    "SELECT key, size FROM entries ORDER BY accessed_at LIMIT ?",
+                    (EVICT_BATCH,),
+                ).fetchall()
+                if not rows:
+                    break
+                # Only as many of the oldest entries as it takes to get under target
+                evicted = []
+                for key, size in rows:
+                    evicted.append(key)
+                    total -= size
+                    if total <= target:
+                        break
+                with self.db:
+                    self.db.executemany(
+                        "DELETE FROM entries WHERE key = ?", [(key,) for key in evicted]
+                    )
+                for key in evicted:
+                    try:
+                        os.remove(self.get_path(key))
+                    except FileNotFoundError:
+                        pass
+            self.total = total
+
+    def build_response(self, url, key, entry, response=None):
+        """
+        Turn a cache entry into a 200 response, from the 304 when there is one.
+        """
+        if response is None:
+            response = requests.Response()
+            response.url = url
+            response.headers["Content-Type"] = entry["content_type"] or ""
+        response.status_code = 200
+        response._content = self.read(key)
+        response.from_cache = True
+        return response
+
+    def get_fresh(self, url):
+        """
+        Return the cached response for a URL while it is within its max-age,
+        or None when getting it would take a request.
+        """
+        key = self.get_key(url)
+        try:
+            entry = self.lookup(key)
+            if entry and entry["fresh_until"] > time.time():
+                return self.build_response(url, key, entry)
+        except (sqlite3.Error, OSError):
+            # Missing or evicted since the lookup
+            pass
+        return None
+
+    def get(self, url, session=None, headers=None, validate=None, **kwargs):
+        """
+        GET a URL through the cache. Takes the arguments of requests.get and
+        returns a requests.Response with from_cache set.
+
+        validate is called with every response fetched from the network, and
+        only those it accepts are stored, e.g. to keep block pages served
+        with a 200 out of the cache.
+        """
+        session = session or requests
+        key = self.get_key(url)
+        try:
+            entry = self.lookup(key)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"HTTP cache lookup failed for {url}: {e}")
+            entry = None
+
+        if entry and entry["fresh_until"] > time.time():
+            try:
+                return self.build_response(url, key, entry)
+            except OSError:
+                # Evicted since the lookup
+                entry = None
+
+        conditional_headers = dict(headers or {})
+        if entry:
+            if entry["etag"]:
+                conditional_headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                conditional_headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = session.get(url, headers=conditional_headers, **kwargs)
+        if entry and response.status_code == 304:
+            try:
+                self.refresh(key, response)
+                return self.build_response(url, key, entry, response)
+            except (sqlite3.Error, OSError):
+                response = session.get(url, headers=headers, **kwargs)
+
+        response.from_cache = False
+        valid = validate is None or validate(response)
+        if valid and response.status_code == 200 and is_storable(response):
+            try:
+                self.store(key, url, response)
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"Could not cache {url}: {e}")
+        return response
+
+
+@lru_cache(maxsize=None)
+def get_http_cache():
+    return HTTPCache(settings.HTTP_CACHE_DIR, settings.HTTP_CACHE_MAX_SIZE)
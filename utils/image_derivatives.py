@@ -0,0 +1,160 @@
+# image_derivatives.py
+
+import hashlib
+import io
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import requests
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+from pascraper.config.logging_config import configure_logger
+from pascraper.config.storage_backends import get_media_storage
+from utils.http_cache import get_http_cache
+
+logger = configure_logger(__name__)
+
+# Bounding box for each variant, the aspect ratio of the original is kept
+DERIVATIVE_SIZES = {
+    "thumb": (320, 240),
+    "medium": (1024, 768),
+}
+
+# AVIF is only produced when Pillow was built with libavif
+DERIVATIVE_FORMATS = ["webp"] + (["avif"] if features.check("avif") else [])
+
+FORMAT_OPTIONS = {
+    "webp": {"quality": 80, "method": 4},
+    "avif": {"quality": 60},
+}
+
+
+def derivative_key(image_url, variant, fmt):
+    """
+    Build the deterministic storage key of a derivative for an image URL.
+    """
+    digest = hashlib.sha1(image_url.encode("utf-8")).hexdigest()
+    return f"derivatives/{digest[:2]}/{digest}/{variant}.{fmt}"
+
+
+def render_derivatives(image_bytes):
+    """
+    Resize and re-encode an image into every variant and format.
+
+    Runs inside a worker process, so it only takes and returns bytes.
+    """
+    rendered = {}
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGB")
+            for variant, size in DERIVATIVE_SIZES.items():
+                resized = image.copy()
+                resized.thumbnail(size, Image.LANCZOS)
+                for fmt in DERIVATIVE_FORMATS:
+                    buffer = io.BytesIO()
+                    resized.save(buffer, format=fmt.upper(), **FORMAT_OPTIONS[fmt])
+                    rendered[f"{variant}.{fmt}"] = buffer.getvalue()
+    except (UnidentifiedImageError, OSError):
+        return {}
+    return rendered
+
+
+class InlineExecutor:
+    """
+    Executor running each call in place, for max_workers=0.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class DerivativeGenerator:
+    """
+    Generate thumbnails and WebP/AVIF variants for listing images.
+
+    Downloads happen in the calling process while resizing is handed to a
+    process pool, so the next image is fetched while the previous one is
+    being encoded. With max_workers=0 images are rendered in the calling
+    process, as Celery's prefork children can't start a pool of their own.
+    """
+
+    def __init__(self, storage=None, max_workers=None, timeout=15):
+        self.storage = storage or get_media_storage()
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+    def existing_keys(self, image_url):
+        keys = {}
+        for variant in DERIVATIVE_SIZES:
+            for fmt in DERIVATIVE_FORMATS:
+                key = derivative_key(image_url, variant, fmt)
+                if not self.storage.exists(key):
+                    return None
+                keys[f"{variant}.{fmt}"] = key
+        return keys
+
+    def download(self, session, image_url):
+        try:
+            # Listing photos rarely change, so most downloads are revalidations
+            response = get_http_cache().get(
+                image_url, session=session, timeout=self.timeout
+            )
+            response.raise_for_status()
+            return response.content
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Failed to download {image_url}: {e}")
+            return None
+
+    def store(self, image_url, rendered):
+        keys = {}
+        for name, data in rendered.items():
+            variant, fmt = name.split(".")
+            key = derivative_key(image_url, variant, fmt)
+            # MediaStorage does not overwrite, so an existing key is reused
+            if not self.storage.exists(key):
+                self.storage.save(key, ContentFile(data))
+            keys[name] = key
+        return keys
+
+    def generate(self, image_urls):
+        """
+        Return a mapping of image URL to its derivative storage keys.
+        """
+        results = {}
+        futures = {}
+        if self.max_workers == 0:
+            pool = InlineExecutor()
+        else:
+            pool = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        with requests.Session() as session, pool:
+            for image_url in dict.fromkeys(image_urls):
+                existing = self.existing_keys(image_url)
+                if existing:
+                    results[image_url] = existing
+                    continue
+
+                image_bytes = self.download(session, image_url)
+                if image_bytes:
+                    futures[image_url] = pool.submit(render_derivatives, image_bytes)
+
+            for image_url, future in futures.items():
+                rendered = future.result()
+                if rendered:
+                    results[image_url] = self.store(image_url, rendered)
+                else:
+                    logger.warning(f"Could not render derivatives for {image_url}")
+
+        return results
@@ -0,0 +1,141 @@
+# normalize.py
+
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.utils import timezone
+
+POSTCODE_RE = re.compile(r"\b([A-Z]{1,2}\d[A-Z\d]?)\s*(\d[A-Z]{2})\b", re.I)
+OUTCODE_RE = re.compile(r"\b([A-Z]{1,2}\d[A-Z\d]?)\s*$", re.I)
+NUMBER_RE = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+ADDRESS_ABBREVIATIONS = {
+    "rd": "road",
+    "st": "street",
+    "ave": "avenue",
+    "ln": "lane",
+    "dr": "drive",
+    "ct": "court",
+    "pl": "place",
+    "sq": "square",
+    "cres": "crescent",
+    "gdns": "gardens",
+    "flat": "apartment",
+    "apt": "apartment",
+}
+
+
+def parse_price(value):
+    """
+    Convert a scraped price such as '£450,000' into a Decimal.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return Decimal(str(value))
+    match = NUMBER_RE.search(str(value))
+    if not match:
+        return None
+    try:
+        return Decimal(match.group().replace(",", ""))
+    except InvalidOperation:
+        return None
+
+
+def parse_int(value):
+    """
+    Pull the first whole number out of a scraped value such as 'x3' or '3 beds'.
+    """
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    match = re.search(r"\d+", str(value))
+    return int(match.group()) if match else None
+
+
+def extract_postcode(address):
+    """
+    Return the full postcode in an address, or just the outcode if that is all
+    the portal shows (e.g. 'Abbey Road, London, NW8').
+    """
+    if not address:
+        return None
+    match = POSTCODE_RE.search(address)
+    if match:
+        return f"{match.group(1)} {match.group(2)}".upper()
+    match = OUTCODE_RE.search(address.strip().rstrip(","))
+    if match:
+        return match.group(1).upper()
+    return None
+
+
+# Checked in order, "sold stc" must win over a plain "sold"
+LISTING_STATUS_PATTERNS = [
+    ("under_offer", re.compile(r"\bunder\s+offer\b|\bsold\s+stc\b", re.I)),
+    ("let_agreed", re.compile(r"\blet\s+agreed\b", re.I)),
+    ("sold", re.compile(r"\bsold\b", re.I)),
+]
+
+
+def parse_listing_status(*values):
+    """
+    Find the listing status in scraped labels such as 'Under offer' or
+    'Sold STC', defaulting to 'available'.
+    """
+    text = " ".join(str(value) for value in values if value)
+    for status, pattern in LISTING_STATUS_PATTERNS:
+        if pattern.search(text):
+            return status
+    return "available"
+
+
+def get_outcode(postcode):
+    if not postcode:
+        return None
+    return postcode.split()[0].upper()
+
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = {"channel", "ref", "search_identifier", "fbclid", "gclid"}
+
+
+def normalize_url(url):
+    """
+    Reduce a listing URL to a canonical form, so the same page requested with
+    different tracking parameters, fragments or hosts is recognised.
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith("utm_")
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+
+def normalize_address(address):
+    """
+    Lower-case an address, drop the postcode and punctuation and expand common
+    abbreviations so the same street compares equal across portals.
+    """
+    if not address:
+        return ""
+    address = POSTCODE_RE.sub(" ", address)
+    address = OUTCODE_RE.sub(" ", address.strip().rstrip(","))
+    words = re.sub(r"[^a-z0-9 ]", " ", address.lower()).split()
+    return " ".join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def get_day_start(day):
+    """
+    Midnight of a date as an aware datetime, to filter a datetime column by
+    day without casting it.
+    """
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
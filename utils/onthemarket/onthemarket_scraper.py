@@ -1,17 +1,34 @@
-from bs4 import BeautifulSoup
 from utils.base_scraper import BaseScraper
+from utils.extraction import free_soup, parse_html
+from utils.registry import NEEDS_BROWSER, register
 
 
+@register(
+    "onthemarket",
+    url_patterns=[r"^https?://(www\.)?onthemarket\.com/details/\d+"],
+    capabilities=[NEEDS_BROWSER],
+)
 class OnTheMarketScraper(BaseScraper):
     def __init__(self, url):
         super().__init__(url)
         self.property_details = {}
 
     def scrape(self):
-        self.init_selenium()
-        soup = BeautifulSoup(self.driver.page_source, "lxml")
-        self.extract_details(soup)
+        try:
+            self.init_selenium()
+            self.record_page("main", self.driver.page_source)
+        except Exception:
+            self.quit_selenium(ok=False)
+            raise
         self.quit_selenium()
+        return self.extract_pages(self.pages)
+
+    def extract_pages(self, pages):
+        soup = parse_html(pages["main"])
+        try:
+            self.extract_details(soup)
+        finally:
+            free_soup(soup)
         return self.property_details
 
     def extract_details(self, soup):
@@ -0,0 +1,237 @@
+# proxy_pool.py
+
+import random
+import threading
+import time
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from pascraper.config.logging_config import configure_logger
+
+logger = configure_logger(__name__)
+
+# Responses that mean the portal is refusing the egress point
+BAN_STATUS_CODES = (403, 429)
+# Phrases of the block and challenge pages portals serve with a 200
+BLOCK_MARKERS = (
+    "access denied",
+    "are you a robot",
+    "captcha",
+    "request blocked",
+    "unusual traffic",
+)
+
+# Weight of the latest result in the moving health score and latency
+SMOOTHING = 0.2
+# Assumed latency of an endpoint that hasn't been measured yet
+DEFAULT_LATENCY = 1.0
+# An endpoint is evicted for BAN_COOLDOWN, doubled for every further ban
+BAN_COOLDOWN = 10 * 60
+MAX_BAN_COOLDOWN = 6 * 60 * 60
+MAX_CONSECUTIVE_FAILURES = 3
+# How long a domain keeps the same egress point and browser profile
+STICKY_TTL = 10 * 60
+
+# Every profile is a Chromium build, so the User-Agent agrees with the
+# browser fingerprint when it is used by Selenium
+PROFILES = [
+    {
+        "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+        "accept_language": "en-GB,en;q=0.9",
+        "window_size": "1920,1080",
+    },
+    {
+        "user_agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36",
+        "accept_language": "en-GB,en-US;q=0.9,en;q=0.8",
+        "window_size": "1440,900",
+    },
+    {
+        "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36 Edg/126.0.0.0",
+        "accept_language": "en-GB,en;q=0.9",
+        "window_size": "1536,864",
+    },
+    {
+        "user_agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+        "accept_language": "en-GB,en;q=0.8",
+        "window_size": "1920,1080",
+    },
+]
+
+
+def looks_blocked(text):
+    text = (text or "")[:20000].lower()
+    return any(marker in text for marker in BLOCK_MARKERS)
+
+
+class ProxyEndpoint:
+    """
+    One egress point, a proxy URL or None for the host's own address.
+    """
+
+    def __init__(self, url=None):
+        self.url = url
+        self.score = 1.0
+        self.latency = None
+        self.consecutive_failures = 0
+        self.bans = 0
+        self.banned_until = 0
+
+    def __repr__(self):
+        return f"<ProxyEndpoint {self.name} score={self.score:.2f}>"
+
+    @property
+    def name(self):
+        if not self.url:
+            return "direct"
+        # Never log the credentials of a proxy
+        parts = urlsplit(self.url)
+        return f"{parts.scheme}://{parts.hostname}:{parts.port}"
+
+    @property
+    def has_credentials(self):
+        return bool(self.url and urlsplit(self.url).username)
+
+    def is_available(self, now):
+        return self.banned_until <= now
+
+    def weight(self):
+        return self.score / (self.latency or DEFAULT_LATENCY)
+
+    def record_success(self, latency):
+        self.score += SMOOTHING * (1 - self.score)
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += SMOOTHING * (latency - self.latency)
+        self.consecutive_failures = 0
+        self.bans = 0
+
+    def record_failure(self, now, banned=False):
+        self.score -= SMOOTHING * self.score
+        self.consecutive_failures += 1
+        if banned or self.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+            cooldown = min(BAN_COOLDOWN * 2**self.bans, MAX_BAN_COOLDOWN)
+            self.banned_until = now + cooldown
+            self.bans += 1
+            self.consecutive_failures = 0
+            logger.warning(f"Evicted {self.name} for {cooldown}s")
+
+
+class ProxyLease:
+    """
+    An egress point and browser profile checked out for one fetch. Used as a
+    context manager, it reports the outcome and latency back to the pool.
+    """
+
+    def __init__(self, pool, domain, endpoint, profile):
+        self.pool = pool
+        self.domain = domain
+        self.endpoint = endpoint
+        self.profile = profile
+        self.banned = False
+        self.started = time.monotonic()
+
+    @property
+    def proxies(self):
+        if not self.endpoint.url:
+            return None
+        return {"http": self.endpoint.url, "https": self.endpoint.url}
+
+    @property
+    def headers(self):
+        return {
+            "User-Agent": self.profile["user_agent"],
+            "Accept-Language": self.profile["accept_language"],
+        }
+
+    def check_response(self, status_code, text=None):
+        """
+        Flag the lease when the portal answered with a ban or block page.
+        """
+        if status_code in BAN_STATUS_CODES or looks_blocked(text):
+            self.banned = True
+        return not self.banned
+
+    def release(self, ok=True):
+        self.pool.release(self, ok=ok and not self.banned)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.release(ok=exc_type is None)
+        return False
+
+
+class ProxyPool:
+    """
+    Spread fetches over egress points by health and latency.
+
+    Each domain sticks to one endpoint and profile for STICKY_TTL, so a
+    portal sees a consistent visitor. Endpoints that get banned or keep
+    failing are evicted for a growing cooldown. State is per process, each
+    worker learns which endpoints are healthy from its own fetches.
+    """
+
+    def __init__(self, proxy_urls=(), profiles=PROFILES, sticky_ttl=STICKY_TTL):
+        self.direct = ProxyEndpoint()
+        self.endpoints = [ProxyEndpoint(url) for url in proxy_urls] or [self.direct]
+        self.profiles = profiles
+        self.sticky_ttl = sticky_ttl
+        self.sticky = {}
+        self.lock = threading.Lock()
+
+    def choose(self, candidates, now):
+        available = [endpoint for endpoint in candidates if endpoint.is_available(now)]
+        if not available:
+            # Everything is evicted, use whichever comes back first
+            return min(candidates, key=lambda endpoint: endpoint.banned_until)
+        weights = [endpoint.weight() for endpoint in available]
+        return random.choices(available, weights=weights)[0]
+
+    def acquire(self, url, browser=False):
+        """
+        Check out an endpoint and profile for a URL. Chromium can't pass proxy
+        credentials on its command line, so browser leases skip such proxies.
+        """
+        domain = urlsplit(url).hostname or ""
+        now = time.time()
+        candidates = self.endpoints
+        if browser:
+            candidates = [e for e in candidates if not e.has_credentials] or [
+                self.direct
+            ]
+
+        with self.lock:
+            sticky = self.sticky.get(domain)
+            if sticky:
+                endpoint, profile, expires_at = sticky
+                if (
+                    expires_at > now
+                    and endpoint in candidates
+                    and endpoint.is_available(now)
+                ):
+                    return ProxyLease(self, domain, endpoint, profile)
+
+            endpoint = self.choose(candidates, now)
+            profile = random.choice(self.profiles)
+            self.sticky[domain] = (endpoint, profile, now + self.sticky_ttl)
+            return ProxyLease(self, domain, endpoint, profile)
+
+    def release(self, lease, ok=True):
+        now = time.time()
+        with self.lock:
+            if ok:
+                lease.endpoint.record_success(time.monotonic() - lease.started)
+                return
+            lease.endpoint.record_failure(now, banned=lease.banned)
+            # Start the domain over on a new endpoint and profile
+            sticky = self.sticky.get(lease.domain)
+            if sticky and sticky[0] is lease.endpoint:
+                del self.sticky[lease.domain]
+
+
+@lru_cache(maxsize=None)
+def get_proxy_pool():
+    return ProxyPool(getattr(settings, "SCRAPER_PROXIES", ()))
@@ -0,0 +1,140 @@
+# registry.py
+
+import importlib
+import re
+
+from pascraper.config.logging_config import configure_logger
+from utils.base_scraper import BrowserRequired
+
+logger = configure_logger(__name__)
+
+# Capabilities a site plugin can declare
+HTTP_ONLY = "http_only"
+NEEDS_BROWSER = "needs_browser"
+EMBEDDED_JSON = "embedded_json"
+
+# Relative cost of one scrape, roughly proportional to the resources it ties up
+COST_HTTP = 1
+COST_HTTP_WITH_BROWSER_FALLBACK = 3
+COST_BROWSER = 10
+
+# Modules that register site plugins when imported
+PLUGIN_MODULES = [
+    "utils.rightmove.rightmove_scraper",
+    "utils.zoopla.zoopla_scraper",
+    "utils.onthemarket.onthemarket_scraper",
+]
+
+
+class SitePlugin:
+    def __init__(self, source, scraper_class, url_patterns, capabilities, cost):
+        self.source = source
+        self.scraper_class = scraper_class
+        self.url_patterns = [re.compile(pattern, re.I) for pattern in url_patterns]
+        self.capabilities = frozenset(capabilities)
+        self.cost = cost
+
+    def __repr__(self):
+        return (
+            f"<SitePlugin {self.source}:{self.scraper_class.__name__} cost={self.cost}>"
+        )
+
+    def matches(self, url):
+        return any(pattern.search(url) for pattern in self.url_patterns)
+
+    def scrape(self, url):
+        """
+        Return the scraped data and the HTML of the pages it was read from.
+        """
+        scraper = self.scraper_class(url)
+        return scraper.scrape(), scraper.pages
+
+    def extract(self, url, pages):
+        """
+        Re-run the current extractors over previously recorded pages.
+        """
+        return self.scraper_class(url).extract_pages(pages)
+
+
+_plugins = []
+_loaded = False
+
+
+def register(source, url_patterns, capabilities=(), cost=COST_BROWSER):
+    """
+    Class decorator registering a scraper as the engine for a site.
+
+    Every registered scraper takes the listing URL in its constructor and
+    returns the property details from scrape().
+    """
+
+    def decorator(scraper_class):
+        _plugins.append(
+            SitePlugin(source, scraper_class, url_patterns, capabilities, cost)
+        )
+        return scraper_class
+
+    return decorator
+
+
+def load_plugins():
+    global _loaded
+    if not _loaded:
+        for module in PLUGIN_MODULES:
+            importlib.import_module(module)
+        _loaded = True
+    return _plugins
+
+
+def get_sources():
+    return sorted({plugin.source for plugin in load_plugins()})
+
+
+def find_plugins(url, source=None):
+    """
+    Return the plugins able to handle a URL, cheapest first.
+    """
+    plugins = [
+        plugin
+        for plugin in load_plugins()
+        if plugin.matches(url) and (source is None or plugin.source == source)
+    ]
+    return sorted(plugins, key=lambda plugin: plugin.cost)
+
+
+def resolve(url, source=None):
+    plugins = find_plugins(url, source)
+    if not plugins:
+        raise ValueError(f"No scraper can handle {url}")
+    return plugins[0]
+
+
+def get_queue(url, source=None):
+    """
+    Return the Celery queue for scraping a URL: the browser queue when its
+    cheapest engine always needs Chromium, the http queue otherwise.
+    """
+    from pascraper.celery import BROWSER_QUEUE, HTTP_QUEUE
+
+    if NEEDS_BROWSER in resolve(url, source).capabilities:
+        return BROWSER_QUEUE
+    return HTTP_QUEUE
+
+
+def scrape_url(url, source=None):
+    """
+    Scrape a URL with the cheapest engine, falling back to the next one if it
+    fails. Returns the plugin used, the scraped data and the pages it read.
+    """
+    plugins = find_plugins(url, source)
+    if not plugins:
+        raise ValueError(f"No scraper can handle {url}")
+
+    for plugin in plugins[:-1]:
+        try:
+            return (plugin, *plugin.scrape(url))
+        except BrowserRequired:
+            raise
+        except Exception as e:
+            logger.warning(f"{plugin!r} failed for {url}, trying next engine: {e}")
+    return (plugins[-1], *plugins[-1].scrape(url))
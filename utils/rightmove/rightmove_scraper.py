@@ -1,30 +1,106 @@
 import re
 import time
 
-from bs4 import BeautifulSoup
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 from utils.base_scraper import BaseScraper
-
-
+from utils.extraction import (
+    free_soup,
+    iter_tag_attributes,
+    load_script_variable,
+    parse_html,
+)
+from utils.field_strategies import (
+    ExtractionStats,
+    FieldStrategies,
+    JsonPathStrategy,
+    Page,
+    RegexStrategy,
+    SelectorStrategy,
+)
+from utils.registry import NEEDS_BROWSER, register
+
+
+def load_page_model(soup):
+    return load_script_variable(soup, "PAGE_MODEL")
+
+
+PRICE_STRATEGIES = FieldStrategies(
+    "rightmove",
+    "price",
+    [
+        JsonPathStrategy(
+            "page_model", load_page_model, "propertyData.prices.primaryPrice"
+        ),
+        # Obfuscated class name, changes whenever Rightmove rebuilds its CSS
+        SelectorStrategy("price_class", "div._1gfnqJ3Vtd1z40MlC0MzXu span"),
+        SelectorStrategy("price_itemprop", '[itemprop="price"]'),
+        RegexStrategy("price_text", r"£\s?\d{1,3}(?:,\d{3})+"),
+    ],
+)
+
+FLOORPLAN_ALT = re.compile("Floorplan", re.I)
+
+
+@register(
+    "rightmove",
+    url_patterns=[r"^https?://(www\.)?rightmove\.co\.uk/properties/\d+"],
+    capabilities=[NEEDS_BROWSER],
+)
 class RightmoveScraper(BaseScraper):
     def __init__(self, url):
         super().__init__(url)
-        self.init_selenium()
-        self.wait = WebDriverWait(self.driver, 10)
-        self.soup = None  # Will be set after loading each page
+        self.wait = None
+        self.soup = None  # Parsed main page, only while it is extracted
+        self.page = None
+        self.stats = ExtractionStats()
+
+    def scrape(self):
+        try:
+            self.init_selenium()
+            self.wait = WebDriverWait(self.driver, 10)
+            data = self.scrape_property()
+        except Exception:
+            self.quit_selenium(ok=False)
+            raise
+        self.quit_selenium()
+        return data
 
     def scrape_property(self):
-        data = {}
+        self.load_page("main", self.base_url)
+        self.load_page("images", self.image_url)
+        self.load_page("floorplans", self.floor_image_url)
+        data = self.extract_pages(self.pages)
+        # Only live scrapes count towards the strategy hit rates, not replays
+        self.stats.flush()
+        return data
 
-        # Navigate to the main property page
-        self.driver.get(self.base_url)
+    def load_page(self, name, url):
+        self.driver.get(url)
         self.wait_for_page_load()
-        # self.soup = BeautifulSoup(self.driver.page_source, 'html.parser')
-        self.soup = BeautifulSoup(self.driver.page_source, "lxml")
+        return self.record_page(name, self.driver.page_source)
+
+    def extract_pages(self, pages):
+        # The main page is the only one parsed into a tree, and it is freed
+        # before returning so a long-lived worker doesn't accumulate them
+        self.soup = parse_html(pages["main"])
+        self.page = Page(self.soup)
+        try:
+            data = self.extract_main_page()
+        finally:
+            free_soup(self.soup)
+            self.soup = None
+            self.page = None
+
+        # The gallery pages are only scanned for their images
+        data["images"] = self.get_property_images(pages.get("images"))
+        data["floorplans"] = self.get_floorplans(pages.get("floorplans"))
 
-        # Extract data from the main page
+        return data
+
+    def extract_main_page(self):
+        data = {}
         data["address"] = self.get_address()
         data["price"] = self.get_price()
         data["bedrooms"] = self.get_bedrooms()
@@ -33,15 +109,8 @@ class RightmoveScraper(BaseScraper):
         data["house_type"] = self.get_house_type()
         data["agent"] = self.get_agent()
         data["description"] = self.get_description()
-        # data["time_on_market"] = self.get_time_on_market()
+        data["time_on_market"] = self.get_time_on_market()
         # data["features"] = self.get_features()
-
-        # Navigate to the images page and extract images
-        data["images"] = self.get_property_images()
-
-        # Navigate to the floorplan page and extract floorplans
-        data["floorplans"] = self.get_floorplans()
-
         return data
 
     def wait_for_page_load(self):
@@ -59,45 +128,32 @@ class RightmoveScraper(BaseScraper):
                 images.append(img_url)
         return images
 
-    def get_floorplans(self):
+    def get_floorplans(self, html):
         floorplans = []
-        # Navigate to the floorplan page
-        self.driver.get(self.floor_image_url)
-        self.wait_for_page_load()
-
-        floorplan_soup = BeautifulSoup(self.driver.page_source, "html.parser")
+        if not html:
+            return floorplans
 
         # Find the floorplan images
-        img_tags = floorplan_soup.find_all("img", alt=re.compile("Floorplan", re.I))
-        for img in img_tags:
+        for _, img in iter_tag_attributes(html, ("img",)):
             src = img.get("src")
-            if src and "media" in src:
+            if src and "media" in src and FLOORPLAN_ALT.search(img.get("alt", "")):
                 floorplans.append(src)
         return floorplans
 
-    def get_property_images(self):
+    def get_property_images(self, html):
         images = []
-        # Navigate to the images page
-        self.driver.get(self.image_url)
-        self.wait_for_page_load()
-
-        images_soup = BeautifulSoup(self.driver.page_source, "html.parser")
+        if not html:
+            return images
 
         # Find all image elements
-        img_tags = images_soup.find_all("img")
-        for img in img_tags:
+        for _, img in iter_tag_attributes(html, ("img",)):
             src = img.get("src")
             if src and "media" in src and "max_" not in src:
                 images.append(src)
         return images
 
     def get_price(self):
-        price_tag = self.soup.find("div", class_="_1gfnqJ3Vtd1z40MlC0MzXu")
-        if price_tag:
-            price_span = price_tag.find("span")
-            if price_span:
-                return price_span.get_text(strip=True)
-        return None
+        return self.stats.extract(PRICE_STRATEGIES, self.page)
 
     def get_bedrooms(self):
         return self.get_feature_value("BEDROOMS")
@@ -143,12 +199,14 @@ class RightmoveScraper(BaseScraper):
                 return desc_div.get_text(strip=True)
         return None
 
-    # def get_time_on_market(self, soup):
-    #     # Extract the 'Added on' date
-    #     div_tag = soup.find("div", text=lambda x: x and "Added on" in x)
-    #     if div_tag:
-    #         return div_tag.get_text(strip=True)
-    #     return None
+    def get_time_on_market(self):
+        # Extract the 'Added on' / 'Reduced on' date
+        div_tag = self.soup.find(
+            "div", string=lambda x: x and ("Added on" in x or "Reduced on" in x)
+        )
+        if div_tag:
+            return div_tag.get_text(strip=True)
+        return None
 
     # def get_features(self, soup):
     #     features = []
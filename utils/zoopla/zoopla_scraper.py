@@ -1,22 +1,137 @@
-from bs4 import BeautifulSoup
 from utils.base_scraper import BaseScraper
+from utils.extraction import (
+    dig,
+    find_key,
+    free_soup,
+    load_json_ld,
+    load_script_json,
+    parse_html,
+    select_all_text,
+    select_image_urls,
+    select_text,
+)
+from utils.registry import COST_HTTP_WITH_BROWSER_FALLBACK, EMBEDDED_JSON, register
 
+ZOOPLA_IMAGE_URL = "https://lid.zoocdn.com/u/1024/768/{filename}"
 
+
+@register(
+    "zoopla",
+    url_patterns=[
+        r"^https?://(www\.)?zoopla\.co\.uk/(for-sale|to-rent|new-homes)/details/"
+    ],
+    capabilities=[EMBEDDED_JSON],
+    cost=COST_HTTP_WITH_BROWSER_FALLBACK,
+)
 class ZooplaScraper(BaseScraper):
     def __init__(self, url):
         super().__init__(url)
         self.property_details = {}
 
     def scrape(self):
-        self.init_selenium()
-        soup = BeautifulSoup(self.driver.page_source, "lxml")
-        self.extract_details(soup)
-        self.quit_selenium()
+        # Zoopla server-renders its listing data, so try a plain HTTP fetch
+        # first and only start a browser if the page came back without it
+        html = self.get_html_content()
+        soup = parse_html(html) if html else None
+        if soup is None or not self.has_listing(soup):
+            free_soup(soup)
+            try:
+                self.init_selenium()
+                html = self.driver.page_source
+            except Exception:
+                self.quit_selenium(ok=False)
+                raise
+            self.quit_selenium()
+            soup = parse_html(html)
+        self.record_page("main", html)
+        return self.extract_soup(soup)
+
+    def extract_pages(self, pages):
+        return self.extract_soup(parse_html(pages["main"]))
+
+    def extract_soup(self, soup):
+        # The tree checked for a listing is the one extracted, then freed
+        try:
+            self.extract_details(soup)
+        finally:
+            free_soup(soup)
         return self.property_details
 
+    def has_listing(self, soup):
+        return bool(
+            self.get_listing_json(soup) or soup.select_one('[data-testid="price"]')
+        )
+
+    def get_listing_json(self, soup):
+        next_data = load_script_json(soup, "__NEXT_DATA__")
+        return find_key(next_data, "listingDetails") if next_data else None
+
     def extract_details(self, soup):
-        # Implement similar methods as in RightmoveScraper
-        pass
+        listing = self.get_listing_json(soup)
+        if listing:
+            self.property_details.update(self.extract_from_json(listing))
+
+        # Fill whatever the embedded data did not provide from the DOM
+        for field, value in self.extract_from_dom(soup).items():
+            if not self.property_details.get(field):
+                self.property_details[field] = value
+
+    def extract_from_json(self, listing):
+        images = [
+            ZOOPLA_IMAGE_URL.format(filename=image["filename"])
+            for image in listing.get("propertyImage") or []
+            if image.get("filename")
+        ]
+        floorplans = [
+            ZOOPLA_IMAGE_URL.format(filename=image["filename"])
+            for image in dig(listing, "floorPlan.image") or []
+            if image.get("filename")
+        ]
+        floor_area = dig(listing, "floorArea.value")
+        return {
+            "images": images,
+            "floorplans": floorplans,
+            "price": dig(listing, "pricing.label") or dig(listing, "pricing.value"),
+            "bedrooms": dig(listing, "counts.numBedrooms"),
+            "bathrooms": dig(listing, "counts.numBathrooms"),
+            "size": (
+                f"{floor_area} {dig(listing, 'floorArea.units', '')}".strip()
+                if floor_area
+                else None
+            ),
+            "house_type": listing.get("propertyType"),
+            "address": listing.get("displayAddress")
+            or dig(listing, "location.address"),
+            "agent": dig(listing, "branch.name"),
+            "description": listing.get("detailedDescription"),
+            "time_on_market": dig(listing, "publicationStatus.publishedAt")
+            or listing.get("publishedOn"),
+            "features": dig(listing, "features.bullets") or [],
+        }
 
+    def extract_from_dom(self, soup):
+        details = {
+            "images": select_image_urls(
+                soup, '[data-testid="gallery"] img, [data-testid="media-carousel"] img'
+            ),
+            "floorplans": select_image_urls(soup, '[data-testid="floorplan"] img'),
+            "price": select_text(soup, '[data-testid="price"]'),
+            "bedrooms": select_text(soup, '[data-testid="beds-label"]'),
+            "bathrooms": select_text(soup, '[data-testid="baths-label"]'),
+            "size": select_text(soup, '[data-testid="floorarea-label"]'),
+            "house_type": None,
+            "address": select_text(soup, '[data-testid="address-label"]'),
+            "agent": select_text(soup, '[data-testid="agent-name"]'),
+            "description": select_text(soup, '[data-testid="listing_description"]'),
+            "time_on_market": select_text(soup, '[data-testid="date-published"]'),
+            "features": select_all_text(soup, '[data-testid="listing_features"] li'),
+        }
 
-# Similar implementation for OnTheMarketScraper
+        for item in load_json_ld(soup):
+            if not isinstance(item, dict):
+                continue
+            if not details["price"]:
+                details["price"] = dig(item, "offers.price")
+            if not details["address"]:
+                details["address"] = dig(item, "address.streetAddress")
+        return details